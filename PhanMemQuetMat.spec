@@ -48,7 +48,12 @@ a = Analysis(
         'unicodedata', 're', 'urllib.parse', 'xlrd',
         # src modules
         'src', 'src.app', 'src.config', 'src.face_detector',
-        'src.face_matcher', 'src.attendance_processor',
+        'src.face_matcher', 'src.face_gallery', 'src.embedding_store', 'src.image_io',
+        'src.warmup', 'src.inference_pool', 'src.name_index', 'src.ann_index',
+        'src.face_prefilter', 'src.candidate_planner', 'src.quantization', 'src.lru_cache', 'src.tiled_detection',
+        'src.artifact_cache', 'src.face_store', 'src.fs_watcher',
+        'src.day_batch_matcher',
+        'src.attendance_processor',
         'src.word_exporter', 'src.pdf_extractor',
         'src.text_extractor', 'src.async_processor',
         'src.database_manager', 'src.excel_extractor',
@@ -74,13 +74,13 @@ if DeepFace:
         print(f"\n   Testing với 5 ảnh camera đầu:")
         for i, camera_img in enumerate(camera_images[:5]):
             try:
-                from src.face_matcher import copy_to_ascii_path
-                p_ascii = copy_to_ascii_path(portrait)
-                c_ascii = copy_to_ascii_path(camera_img)
+                from src.image_io import load_image
+                p_img = load_image(portrait)
+                c_img = load_image(camera_img)
                 
                 result = DeepFace.verify(
-                    img1_path=p_ascii,
-                    img2_path=c_ascii,
+                    img1_path=p_img,
+                    img2_path=c_img,
                     model_name="VGG-Face",
                     enforce_detection=False
                 )
@@ -10,6 +10,7 @@ import time
 import webbrowser
 import threading
 import logging
+import multiprocessing
 import traceback
 
 # Thêm thư mục gốc vào path
@@ -72,13 +73,25 @@ def main():
         
         # Import và chạy Flask app
         log_info("Đang import Flask app...")
-        from src.app import app, scan_database, FLASK_PORT, FLASK_HOST
+        from src.app import (
+            app, scan_database, start_warmup, start_file_watcher, start_artifact_gc, FLASK_PORT, FLASK_HOST
+        )
         log_info("Import Flask app thành công!")
         
         log_info("Đang quét database...")
         scan_database()
         log_info("Quét database xong!")
         
+        # Nạp model + embedding chân dung trong nền, server vẫn nhận request
+        start_warmup()
+        log_info("Đã bắt đầu warm-up model trong nền")
+        
+        # Ảnh thêm/sửa/xóa trong database/ và Ảnh BV/ được áp dụng ngay, không cần quét lại
+        start_file_watcher()
+        
+        # Dọn thumbnail/ảnh cắt mặt cũ trong .artifacts/ (không để cache lớn mãi)
+        start_artifact_gc()
+        
         # Kiểm tra thư mục quan trọng
         important_dirs = {
             'input_images': os.path.join(BASE_DIR, 'input_images'),
@@ -116,4 +129,6 @@ def main():
         input("Nhấn Enter để đóng...")
 
 if __name__ == '__main__':
+    # Bắt buộc cho pool process (spawn) khi chạy từ EXE
+    multiprocessing.freeze_support()
     main()
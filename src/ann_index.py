@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Module index tìm kiếm gần đúng (ANN) cho nhận diện 1:N
+IVF thuần NumPy: k-means chia embedding thành nlist cụm, truy vấn chỉ so với
+các vector trong nprobe cụm gần nhất. nprobe lớn hơn = recall cao hơn, chậm hơn.
+Khi gallery còn nhỏ (chưa đủ min_train_size) index tìm chính xác (flat).
+"""
+
+from typing import Dict, Hashable, List, Optional, Tuple
+import numpy as np
+
+try:
+    from src.config import ANN_NLIST, ANN_NPROBE, ANN_MIN_TRAIN_SIZE
+except ImportError:
+    ANN_NLIST = 0
+    ANN_NPROBE = 8
+    ANN_MIN_TRAIN_SIZE = 512
+
+STATE_VERSION = 1
+
+
+def _sq_distances(queries: np.ndarray, points: np.ndarray, point_sq: np.ndarray) -> np.ndarray:
+    """Bình phương khoảng cách euclid (n_q, n_p) bằng khai triển chuẩn"""
+    q_sq = np.einsum('ij,ij->i', queries, queries)[:, None]
+    return np.maximum(q_sq + point_sq[None, :] - 2.0 * (queries @ points.T), 0.0)
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """K-means đơn giản (Lloyd) - trả về ma trận tâm cụm (k, dim)"""
+    rng = np.random.default_rng(seed)
+    k = max(1, min(k, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmin(
+            _sq_distances(vectors, centroids, np.einsum('ij,ij->i', centroids, centroids)), axis=1
+        )
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():  # Cụm rỗng: lấy lại điểm ngẫu nhiên
+            centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Index IVF thêm/xóa tăng dần.
+
+    Vector nằm trong một ma trận chung; mỗi cụm giữ danh sách dòng của nó.
+    Xóa chỉ đánh dấu (tombstone), dòng được dọn khi train lại.
+    """
+
+    def __init__(
+        self,
+        metric: str = "euclidean",
+        nlist: int = ANN_NLIST,
+        nprobe: int = ANN_NPROBE,
+        min_train_size: int = ANN_MIN_TRAIN_SIZE
+    ):
+        """
+        Args:
+            metric: euclidean (face_recognition) hoặc cosine (vector được chuẩn hóa L2)
+            nlist: Số cụm (0 = tự chọn ~sqrt(n))
+            nprobe: Số cụm được quét mỗi truy vấn (đánh đổi recall/tốc độ)
+            min_train_size: Dưới ngưỡng này tìm chính xác, không chia cụm
+        """
+        self.metric = metric
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._ids: List[Hashable] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._row_of: Dict[Hashable, int] = {}
+        self._size = 0  # Số dòng đã dùng trong _vectors (có thể còn chỗ trống phía sau)
+        self.centroids: Optional[np.ndarray] = None
+        self._members: List[np.ndarray] = []   # Dòng thuộc từng cụm
+        self._appended: List[List[int]] = []   # Dòng thêm sau lần train, gộp khi truy vấn
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def __contains__(self, item_id: Hashable) -> bool:
+        return item_id in self._row_of
+
+    def ids(self) -> List[Hashable]:
+        """Các item_id đang có trong index"""
+        return list(self._row_of)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _prepare(self, vectors) -> np.ndarray:
+        mat = np.asarray(vectors, dtype=np.float32)
+        if mat.ndim == 1:
+            mat = mat[None, :]
+        if self.metric == "cosine":
+            mat = mat / np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+        return np.ascontiguousarray(mat)
+
+    def _grow(self, dim: int):
+        capacity = max(64, 2 * len(self._vectors))
+        vectors = np.zeros((capacity, dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+        self._sq_norms = np.resize(self._sq_norms, capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._alive = alive
+
+    def add(self, item_id: Hashable, vector):
+        """Thêm (hoặc thay) vector cho item_id"""
+        if item_id in self._row_of:
+            self.remove(item_id)
+        vec = self._prepare(vector)[0]
+        if self._vectors.shape[1] != len(vec):
+            if self._size:
+                raise ValueError(f"Sai số chiều vector: {len(vec)} != {self._vectors.shape[1]}")
+            self._vectors = np.zeros((0, len(vec)), dtype=np.float32)
+        if self._size >= len(self._vectors):
+            self._grow(len(vec))
+
+        row = self._size
+        self._size += 1
+        self._vectors[row] = vec
+        self._sq_norms[row] = float(vec @ vec)
+        self._alive[row] = True
+        self._ids.append(item_id)
+        self._row_of[item_id] = row
+
+        if self.is_trained:
+            cluster = self._nearest_clusters(vec[None, :], 1)[0, 0]
+            self._appended[cluster].append(row)
+            if len(self) >= 2 * self._trained_size:
+                self.train()  # Gallery tăng gấp đôi - chia cụm lại
+        elif len(self) >= self.min_train_size:
+            self.train()
+
+    def remove(self, item_id: Hashable) -> bool:
+        """Xóa item_id khỏi index (trả về False nếu không có)"""
+        row = self._row_of.pop(item_id, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        if self._size - len(self) > max(64, len(self)):
+            self.train()  # Quá nửa số dòng là tombstone - dọn và chia cụm lại
+        return True
+
+    def _compact(self):
+        """Dồn các dòng còn sống lên đầu (bỏ tombstone)"""
+        rows = np.flatnonzero(self._alive[:self._size])
+        self._vectors = np.ascontiguousarray(self._vectors[rows])
+        self._sq_norms = self._sq_norms[rows].copy()
+        self._ids = [self._ids[r] for r in rows]
+        self._alive = np.ones(len(rows), dtype=bool)
+        self._size = len(rows)
+        self._row_of = {item_id: i for i, item_id in enumerate(self._ids)}
+
+    def train(self):
+        """Chia cụm lại toàn bộ vector (gọi tự động khi gallery lớn lên)"""
+        self._compact()
+        if len(self) < self.min_train_size:
+            self.centroids = None
+            self._members = []
+            self._appended = []
+            self._trained_size = 0
+            return
+        vectors = self._vectors[:self._size]
+        nlist = self.nlist or int(np.sqrt(len(vectors)))
+        self.centroids = kmeans(vectors, nlist)
+        assign = self._nearest_clusters(vectors, 1)[:, 0]
+        order = np.argsort(assign, kind='stable')
+        bounds = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+        self._members = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
+        self._appended = [[] for _ in range(len(self.centroids))]
+        self._trained_size = len(vectors)
+
+    def _cluster_rows(self, cluster: int) -> np.ndarray:
+        if self._appended[cluster]:
+            self._members[cluster] = np.concatenate(
+                [self._members[cluster], np.asarray(self._appended[cluster], dtype=np.int64)]
+            )
+            self._appended[cluster] = []
+        return self._members[cluster]
+
+    def _nearest_clusters(self, queries: np.ndarray, count: int) -> np.ndarray:
+        dists = _sq_distances(
+            queries, self.centroids, np.einsum('ij,ij->i', self.centroids, self.centroids)
+        )
+        count = min(count, len(self.centroids))
+        if count == len(self.centroids):
+            return np.argsort(dists, axis=1)
+        nearest = np.argpartition(dists, count - 1, axis=1)[:, :count]
+        return nearest
+
+    def search(self, query, k: int = 1, nprobe: Optional[int] = None) -> List[Tuple[Hashable, float]]:
+        """
+        Tìm k item gần query nhất
+
+        Returns:
+            [(item_id, distance)] tăng dần theo khoảng cách
+            (euclid; với cosine là khoảng cách cosine 1 - sim)
+        """
+        if not len(self):
+            return []
+        q = self._prepare(query)
+        if self.is_trained:
+            probes = self._nearest_clusters(q, nprobe or self.nprobe)[0]
+            rows = np.concatenate([self._cluster_rows(c) for c in probes])
+            rows = rows[self._alive[rows]]
+        else:
+            rows = np.flatnonzero(self._alive[:self._size])
+        if not len(rows):
+            return []
+
+        sq = _sq_distances(q, self._vectors[rows], self._sq_norms[rows])[0]
+        k = min(k, len(rows))
+        top = np.argpartition(sq, k - 1)[:k]
+        top = top[np.argsort(sq[top])]
+        if self.metric == "cosine":
+            dists = sq[top] / 2.0  # |a-b|^2 = 2(1 - cos) với vector chuẩn hóa
+        else:
+            dists = np.sqrt(sq[top])
+        return [(self._ids[rows[i]], float(d)) for i, d in zip(top, dists)]
+
+    # ------------------------------------------------------------------
+    # Lưu / nạp trong SQLite (FaceStore)
+    # ------------------------------------------------------------------
+
+    def to_state(self) -> Dict:
+        """Dạng dict picklable (chỉ các dòng còn sống)"""
+        self._compact_if_needed()
+        return {
+            'version': STATE_VERSION,
+            'metric': self.metric,
+            'nlist': self.nlist,
+            'nprobe': self.nprobe,
+            'min_train_size': self.min_train_size,
+            'ids': list(self._ids),
+            'vectors': self._vectors[:self._size].copy(),
+            'centroids': self.centroids,
+            'members': [self._cluster_rows(c) for c in range(len(self._members))],
+            'trained_size': self._trained_size,
+        }
+
+    def _compact_if_needed(self):
+        if self._size and not self._alive[:self._size].all():
+            self.train()
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'IVFIndex':
+        if state.get('version') != STATE_VERSION:
+            raise ValueError("Phiên bản index không khớp")
+        index = cls(state['metric'], state['nlist'], state['nprobe'], state['min_train_size'])
+        vectors = np.asarray(state['vectors'], dtype=np.float32)
+        index._vectors = np.ascontiguousarray(vectors)
+        index._sq_norms = np.einsum('ij,ij->i', vectors, vectors) if len(vectors) else np.zeros(0, np.float32)
+        index._ids = list(state['ids'])
+        index._alive = np.ones(len(vectors), dtype=bool)
+        index._size = len(vectors)
+        index._row_of = {item_id: i for i, item_id in enumerate(index._ids)}
+        index.centroids = state['centroids']
+        index._members = [np.asarray(m, dtype=np.int64) for m in state['members']]
+        index._appended = [[] for _ in index._members]
+        index._trained_size = state['trained_size']
+        return index
@@ -106,6 +106,12 @@ MAX_WORKERS = 4
 CHAMCONG_DIR = os.path.join(BASE_DIR, "chamcong")
 PORTRAIT_DIR = resolve_portrait_dir(BASE_DIR)
 NGAY_RONG_DIR = os.path.join(BASE_DIR, "ngay_rong")
+# Kho embedding khuon mat tren dia (giu ket qua DeepFace giua cac lan chay)
+EMBEDDING_STORE_DIR = os.path.join(BASE_DIR, ".embedding_store")
+# Cache thumbnail + anh cat mat da match (bao cao Word va giao dien web dung lai)
+ARTIFACT_STORE_DIR = os.path.join(BASE_DIR, ".artifacts")
+# Tu dong cap nhat khi anh trong database/ hoac thu muc chan dung thay doi (khong can quet lai)
+WATCH_FILES = True
 
 # Tao thu muc neu chua ton tai
 for directory in [INPUT_IMAGES_DIR, DATABASE_DIR, RESULTS_DIR, CHAMCONG_DIR, PORTRAIT_DIR, NGAY_RONG_DIR]:
@@ -811,16 +817,26 @@ def get_portrait_stats():
 
 # Face matcher instance (lazy loaded)
 _face_matcher = None
+_face_matcher_lock = threading.Lock()  # Warm-up nền và request có thể gọi cùng lúc
 
 def get_face_matcher():
     """Get or create face matcher instance"""
+    with _face_matcher_lock:
+        return _get_face_matcher_locked()
+
+def _get_face_matcher_locked():
     global _face_matcher
     try:
         from src.face_matcher import FaceMatcher
+        from src.inference_pool import get_inference_pool
+        from src.face_prefilter import get_face_prefilter
         if _face_matcher is None:
             send_log("⏳ Dang khoi tao Face Matcher (DeepFace)...", "info")
             portrait_dir = resolve_portrait_dir(BASE_DIR)
-            _face_matcher = FaceMatcher(portrait_dir, log_callback=send_log)
+            _face_matcher = FaceMatcher(portrait_dir, log_callback=send_log,
+                                        store_dir=EMBEDDING_STORE_DIR,
+                                        inference_pool=get_inference_pool(),
+                                        prefilter=get_face_prefilter())
             send_log(
                 f"✅ Face Matcher san sang. PortraitDir={portrait_dir} "
                 f"(n={len(_face_matcher.portrait_cache)}, imgs={_count_images_in_dir(portrait_dir)})",
@@ -834,7 +850,12 @@ def get_face_matcher():
                     f"🔁 Cache rong, thu lai PortraitDir={alt_dir} (imgs={_count_images_in_dir(alt_dir)})",
                     "warning"
                 )
-                _face_matcher = FaceMatcher(alt_dir, log_callback=send_log)
+                _face_matcher.flush_store()
+                _face_matcher = FaceMatcher(alt_dir, log_callback=send_log,
+                                            store_dir=EMBEDDING_STORE_DIR,
+                                            inference_pool=get_inference_pool(),
+                                            prefilter=get_face_prefilter())
+                watch_portrait_dir(alt_dir)
                 send_log(
                     f"✅ Face Matcher san sang. PortraitDir={alt_dir} "
                     f"(n={len(_face_matcher.portrait_cache)})",
@@ -847,11 +868,84 @@ def get_face_matcher():
         return None
     return _face_matcher
 
+def start_warmup():
+    """Khởi động warm-up model + embedding chân dung trong thread nền"""
+    from src.warmup import get_warmup_manager
+    return get_warmup_manager().start(get_face_matcher, log_callback=send_log)
+
+@app.route('/api/warmup/status')
+def warmup_status():
+    """Tiến độ warm-up model (UI hỏi định kỳ đến khi sẵn sàng)"""
+    from src.warmup import get_warmup_manager
+    return jsonify({'success': True, **get_warmup_manager().get_status()})
+
+def get_artifacts():
+    """Cache thumbnail/ảnh cắt mặt dùng chung (thư mục theo BASE_DIR - đúng cả khi chạy từ EXE)"""
+    from src.artifact_cache import get_artifact_cache
+    return get_artifact_cache(ARTIFACT_STORE_DIR)
+
+def _on_database_change(paths):
+    """Ảnh trong database/ đổi: cập nhật danh sách người, rồi đồng bộ encoding đúng những người bị ảnh hưởng"""
+    scan_database()  # Danh sách người cho giao diện (chỉ đọc thư mục) - luôn chạy trước
+    from src.face_detector import FACE_RECOGNITION_AVAILABLE
+    if not FACE_RECOGNITION_AVAILABLE:
+        return  # Không có face_recognition/dlib: không encode được, giữ nguyên database encoding
+    from src.database_manager import get_database_manager
+    get_database_manager().apply_changes(paths)
+
+def _on_portrait_change(paths):
+    """Ảnh chân dung đổi: cập nhật Face Matcher đang chạy (chưa khởi tạo thì lần tạo sau tự quét)"""
+    matcher = _face_matcher
+    if matcher is not None:
+        matcher.refresh_portraits(paths)
+
+def watch_portrait_dir(portrait_dir):
+    if WATCH_FILES:
+        from src.fs_watcher import get_directory_watcher
+        get_directory_watcher().watch(portrait_dir, _on_portrait_change)
+
+def start_file_watcher():
+    """Theo dõi database/ và thư mục chân dung trong thread nền"""
+    if not WATCH_FILES:
+        return None
+    from src.fs_watcher import get_directory_watcher
+    watcher = get_directory_watcher()
+    watcher.watch(DATABASE_DIR, _on_database_change)
+    watcher.watch(PORTRAIT_DIR, _on_portrait_change)
+    return watcher.start()
+
+def start_artifact_gc():
+    """Dọn artifact cũ (ảnh gốc đã đổi/xóa, lâu không dùng) trong thread nền"""
+    from src.artifact_cache import start_gc
+    return start_gc(ARTIFACT_STORE_DIR)
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Thống kê cache RAM (hit/miss/eviction/byte) của Face Matcher và bộ lập kế hoạch ảnh"""
+    from src.candidate_planner import get_candidate_planner
+    stats = {'planner_times': get_candidate_planner().cache_stats()}
+    stats['artifacts'] = get_artifacts().stats()
+    if _face_matcher is not None:  # Không khởi tạo matcher chỉ để lấy thống kê
+        stats.update(_face_matcher.cache_stats())
+    return jsonify({'success': True, 'stats': stats})
+
+@app.route('/api/warmup/start', methods=['POST'])
+def warmup_start():
+    """Chạy lại warm-up (vd sau khi lần trước lỗi)"""
+    started = start_warmup()
+    return jsonify({'success': True, 'started': started})
+
 @app.route('/api/analyze-full', methods=['POST'])
 def analyze_full():
     """PhÃ¢n tÃ­ch tá»•ng há»£p: tÃ¬m ngÃ y thiáº¿u + match áº£nh camera báº±ng nháº­n diá»‡n khuÃ´n máº·t"""
     try:
         from src.attendance_processor import AttendanceProcessor
+        from src.day_batch_matcher import DayBatchMatcher
+        from src.candidate_planner import expected_times_for
+        from src.lru_cache import format_stats
+        
+        data = request.json or {}
+        exclusive = bool(data.get('exclusive_assignment', False))
         
         # Step 1: PhÃ¢n tÃ­ch cháº¥m cÃ´ng
         send_log("ðŸ“‚ Step 1: Äang phÃ¢n tÃ­ch file cháº¥m cÃ´ng...", "info")
@@ -865,6 +959,7 @@ def analyze_full():
         send_log("ðŸ”§ Step 2: Äang khá»Ÿi táº¡o Face Matcher...", "info")
         matcher = get_face_matcher()
         if matcher:
+            matcher.reset_stage_stats()
             send_log("âœ… Face Matcher Ä‘Ã£ sáºµn sÃ ng", "success")
         else:
             send_log("âš ï¸ Face Matcher khÃ´ng kháº£ dá»¥ng, sáº½ dÃ¹ng fallback", "warning")
@@ -872,6 +967,12 @@ def analyze_full():
         # Step 3: Match áº£nh camera cho má»—i báº£n ghi thiáº¿u
         send_log(f"ðŸ” Step 3: Báº¯t Ä‘áº§u matching áº£nh cho {len(missing_records)} báº£n ghi...", "info")
         matched_count = 0
+        engine = None
+        if matcher:
+            engine = DayBatchMatcher(matcher, exclusive=exclusive, log_callback=send_log,
+                                     early_stop_ratio=0.7)
+        batched = []  # [(index, record, day_folder)] chờ match theo lô
+        day_images = {}  # {day_folder: [images]} - mỗi thư mục chỉ duyệt một lần
         
         for i, record in enumerate(missing_records):
             date_str = record['date']  # format: dd/mm/yyyy
@@ -884,21 +985,15 @@ def analyze_full():
             record['matched_image'] = None
             
             if os.path.exists(day_folder):
-                images = get_image_files(day_folder)
+                if day_folder not in day_images:
+                    day_images[day_folder] = get_image_files(day_folder)
+                images = day_images[day_folder]
                 send_log(f"  [{i+1}/{len(missing_records)}] {person_name} (ngÃ y {day}): TÃ¬m tháº¥y {len(images)} áº£nh trong thÆ° má»¥c", "default")
                 
                 if images and matcher:
-                    # DÃ¹ng face recognition Ä‘á»ƒ tÃ¬m áº£nh match
-                    try:
-                        matched_image = matcher.match_face_in_images(person_name, images)
-                        if matched_image:
-                            record['matched_image'] = matched_image
-                            matched_count += 1
-                            send_log(f"  [{i+1}/{len(missing_records)}] âœ“ {person_name} -> {os.path.basename(matched_image)}", "success")
-                        else:
-                            send_log(f"  [{i+1}/{len(missing_records)}] âŒ {person_name}: KhÃ´ng tÃ¬m tháº¥y áº£nh match", "warning")
-                    except Exception as match_err:
-                        send_log(f"  [{i+1}/{len(missing_records)}] âŒ {person_name}: Lá»—i matcher ({match_err})", "error")
+                    # Gom theo ngày - ảnh của ngày chỉ embed một lần cho mọi người
+                    engine.add_query(day_folder, images, person_name, expected_times_for(record))
+                    batched.append((i, record, day_folder))
                 elif images:
                     send_log(f"  [{i+1}/{len(missing_records)}] âš ï¸ {person_name}: FaceMatcher chÆ°a sáºµn sÃ ng, bá» qua", "warning")
                 else:
@@ -907,7 +1002,38 @@ def analyze_full():
                 send_log(f"  [{i+1}/{len(missing_records)}] âŒ KhÃ´ng tÃ¬m tháº¥y thÆ° má»¥c: {day_folder}", "error")
                 record['matched_image'] = None
         
+        # Match theo lô: mỗi ngày một ma trận khoảng cách cho tất cả người thiếu
+        batch_results = {}
+        if batched:
+            try:
+                batch_results = engine.run()
+            except Exception as match_err:
+                send_log(f"  ❌ Lỗi matcher ({match_err})", "error")
+        for i, record, day_folder in batched:
+            person_name = record['person_name']
+            match = batch_results.get((day_folder, person_name))
+            if match:
+                matched_image = match[0]
+                record['matched_image'] = matched_image
+                # Thumbnail + ảnh cắt mặt ghi ngay lúc match - giao diện/báo cáo không đọc lại ảnh gốc
+                artifacts = get_artifacts().materialize(
+                    matched_image, matcher.matched_face_box(person_name, matched_image)
+                )
+                record['matched_face'] = (
+                    os.path.relpath(artifacts['face_crop'], ARTIFACT_STORE_DIR)
+                    if artifacts['face_crop'] else None
+                )
+                matched_count += 1
+                send_log(f"  [{i+1}/{len(missing_records)}] âœ“ {person_name} -> {os.path.basename(matched_image)}", "success")
+            else:
+                send_log(f"  [{i+1}/{len(missing_records)}] âŒ {person_name}: KhÃ´ng tÃ¬m tháº¥y áº£nh match", "warning")
+        
         summary['total_matched'] = matched_count
+        if matcher:
+            matcher.flush_store()
+            summary['pipeline_stats'] = dict(matcher.stage_stats)
+            send_log(f"📊 Theo tầng: {matcher.format_stage_stats()}", "info")
+            send_log(f"💾 Cache embedding: {format_stats(matcher.cache_stats()['embeddings'])}", "info")
         send_log(f"ðŸŽ‰ HoÃ n thÃ nh! Matched {matched_count}/{len(missing_records)} báº£n ghi", "success")
         
         return jsonify({
@@ -927,20 +1053,26 @@ def serve_matched_image(filepath):
     import urllib.parse
     filepath = urllib.parse.unquote(filepath)
     
+    # Mặc định trả thumbnail từ cache artifact (?full=1 để lấy ảnh gốc)
+    def serve(path):
+        if request.args.get('full') != '1':
+            path = get_artifacts().display_image(path)
+        return send_file(path)
+    
     # Thá»­ vá»›i Ä‘Æ°á»ng dáº«n nguyÃªn gá»‘c
     if os.path.exists(filepath):
-        return send_file(filepath)
+        return serve(filepath)
     
     # Thá»­ vá»›i Ä‘Æ°á»ng dáº«n tuyá»‡t Ä‘á»‘i tá»« BASE_DIR
     abs_path = os.path.join(BASE_DIR, filepath)
     if os.path.exists(abs_path):
-        return send_file(abs_path)
+        return serve(abs_path)
     
     # Thá»­ thay tháº¿ backslash/forward slash
     filepath_fixed = filepath.replace('/', os.sep).replace('\\', os.sep)
     abs_path_fixed = os.path.join(BASE_DIR, filepath_fixed)
     if os.path.exists(abs_path_fixed):
-        return send_file(abs_path_fixed)
+        return serve(abs_path_fixed)
     
     print(f"[serve_matched_image] File khÃ´ng tá»“n táº¡i:")
     print(f"  filepath: {filepath}")
@@ -950,6 +1082,14 @@ def serve_matched_image(filepath):
     
     return jsonify({'error': 'File khÃ´ng tá»“n táº¡i', 'filepath': filepath}), 404
 
+@app.route('/artifact/<path:relpath>')
+def serve_artifact(relpath):
+    """Serve thumbnail/ảnh cắt mặt trong cache artifact"""
+    path = get_artifacts().resolve(relpath)
+    if path is None:
+        return jsonify({'error': 'Không tìm thấy artifact', 'path': relpath}), 404
+    return send_file(path)
+
 @app.route('/api/export-word', methods=['POST'])
 def export_word():
     """Xuáº¥t file Word vá»›i áº£nh camera Ä‘Ã£ match"""
@@ -997,7 +1137,10 @@ def export_word():
             if matched_image and os.path.exists(matched_image):
                 try:
                     run = row.cells[3].paragraphs[0].add_run()
-                    run.add_picture(matched_image, width=Cm(3))
+                    # Thumbnail trong cache artifact thay cho ảnh camera gốc nhiều MB
+                    run.add_picture(
+                        get_artifacts().display_image(matched_image), width=Cm(3)
+                    )
                 except Exception:
                     row.cells[3].text = '[Lá»—i áº£nh]'
             else:
@@ -1458,11 +1601,13 @@ def excel_face_analyze():
                 send_log(f"🔍 Bắt đầu phân tích khuôn mặt cho thư mục: {folder}", "info")
                 matcher = get_face_matcher()
                 if matcher:
+                    matcher.reset_stage_stats()
                     send_log("✅ Face Matcher đã sẵn sàng", "success")
                 else:
                     send_log("⚠️ Face Matcher không khả dụng, sẽ bỏ qua tìm ảnh camera", "warning")
 
                 from src.excel_face_analyzer import ExcelFaceAnalyzer
+                from src.lru_cache import format_stats
                 analyzer = ExcelFaceAnalyzer(
                     PORTRAIT_DIR,
                     INPUT_IMAGES_DIR,
@@ -1476,6 +1621,10 @@ def excel_face_analyze():
                     send_log(msg, t)
 
                 files = analyzer.analyze_folder(input_dir, output_dir, log_callback=_log)
+                if matcher:
+                    matcher.flush_store()
+                    send_log(f"📊 Theo tầng: {matcher.format_stage_stats()}", "info")
+                    send_log(f"💾 Cache embedding: {format_stats(matcher.cache_stats()['embeddings'])}", "info")
                 task.total = len(files)
                 for i, f in enumerate(files, 1):
                     task.current = os.path.basename(f)
@@ -1597,6 +1746,9 @@ if __name__ == '__main__':
     
     print("Äang quÃ©t database...")
     scan_database()
+    start_warmup()
+    start_artifact_gc()
+    start_file_watcher()
     print(f"ÄÃ£ load {len(database)} ngÆ°á»i trong database\n")
     
     app.run(host=FLASK_HOST, port=FLASK_PORT, debug=FLASK_DEBUG, threaded=True)
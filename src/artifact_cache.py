@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+Module cache ảnh phái sinh (thumbnail hiển thị + ảnh cắt khuôn mặt đã match)
+Ảnh được ghi một lần khi match, đặt tên theo hash nội dung ảnh gốc - báo cáo
+Word và giao diện web dùng lại thay vì đọc ảnh camera gốc nhiều MB mỗi lần.
+Mục cũ (ảnh gốc đã đổi/xóa, lâu không dùng, vượt dung lượng) được dọn bằng gc().
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Dict, Optional, Sequence
+
+try:
+    import cv2
+    import numpy as np
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+    cv2 = None
+    np = None
+
+from src.embedding_store import content_hash
+from src.image_io import FaceImage, load_image_reduced
+
+try:
+    from src.config import ARTIFACT_DIR, THUMBNAIL_MAX_SIDE, ARTIFACT_MAX_AGE_DAYS, ARTIFACT_MAX_MB
+except ImportError:
+    ARTIFACT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".artifacts")
+    THUMBNAIL_MAX_SIDE = 640
+    ARTIFACT_MAX_AGE_DAYS = 60
+    ARTIFACT_MAX_MB = 512
+
+INDEX_FILE = 'index.json'
+JPEG_QUALITY = 85
+CROP_PADDING = 0.3  # Lề quanh khuôn mặt (tỉ lệ theo cạnh bbox)
+
+
+def _write_jpeg(path: str, image) -> bool:
+    """Ghi JPEG (an toàn với đường dẫn Unicode, ghi file tạm rồi đổi tên)"""
+    ok, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    buf.tofile(tmp)
+    os.replace(tmp, path)
+    return True
+
+
+def _fit(image, max_side: int):
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return image
+    return cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                      interpolation=cv2.INTER_AREA)
+
+
+class ArtifactCache:
+    """
+    Thư mục artifact: <hash[:2]>/<hash>_<loại>.jpg + index.json
+    ({đường dẫn ảnh gốc: [mtime, size, hash]} - tra hash mà không phải đọc lại ảnh gốc)
+    """
+
+    def __init__(
+        self,
+        root: str = ARTIFACT_DIR,
+        thumb_side: int = THUMBNAIL_MAX_SIDE,
+        max_age_days: float = ARTIFACT_MAX_AGE_DAYS,
+        max_mb: int = ARTIFACT_MAX_MB
+    ):
+        """
+        Args:
+            root: Thư mục cache
+            thumb_side: Cạnh dài tối đa của thumbnail (pixel)
+            max_age_days: gc() xóa artifact không được dùng quá N ngày
+            max_mb: gc() xóa artifact cũ nhất cho tới khi tổng dung lượng <= N MB
+        """
+        self.root = root
+        self.thumb_side = thumb_side
+        self.max_age_days = max_age_days
+        self.max_mb = max_mb
+        self._lock = threading.Lock()
+        self._index = None
+        self._dirty = False
+
+    # ------------------------------------------------------------------
+    # Index ảnh gốc -> hash nội dung
+    # ------------------------------------------------------------------
+
+    def _load_index(self) -> Dict:
+        if self._index is None:
+            self._index = {}
+            try:
+                with open(os.path.join(self.root, INDEX_FILE), 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                pass
+        return self._index
+
+    def _save_index(self):
+        if not self._dirty:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, INDEX_FILE)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._dirty = False
+
+    def _source_key(self, source: str) -> Optional[str]:
+        """Hash nội dung ảnh gốc (chỉ đọc file khi ảnh mới hoặc đã đổi)"""
+        try:
+            st = os.stat(source)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._load_index().get(os.path.abspath(source))
+        if entry and entry[0] == st.st_mtime and entry[1] == st.st_size:
+            return entry[2]
+        key = content_hash(source).hex()
+        with self._lock:
+            self._load_index()[os.path.abspath(source)] = [st.st_mtime, st.st_size, key]
+            self._dirty = True
+        return key
+
+    def _artifact_path(self, key: str, kind: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}_{kind}.jpg")
+
+    def _existing(self, path: str) -> Optional[str]:
+        if os.path.exists(path):
+            try:
+                os.utime(path)  # Đánh dấu vừa dùng cho gc()
+            except OSError:
+                pass
+            return path
+        return None
+
+    # ------------------------------------------------------------------
+    # Tạo / tra artifact
+    # ------------------------------------------------------------------
+
+    def thumbnail(self, source: str, create: bool = True,
+                  image: Optional[FaceImage] = None) -> Optional[str]:
+        """
+        Đường dẫn thumbnail của ảnh gốc (tạo nếu chưa có); None nếu không tạo được
+
+        Args:
+            image: FaceImage đã decode của ảnh gốc (nếu có) để không decode lại
+        """
+        if not CV2_AVAILABLE:
+            return None
+        key = self._source_key(source)
+        if key is None:
+            return None
+        path = self._artifact_path(key, 'thumb')
+        existing = self._existing(path)
+        if existing or not create:
+            return existing
+        try:
+            if image is not None:
+                pixels = image.bgr
+            else:
+                # Decode thu nhỏ ngay trong libjpeg rồi resize về đúng cạnh thumbnail
+                pixels, _ = load_image_reduced(source, self.thumb_side)
+            if pixels is None or not _write_jpeg(path, _fit(pixels, self.thumb_side)):
+                return None
+        except Exception as e:
+            print(f"Lỗi tạo thumbnail {os.path.basename(source)}: {e}")
+            return None
+        return path
+
+    def face_crop(self, source: str, box: Optional[Sequence[float]], create: bool = True,
+                  image: Optional[FaceImage] = None) -> Optional[str]:
+        """
+        Ảnh cắt khuôn mặt (box = x, y, w, h theo tọa độ ảnh gốc) kèm lề CROP_PADDING
+
+        Args:
+            image: FaceImage đã decode của ảnh gốc (nếu có) để không decode lại
+        """
+        if not CV2_AVAILABLE or box is None:
+            return None
+        key = self._source_key(source)
+        if key is None:
+            return None
+        x, y, w, h = (int(round(v)) for v in box)
+        path = self._artifact_path(key, f"face_{x}_{y}_{w}_{h}")
+        existing = self._existing(path)
+        if existing or not create:
+            return existing
+        try:
+            pad = int(max(w, h) * CROP_PADDING)
+            crop = (image or FaceImage(source)).crop((y, x + w, y + h, x), pad)
+            if crop is None or not crop.size or not _write_jpeg(path, _fit(crop, self.thumb_side)):
+                return None
+        except Exception as e:
+            print(f"Lỗi cắt khuôn mặt {os.path.basename(source)}: {e}")
+            return None
+        return path
+
+    def materialize(self, source: str, box: Optional[Sequence[float]] = None) -> Dict[str, Optional[str]]:
+        """Tạo thumbnail + ảnh cắt mặt cho một ảnh đã match (gọi lúc match)"""
+        # Có bbox thì decode đầy đủ một lần cho cả thumbnail lẫn ảnh cắt
+        image = FaceImage(source) if box is not None else None
+        result = {
+            'thumbnail': self.thumbnail(source, image=image),
+            'face_crop': self.face_crop(source, box, image=image),
+        }
+        self.flush()
+        return result
+
+    def display_image(self, source: str) -> str:
+        """Ảnh dùng để hiển thị/chèn báo cáo: thumbnail nếu có, ngược lại ảnh gốc"""
+        thumb = self.thumbnail(source)
+        self.flush()
+        return thumb or source
+
+    def flush(self):
+        """Ghi index xuống đĩa nếu có thay đổi"""
+        with self._lock:
+            try:
+                self._save_index()
+            except OSError as e:
+                print(f"Lỗi lưu index artifact: {e}")
+
+    def resolve(self, relpath: str) -> Optional[str]:
+        """Đường dẫn tuyệt đối của artifact theo đường dẫn tương đối (chặn thoát khỏi thư mục cache)"""
+        root = os.path.abspath(self.root)
+        path = os.path.abspath(os.path.join(root, relpath))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def stats(self) -> Dict:
+        """Số ảnh gốc đã có artifact (cho /api/cache/stats)"""
+        with self._lock:
+            return {'root': self.root, 'sources': len(self._load_index())}
+
+    # ------------------------------------------------------------------
+    # Dọn dẹp
+    # ------------------------------------------------------------------
+
+    def gc(self, max_age_days: Optional[float] = None, max_mb: Optional[float] = None) -> Dict:
+        """
+        Xóa artifact cũ: ảnh gốc đã đổi/xóa, lâu không dùng, hoặc vượt dung lượng
+
+        Returns:
+            {'removed': số file xóa, 'kept': số file còn, 'bytes': tổng dung lượng còn lại}
+        """
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+        max_mb = self.max_mb if max_mb is None else max_mb
+        with self._lock:
+            index = self._load_index()
+            # Ảnh gốc không còn hoặc đã đổi nội dung -> bỏ khỏi index
+            for source, (mtime, size, _) in list(index.items()):
+                try:
+                    st = os.stat(source)
+                    if st.st_mtime == mtime and st.st_size == size:
+                        continue
+                except OSError:
+                    pass
+                del index[source]
+                self._dirty = True
+            live = {entry[2] for entry in index.values()}
+        self.flush()
+
+        files = []
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith('.jpg'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path, name.split('_', 1)[0]))
+
+        cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+        kept, removed = [], 0
+        for mtime, size, path, key in files:
+            if key not in live or (cutoff is not None and mtime < cutoff):
+                removed += self._remove(path)
+            else:
+                kept.append((mtime, size, path))
+
+        # Vượt dung lượng: xóa file dùng lâu nhất trước
+        total = sum(size for _, size, _ in kept)
+        if max_mb:
+            kept.sort()
+            while kept and total > max_mb * 1024 * 1024:
+                _, size, path = kept.pop(0)
+                removed += self._remove(path)
+                total -= size
+        return {'removed': removed, 'kept': len(kept), 'bytes': total}
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+
+# Một instance dùng chung cho mỗi thư mục cache
+_artifact_caches: Dict[str, ArtifactCache] = {}
+_artifact_cache_lock = threading.Lock()
+
+def get_artifact_cache(root: Optional[str] = None) -> ArtifactCache:
+    """
+    Cache dùng chung của thư mục root (None = ARTIFACT_DIR trong config - cạnh file exe khi
+    chạy từ EXE, trùng ARTIFACT_STORE_DIR của app). Thứ tự gọi không làm đổi thư mục.
+    """
+    root = os.path.abspath(root or ARTIFACT_DIR)
+    key = os.path.normcase(root)
+    with _artifact_cache_lock:
+        cache = _artifact_caches.get(key)
+        if cache is None:
+            cache = _artifact_caches[key] = ArtifactCache(root)
+        return cache
+
+
+def start_gc(root: Optional[str] = None) -> threading.Thread:
+    """Dọn artifact cũ trong thread nền (gọi khi server khởi động)"""
+    def run():
+        try:
+            result = get_artifact_cache(root).gc()
+            print(f"Dọn cache ảnh: xóa {result['removed']}, còn {result['kept']} file "
+                  f"({result['bytes'] / 1e6:.1f} MB)")
+        except Exception as e:
+            print(f"Lỗi dọn cache ảnh: {e}")
+
+    thread = threading.Thread(target=run, name='artifact-gc', daemon=True)
+    thread.start()
+    return thread
@@ -11,9 +11,11 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 from src.config import MAX_WORKERS, SUPPORTED_IMAGE_EXTENSIONS, RESULTS_DIR
-from src.face_detector import get_face_encoding, find_best_match, get_all_face_encodings
+from src.face_detector import get_face_encoding, get_all_face_encodings
 from src.text_extractor import extract_datetime_and_location, extract_datetime_simple
 from src.database_manager import get_database_manager
+from src.image_io import FaceImage
+from src.inference_pool import get_inference_pool
 
 
 class ProcessingTask:
@@ -54,6 +56,7 @@ class AsyncProcessor:
         self.tasks = {}  # {task_id: ProcessingTask}
         self.executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
         self.db_manager = get_database_manager()
+        self.inference_pool = get_inference_pool()  # None = encode ngay trong thread
     
     def _get_image_files(self, folder_path):
         """Lấy danh sách file ảnh trong thư mục"""
@@ -89,28 +92,33 @@ class AsyncProcessor:
         
         try:
             # 1. Trích xuất ngày tháng và địa điểm
-            text_data = extract_datetime_simple(image_path)
+            # Đọc + decode ảnh một lần cho cả OCR lẫn nhận diện
+            image = FaceImage(image_path)
+            text_data = extract_datetime_simple(image)
             result['datetime'] = text_data.get('datetime')
             result['location'] = text_data.get('location')
             
             # 2. Phát hiện và nhận diện khuôn mặt
-            faces_data = get_all_face_encodings(image_path)
+            if self.inference_pool is not None:
+                faces_data = self.inference_pool.face_encodings(image_path)
+            else:
+                faces_data = get_all_face_encodings(image)
             
             if faces_data:
-                result['faces'] = [{'location': loc} for loc, enc in faces_data]
+                # Nhận diện từng khuôn mặt (ảnh cổng thường có nhiều người)
+                best = None
+                matches = self.db_manager.find_best_match([encoding for _, encoding in faces_data])
+                for (loc, _), match in zip(faces_data, matches):
+                    result['faces'].append({'location': loc, 'match': match})
+                    if match and (best is None or match['distance'] < best['distance']):
+                        best = match
                 
-                # Tìm người phù hợp nhất cho khuôn mặt đầu tiên (lớn nhất)
-                if faces_data:
-                    _, first_encoding = faces_data[0]
-                    known_faces = self.db_manager.get_all_faces()
-                    
-                    match = find_best_match(first_encoding, known_faces)
-                    
-                    if match:
-                        result['matched_person'] = match['person_id']
-                        result['branch'] = match['branch']
-                        result['person_name'] = match['name']
-                        result['confidence'] = match['confidence']
+                # Các cột tổng hợp giữ người khớp nhất trong ảnh
+                if best:
+                    result['matched_person'] = best['person_id']
+                    result['branch'] = best['branch']
+                    result['person_name'] = best['name']
+                    result['confidence'] = best['confidence']
             
         except Exception as e:
             result['error'] = str(e)
@@ -204,6 +212,11 @@ class AsyncProcessor:
             # Chuẩn bị data
             rows = []
             for i, result in enumerate(task.results, 1):
+                names = []
+                for face in result['faces']:
+                    match = face.get('match')
+                    if match and match['name'] not in names:
+                        names.append(match['name'])
                 rows.append({
                     'STT': i,
                     'Tên File': result['filename'],
@@ -213,6 +226,7 @@ class AsyncProcessor:
                     'Tên Người': result['person_name'] or 'Không xác định',
                     'Độ Tin Cậy (%)': result['confidence'] or 0,
                     'Số Khuôn Mặt': len(result['faces']),
+                    'Người Trong Ảnh': ', '.join(names),
                     'Lỗi': result['error'] or ''
                 })
             
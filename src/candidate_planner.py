@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Module lập kế hoạch ảnh camera cần so sánh
+Đọc giờ chụp của từng ảnh (tên file, EXIF, tùy chọn OCR watermark), chỉ giữ
+các ảnh nằm trong khung giờ quanh giờ vào/ra ca dự kiến và sắp theo độ gần
+giờ dự kiến - match thường dừng sớm sau vài ảnh thay vì quét cả thư mục ngày.
+"""
+
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+    Image = None
+
+from src.lru_cache import striped_lru
+
+try:
+    from src.config import (
+        SHIFT_CHECK_IN, SHIFT_CHECK_OUT, CANDIDATE_WINDOW_MINUTES, CANDIDATE_USE_OCR
+    )
+except ImportError:
+    SHIFT_CHECK_IN = "07:30"
+    SHIFT_CHECK_OUT = "17:00"
+    CANDIDATE_WINDOW_MINUTES = 0
+    CANDIDATE_USE_OCR = False
+
+DAY_SECONDS = 24 * 3600
+TIME_CACHE_BYTES = 16 * 1024 * 1024
+
+# 20251224_084336, 2025-12-24 08.43.36, IMG_20251224084336...
+_DATETIME_RE = re.compile(
+    r'(?<!\d)(20\d{2})[-_.]?(\d{2})[-_.]?(\d{2})[ T_-]?(\d{2})[-_.:h]?(\d{2})[-_.:m]?(\d{2})(?!\d)'
+)
+# 24-12-2025_08-43-36 (ngày trước năm)
+_DATETIME_DMY_RE = re.compile(
+    r'(?<!\d)(\d{2})[-_.]?(\d{2})[-_.]?(20\d{2})[ T_-]?(\d{2})[-_.:h]?(\d{2})[-_.:m]?(\d{2})(?!\d)'
+)
+# Chỉ có giờ, bắt buộc dạng 08h43 / 08h43m36 (08-12-25 dễ là ngày nên không nhận)
+_TIME_RE = re.compile(r'(?<!\d)(\d{1,2})h(\d{2})(?:m(\d{2}))?(?!\d)', re.IGNORECASE)
+_CLOCK_RE = re.compile(r'(\d{1,2}):(\d{2})(?::(\d{2}))?')
+
+# Giờ trong bản ghi chấm công: giờ ca dự kiến (nếu nguồn có) rồi giờ đã chấm thực tế
+# (ExcelPersonFileParser/excel_extractor: gio_vao/gio_ra; AttendanceProcessor: check_in_N/check_out_N)
+EXPECTED_TIME_FIELDS = ('expected_check_in', 'expected_check_out')
+PUNCH_TIME_FIELDS = (
+    'gio_vao', 'gio_ra',
+    'check_in_1', 'check_out_1', 'check_in_2', 'check_out_2', 'check_in_3', 'check_out_3',
+)
+
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_DATETIME = 306
+EXIF_IFD = 0x8769
+
+
+def _seconds(hour: int, minute: int, second: int = 0) -> Optional[int]:
+    if hour < 24 and minute < 60 and second < 60:
+        return hour * 3600 + minute * 60 + second
+    return None
+
+
+def parse_clock(value) -> Optional[int]:
+    """'HH:MM[:SS]' hoặc datetime/time -> số giây trong ngày"""
+    if value is None:
+        return None
+    if hasattr(value, 'hour'):
+        return _seconds(value.hour, value.minute, getattr(value, 'second', 0))
+    m = _CLOCK_RE.search(str(value))
+    if not m:
+        return None
+    return _seconds(int(m.group(1)), int(m.group(2)), int(m.group(3) or 0))
+
+
+def time_from_filename(path: str) -> Optional[int]:
+    """Giờ chụp (giây trong ngày) từ tên file, None nếu không có"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    for regex in (_DATETIME_RE, _DATETIME_DMY_RE):
+        for m in regex.finditer(name):
+            seconds = _seconds(int(m.group(4)), int(m.group(5)), int(m.group(6)))
+            if seconds is not None:
+                return seconds
+    for m in _TIME_RE.finditer(name):
+        seconds = _seconds(int(m.group(1)), int(m.group(2)), int(m.group(3) or 0))
+        if seconds is not None:
+            return seconds
+    return None
+
+
+def time_from_exif(path: str) -> Optional[int]:
+    """Giờ chụp từ EXIF DateTimeOriginal/DateTime (chỉ đọc header, không decode ảnh)"""
+    if not PIL_AVAILABLE:
+        return None
+    try:
+        with Image.open(path) as img:
+            exif = img.getexif()
+            value = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+    except Exception:
+        return None
+    if not value:
+        return None
+    # 'YYYY:MM:DD HH:MM:SS'
+    return parse_clock(str(value).split(' ')[-1])
+
+
+def time_from_watermark(path: str) -> Optional[int]:
+    """Giờ chụp từ watermark bằng OCR (chậm - chỉ dùng khi bật CANDIDATE_USE_OCR)"""
+    try:
+        from src.text_extractor import extract_datetime_simple
+        text = extract_datetime_simple(path).get('datetime')
+    except Exception:
+        return None
+    return parse_clock(text.split(' ')[-1]) if text else None
+
+
+def _clock_values(value) -> List[str]:
+    """Các giờ trong một ô (chuỗi nhiều dòng 'HH:MM' hoặc datetime/time) dạng 'HH:MM:SS'"""
+    if value is None or value == '':
+        return []
+    if hasattr(value, 'hour'):
+        seconds = [parse_clock(value)]
+    else:
+        seconds = [
+            _seconds(int(m.group(1)), int(m.group(2)), int(m.group(3) or 0))
+            for m in _CLOCK_RE.finditer(str(value))
+        ]
+    return [f"{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}" for s in seconds if s is not None]
+
+
+def expected_times_for(record: Dict) -> List[str]:
+    """
+    Giờ cần tìm ảnh cho một bản ghi thiếu công: giờ ca dự kiến hoặc giờ đã chấm có trong
+    bản ghi (vd. giờ vào của dòng thiếu giờ ra - người đó có mặt quanh giờ này, kể cả ca
+    không phải giờ hành chính). Bản ghi không có giờ nào mới dùng giờ ca mặc định trong config.
+    (hỗ trợ bản ghi của AttendanceProcessor, ExcelPersonFileParser và excel_extractor)
+    """
+    times = []
+    for field in EXPECTED_TIME_FIELDS + PUNCH_TIME_FIELDS:
+        for value in _clock_values(record.get(field)):
+            if value not in times:
+                times.append(value)
+    if times:
+        return times
+
+    issue = record.get('issue_type')
+    if issue == 'missing_checkin' or record.get('missing_checkin'):
+        return [SHIFT_CHECK_IN]
+    if issue == 'missing_checkout' or record.get('missing_checkout'):
+        return [SHIFT_CHECK_OUT]
+    return [SHIFT_CHECK_IN, SHIFT_CHECK_OUT]
+
+
+def _clock_gap(a: int, b: int) -> int:
+    """Khoảng cách giữa hai giờ trong ngày (tính vòng qua nửa đêm cho ca đêm)"""
+    gap = abs(a - b) % DAY_SECONDS
+    return min(gap, DAY_SECONDS - gap)
+
+
+class CandidatePlanner:
+    """Lọc + sắp xếp ảnh camera theo khoảng cách tới giờ vào/ra ca dự kiến"""
+
+    def __init__(
+        self,
+        window_minutes: int = CANDIDATE_WINDOW_MINUTES,
+        use_exif: bool = True,
+        use_ocr: bool = CANDIDATE_USE_OCR
+    ):
+        """
+        Args:
+            window_minutes: Chỉ giữ ảnh cách giờ dự kiến tối đa N phút (0 = không lọc, chỉ sắp xếp)
+            use_exif: Đọc giờ chụp từ EXIF khi tên file không có giờ
+            use_ocr: Đọc giờ từ watermark bằng OCR khi không có nguồn nào khác
+        """
+        self.window_minutes = window_minutes
+        self.use_exif = use_exif
+        self.use_ocr = use_ocr
+        # {path: (mtime, giây trong ngày)} - LRU giới hạn byte
+        self._times = striped_lru(TIME_CACHE_BYTES, sizeof=lambda item: 200)
+
+    def frame_time(self, path: str) -> Optional[int]:
+        """Giờ chụp của ảnh (giây trong ngày), None nếu không xác định được"""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        cached = self._times.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        seconds = time_from_filename(path)
+        if seconds is None and self.use_exif:
+            seconds = time_from_exif(path)
+        if seconds is None and self.use_ocr:
+            seconds = time_from_watermark(path)
+        self._times.put(path, (mtime, seconds))
+        return seconds
+
+    def cache_stats(self) -> Dict:
+        """Thống kê cache giờ chụp (hit/miss/eviction/byte)"""
+        return self._times.stats()
+
+    def gaps(self, images: Iterable[str], expected_times: Optional[Iterable]) -> List[Optional[int]]:
+        """
+        Khoảng cách (giây) từ giờ chụp mỗi ảnh tới giờ dự kiến gần nhất
+
+        Returns:
+            Cùng thứ tự với images: None = ảnh không có giờ chụp hoặc không có giờ dự kiến
+        """
+        targets = [t for t in (parse_clock(e) for e in expected_times or []) if t is not None]
+        result = []
+        for path in images:
+            seconds = self.frame_time(path) if targets else None
+            result.append(None if seconds is None else min(_clock_gap(seconds, t) for t in targets))
+        return result
+
+    def plan(self, images: List[str], expected_times: Optional[Iterable]) -> List[str]:
+        """
+        Danh sách ảnh cần so sánh: ảnh trong khung giờ sắp theo độ gần giờ dự kiến,
+        rồi tới các ảnh không xác định được giờ (giữ thứ tự gốc, không bị loại)
+        """
+        gaps = self.gaps(images, expected_times)
+        if all(g is None for g in gaps):
+            return list(images)
+        limit = self.window_minutes * 60 if self.window_minutes > 0 else None
+        timed = [(g, i) for i, g in enumerate(gaps) if g is not None and (limit is None or g <= limit)]
+        timed.sort()
+        untimed = [images[i] for i, g in enumerate(gaps) if g is None]
+        return [images[i] for _, i in timed] + untimed
+
+
+# Singleton instance
+_planner = None
+_planner_lock = threading.Lock()
+
+def get_candidate_planner() -> CandidatePlanner:
+    global _planner
+    with _planner_lock:
+        if _planner is None:
+            _planner = CandidatePlanner()
+        return _planner
@@ -4,9 +4,15 @@ Cấu hình cho phần mềm nhận diện khuôn mặt
 """
 
 import os
+import sys
 
-# Đường dẫn gốc của dự án
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Đường dẫn gốc của dự án (chứa data: database, input_images...).
+# Chạy từ EXE (PyInstaller): data nằm cạnh file exe như trong app.py, không phải trong
+# _MEIPASS (thư mục tạm bị xóa khi thoát) - DatabaseManager/watcher/artifact dùng chung thư mục
+if getattr(sys, 'frozen', False):
+    BASE_DIR = os.path.dirname(sys.executable)
+else:
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # Đường dẫn các thư mục
 INPUT_IMAGES_DIR = os.path.join(BASE_DIR, "input_images")
@@ -17,9 +23,70 @@ RESULTS_DIR = os.path.join(BASE_DIR, "results")
 FACE_RECOGNITION_TOLERANCE = 0.6  # Ngưỡng so sánh (nhỏ hơn = chính xác hơn)
 FACE_DETECTION_MODEL = "hog"  # "hog" (nhanh) hoặc "cnn" (chính xác hơn, cần GPU)
 
+# Đăng ký nhiều ảnh chân dung mỗi người: giữ K encoding chất lượng tốt nhất làm mẫu
+ENROLL_TEMPLATES_K = 3
+FACE_QUALITY_MIN_SIDE = 120  # Cạnh khuôn mặt (pixel ảnh gốc) đạt điểm kích thước tối đa
+FACE_QUALITY_SHARPNESS = 100.0  # Phương sai Laplacian đạt điểm độ nét tối đa
+
 # Cấu hình xử lý bất đồng bộ
 MAX_WORKERS = 4  # Số thread xử lý song song
 
+# Pool process cho inference (mỗi process giữ một bản model riêng, ~1GB RAM/process)
+INFERENCE_WORKERS = min(4, max(1, (os.cpu_count() or 2) // 2))  # 0 = chạy trong process chính
+INFERENCE_MAX_TASKS_PER_CHILD = 500  # Thay worker mới sau N task để giới hạn RAM
+INFERENCE_TASK_TIMEOUT = 120  # Giây tối đa cho một ảnh
+SCAN_POOL_MIN_IMAGES = 8  # Quét database: ít ảnh cần encode hơn thì encode ngay, không khởi động pool
+
+# Theo dõi thay đổi thư mục database/ và ảnh chân dung (inotify trên Linux, nơi khác quét mtime)
+WATCH_DEBOUNCE = 1.0  # Giây chờ không có sự kiện mới rồi mới áp dụng (gom file chép cùng lúc)
+WATCH_POLL_INTERVAL = 5.0  # Chu kỳ quét mtime khi không có inotify
+
+# Index ANN (IVF) cho nhận diện 1:N trong database
+ANN_NLIST = 0  # Số cụm, 0 = tự chọn ~sqrt(số người)
+ANN_NPROBE = 8  # Số cụm quét mỗi lần tìm (lớn hơn = chính xác hơn, chậm hơn)
+ANN_MIN_TRAIN_SIZE = 512  # Ít người hơn thì tìm chính xác toàn bộ
+
+# Bộ lọc nhanh (Haar cascade) loại ảnh không có mặt trước RetinaFace + ArcFace
+PREFILTER_ENABLED = True
+PREFILTER_MAX_WIDTH = 640  # Thu nhỏ ảnh về chiều rộng này trước khi chạy cascade
+PREFILTER_MIN_NEIGHBORS = 2  # Thấp = ít bỏ sót mặt hơn (ưu tiên không loại nhầm)
+
+# Ảnh camera có cạnh dài >= 2x giá trị này (vd 4K) được decode thu nhỏ để detect mặt
+DETECTION_MAX_SIDE = 1920
+
+# Chế độ detect theo nguồn camera: "reduced" (decode thu nhỏ, nhanh) hoặc "tiled"
+# (chia ô chồng lấn ở độ phân giải gốc, detect song song - giữ được mặt nhỏ ở xa)
+DETECTION_MODE_DEFAULT = "reduced"
+DETECTION_MODES = {}  # {tên thư mục camera hoặc đường dẫn: chế độ}, vd {"Cam_Cong": "tiled"}
+TILE_SIZE = 1280  # Cạnh mỗi ô (pixel)
+TILE_OVERLAP = 160  # Độ chồng lấn giữa hai ô kề nhau (>= cỡ mặt lớn nhất cần giữ nguyên)
+TILE_WORKERS = min(4, os.cpu_count() or 1)  # Số thread detect các ô
+TILE_NMS_IOU = 0.4  # Ngưỡng IoU khi gộp bbox trùng giữa các ô
+
+# Lập kế hoạch ảnh camera theo giờ vào/ra ca dự kiến
+SHIFT_CHECK_IN = "07:30"  # Giờ vào ca dự kiến
+SHIFT_CHECK_OUT = "17:00"  # Giờ ra ca dự kiến
+CANDIDATE_WINDOW_MINUTES = 0  # Chỉ xét ảnh cách giờ dự kiến tối đa N phút (0 = không lọc, chỉ sắp xếp)
+CANDIDATE_USE_OCR = False  # Đọc giờ từ watermark bằng OCR khi tên file/EXIF không có (chậm)
+
+# Kiểu lưu embedding ảnh camera (RAM + kho trên đĩa): float32, float16 (2x nhỏ hơn), int8 (4x)
+EMBEDDING_DTYPE = "float16"
+
+# Cache RAM (LRU giới hạn theo dung lượng, chia stripe cho truy cập đa luồng)
+EMBEDDING_CACHE_MB = 512  # Ngân sách cache embedding ảnh camera (0 = không giới hạn)
+CACHE_STRIPES = 8  # Số stripe (mỗi stripe một lock)
+CACHE_EVICTION = "lru"  # "lru" hoặc "fifo"
+
+# Sàng ảnh camera bằng tâm template của từng người trước khi so với đủ template
+# 0 = không bỏ sót match nào; dương = sàng lỏng hơn; None = tắt sàng
+CENTROID_SCREEN_MARGIN = 0.0
+
+# Cache ảnh phái sinh (thumbnail + ảnh cắt mặt đã match) cho báo cáo Word và giao diện web
+ARTIFACT_DIR = os.path.join(BASE_DIR, ".artifacts")
+THUMBNAIL_MAX_SIDE = 640  # Cạnh dài tối đa của thumbnail (pixel)
+ARTIFACT_MAX_AGE_DAYS = 60  # Xóa artifact không được dùng quá N ngày
+ARTIFACT_MAX_MB = 512  # Giới hạn dung lượng thư mục artifact
+
 # Cấu hình Tesseract OCR (đường dẫn trên Windows)
 TESSERACT_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
@@ -6,118 +6,522 @@ Cấu trúc: database/chi_nhanh/ten_nguoi/anh.jpg
 
 import os
 import json
-import pickle
+import contextlib
+import threading
 from pathlib import Path
+import numpy as np
 
-from src.config import DATABASE_DIR, SUPPORTED_IMAGE_EXTENSIONS
-from src.face_detector import get_face_encoding
+from src.config import DATABASE_DIR, SUPPORTED_IMAGE_EXTENSIONS, FACE_RECOGNITION_TOLERANCE
+try:
+    from src.config import SCAN_POOL_MIN_IMAGES
+except ImportError:
+    SCAN_POOL_MIN_IMAGES = 8
+from src.face_detector import (
+    get_face_template, select_templates, make_match_result, find_best_match, KnownFaces
+)
+from src.ann_index import IVFIndex
+from src.embedding_store import content_hash
+from src.face_store import FaceStore
+from src.inference_pool import get_inference_pool
 
 
-# File cache cho encoding
+# Database encoding (SQLite WAL); cache pickle cũ chỉ còn dùng để chuyển đổi một lần
+STORE_FILE = os.path.join(DATABASE_DIR, '.face_store.db')
 CACHE_FILE = os.path.join(DATABASE_DIR, '.face_cache.pkl')
 
 
 class DatabaseManager:
     def __init__(self):
         self.database = {}  # {person_id: {'encoding': ..., 'branch': ..., 'name': ..., 'image_path': ...}}
+                            # 'encoding' chỉ có sau khi nạp vector (_ensure_vectors)
         self.branches = []  # Danh sách chi nhánh
-        self._load_cache()
+        self.manifest = {}  # {image_path: {'size', 'mtime', 'hash', 'person_id', 'has_face'}}
+        self.ann_index = IVFIndex(metric="euclidean")  # Tìm người gần nhất (1:N)
+        self._version = 0  # Tăng mỗi khi database đổi
+        self._known = None  # KnownFaces dựng theo _version
+        self._known_lock = threading.Lock()
+        self._vectors_loaded = False
+        self._vectors_lock = threading.Lock()
+        self._sync_lock = threading.RLock()  # Quét toàn bộ / đồng bộ từ watcher / thêm người không chạy chồng nhau
+        # database + ann_index trong bộ nhớ: ghi (từng người) và đọc (dựng KnownFaces, tìm index)
+        # đều giữ lock này - không giữ trong lúc encode ảnh
+        self._data_lock = threading.RLock()
+        self.store = None
+        self._load_store()
     
     def _get_person_id(self, branch, name):
         """Tạo ID duy nhất cho người"""
         return f"{branch}/{name}"
     
-    def _load_cache(self):
-        """Load cache từ file"""
-        if os.path.exists(CACHE_FILE):
+    def _mark_changed(self):
+        """Đánh dấu database đã đổi - ma trận encoding sẽ dựng lại ở lần dùng sau"""
+        self._version += 1
+    
+    def known_faces(self):
+        """
+        Ma trận encoding xếp chồng + person_id/metadata song song (KnownFaces),
+        chỉ dựng lại khi database thay đổi
+        """
+        self._ensure_vectors()
+        with self._known_lock:
+            if self._known is None or self._known.version != self._version:
+                with self._data_lock:
+                    self._known = KnownFaces.from_dict(self.database, self._version)
+            return self._known
+    
+    def _load_store(self):
+        """Mở database SQLite (chuyển cache pickle cũ nếu có) và nạp metadata - chưa nạp vector"""
+        try:
+            os.makedirs(DATABASE_DIR, exist_ok=True)
+            self.store = FaceStore(STORE_FILE)
+            self.store.migrate_pickle(CACHE_FILE)
+            self.database = self.store.persons()
+            self.manifest = self.store.manifest()
+            self._mark_changed()
+            print(f"Đã load database: {len(self.database)} người")
+        except Exception as e:
+            print(f"Lỗi load database: {e}")
+            self.database = {}
+            self.manifest = {}
+            self._mark_changed()
+    
+    def _ensure_vectors(self):
+        """Nạp khối mẫu từ SQLite vào database + index ANN ở lần tìm kiếm đầu tiên"""
+        if self._vectors_loaded:
+            return
+        with self._vectors_lock:
+            if self._vectors_loaded:
+                return
+            blocks = self.store.load_templates() if self.store is not None else {}
+            with self._data_lock:
+                for person_id, templates in blocks.items():
+                    if person_id in self.database:
+                        self._set_templates(self.database[person_id], templates)
+                loaded = self._load_index()
+                self._mark_changed()
+                self._vectors_loaded = True
+                if not loaded:
+                    self._save_index()
+    
+    @staticmethod
+    def _set_templates(person_data, templates):
+        """Khối mẫu (k, 128) theo chất lượng giảm dần; 'encoding' = mẫu tốt nhất"""
+        person_data['templates'] = templates
+        person_data['encoding'] = templates[0]
+    
+    def _index_add(self, person_id, templates):
+        # Mỗi mẫu một mục (person_id, thứ tự mẫu) trong index ANN
+        for k, template in enumerate(templates):
+            self.ann_index.add((person_id, k), template)
+    
+    def _index_remove(self, person_id, person_data):
+        for k in range(len(person_data.get('templates', ()))):
+            self.ann_index.remove((person_id, k))
+    
+    def _rebuild_index(self):
+        self.ann_index = IVFIndex(metric="euclidean")
+        for person_id, data in self.database.items():
+            if data.get('templates') is not None:
+                self._index_add(person_id, data['templates'])
+    
+    def _load_index(self):
+        """
+        Nạp index ANN đã lưu trong SQLite; dựng lại nếu thiếu hoặc lệch với database
+        
+        Returns:
+            True nếu dùng được index đã lưu
+        """
+        blocks = [d['templates'] for d in self.database.values() if d.get('templates') is not None]
+        expected = {
+            (pid, k) for pid, d in self.database.items() for k in range(len(d.get('templates', ())))
+        }
+        if self.store is not None and blocks:
             try:
-                with open(CACHE_FILE, 'rb') as f:
-                    self.database = pickle.load(f)
-                print(f"Đã load cache: {len(self.database)} người")
+                state = self.store.load_ann_state(len(expected), blocks[0].shape[1])
+                if state is not None:
+                    index = IVFIndex.from_state(state)
+                    if set(index.ids()) == expected:
+                        self.ann_index = index
+                        return True
             except Exception as e:
-                print(f"Lỗi load cache: {e}")
-                self.database = {}
+                print(f"Lỗi load index ANN: {e}")
+        self._rebuild_index()
+        return False
     
-    def _save_cache(self):
-        """Lưu cache vào file"""
+    def _save_index(self):
+        """Lưu index ANN đã chia cụm (index nhỏ tìm chính xác, dựng lại rẻ - không cần lưu)"""
+        if self.store is None or not self._vectors_loaded or not self.ann_index.is_trained:
+            return
         try:
-            with open(CACHE_FILE, 'wb') as f:
-                pickle.dump(self.database, f)
-            print(f"Đã lưu cache: {len(self.database)} người")
+            with self._data_lock:  # to_state() có thể dọn tombstone (chia cụm lại)
+                state = self.ann_index.to_state()
+            self.store.save_ann_state(len(state['ids']), state['vectors'].shape[1], state)
         except Exception as e:
-            print(f"Lỗi lưu cache: {e}")
+            print(f"Lỗi lưu index ANN: {e}")
     
-    def scan_database(self, progress_callback=None):
+    def _put_person(self, person_id, branch, name, image_path, templates, conn=None):
+        """Ghi một người (khối mẫu) xuống SQLite và cập nhật bản trong bộ nhớ"""
+        if self.store is not None:
+            self.store.upsert_person(person_id, branch, name, image_path, templates, conn)
+        person_data = {'branch': branch, 'name': name, 'image_path': image_path}
+        with self._data_lock:
+            old = self.database.get(person_id)
+            self.database[person_id] = person_data
+            if self._vectors_loaded:
+                if old is not None:
+                    self._index_remove(person_id, old)
+                self._set_templates(person_data, templates)
+                self._index_add(person_id, templates)
+    
+    def _put_manifest(self, image_path, person_id, template, conn=None):
         """
-        Quét toàn bộ thư mục database và tạo encoding
+        Ghi manifest của một ảnh chân dung
+        
+        Args:
+            template: (encoding, quality) hoặc None nếu ảnh không thấy mặt
+        """
+        st = os.stat(image_path)
+        entry = {
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'hash': content_hash(image_path).hex(),
+            'person_id': person_id,
+            'has_face': template is not None,  # Ảnh không thấy mặt không encode lại khi chưa đổi
+            'quality': None if template is None else template[1],
+        }
+        self.manifest[image_path] = entry
+        encoding = None if template is None else template[0]
+        if self.store is not None:
+            self.store.upsert_manifest(image_path, dict(entry, encoding=encoding), conn)
+        else:
+            entry['encoding'] = encoding  # Không có SQLite: giữ encoding trong bộ nhớ
+    
+    def _drop_manifest(self, image_paths, conn=None):
+        image_paths = [path for path in image_paths if self.manifest.pop(path, None) is not None]
+        if image_paths and self.store is not None:
+            self.store.delete_manifest(image_paths, conn)
+    
+    def _image_templates(self, person_id):
+        """[(ảnh, encoding, chất lượng)] mọi ảnh có mặt của một người"""
+        if self.store is not None:
+            return self.store.image_templates(person_id)
+        return [
+            (path, entry['encoding'], entry['quality']) for path, entry in self.manifest.items()
+            if entry['person_id'] == person_id and entry.get('encoding') is not None
+        ]
+    
+    def _refresh_person(self, person_id, branch, name, conn=None):
+        """Chọn lại K mẫu tốt nhất từ các ảnh của người; không còn ảnh có mặt thì xóa người"""
+        image_paths, templates = select_templates(self._image_templates(person_id))
+        if templates is None:
+            self._remove_person(person_id, conn)
+            return False
+        self._put_person(person_id, branch, name, image_paths[0], templates, conn)
+        return True
+    
+    def _list_persons(self):
+        """[(branch, person_name, [ảnh đã sắp xếp])] của mọi người trong cây database"""
+        persons = []
+        for branch in sorted(os.listdir(DATABASE_DIR)):
+            branch_path = os.path.join(DATABASE_DIR, branch)
+            if not os.path.isdir(branch_path) or branch.startswith('.'):
+                continue
+            self.branches.append(branch)
+            for person_name in sorted(os.listdir(branch_path)):
+                person_path = os.path.join(branch_path, person_name)
+                if not os.path.isdir(person_path):
+                    continue
+                persons.append((branch, person_name, self._person_images(person_path)))
+        return persons
+    
+    @staticmethod
+    def _person_images(person_path):
+        """Ảnh chân dung (đã sắp xếp) trong thư mục của một người"""
+        return sorted(
+            os.path.join(person_path, file) for file in os.listdir(person_path)
+            if os.path.splitext(file)[1].lower() in SUPPORTED_IMAGE_EXTENSIONS
+        )
+    
+    def _manifest_entry(self, image_path):
+        """
+        Mục manifest còn đúng với file trên đĩa (None nếu ảnh mới hoặc đã đổi nội dung).
+        Chỉ hash lại nội dung khi size/mtime khác - đổi mtime mà nội dung giữ nguyên vẫn dùng lại.
+        """
+        entry = self.manifest.get(image_path)
+        if entry is None or (entry['has_face'] and entry.get('quality') is None):
+            return None  # Ảnh mới, hoặc manifest cũ chưa lưu encoding từng ảnh
+        st = os.stat(image_path)
+        if entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+            return entry
+        if entry['size'] == st.st_size and content_hash(image_path).hex() == entry['hash']:
+            entry['mtime'] = st.st_mtime
+            if self.store is not None:
+                self.store.touch_manifest(image_path, st.st_mtime)
+            return entry
+        return None
+    
+    def _remove_person(self, person_id, conn=None):
+        with self._data_lock:
+            old = self.database.pop(person_id, None)
+            if old is not None and self._vectors_loaded:
+                self._index_remove(person_id, old)
+        if old is not None and self.store is not None:
+            self.store.delete_person(person_id, conn)
+    
+    def scan_database(self, progress_callback=None, full=False):
+        """
+        Quét thư mục database theo manifest: encode mọi ảnh chân dung mới/đã đổi của mỗi
+        người, chọn lại K mẫu chất lượng tốt nhất cho người có ảnh thay đổi, bỏ người đã xóa,
+        giữ nguyên phần còn lại. Ảnh cần encode được chia cho pool process (nhiều ảnh),
+        kết quả ghi lại theo thứ tự người đã sắp xếp; mỗi người một transaction SQLite.
         
         Args:
             progress_callback: Hàm callback(current, total, message)
+            full: True = bỏ manifest, encode lại toàn bộ
         """
-        self.database = {}
+        with self._sync_lock:
+            self._scan(progress_callback, full)
+    
+    def _scan(self, progress_callback, full):
         self.branches = []
+        if full:
+            if self.store is not None:
+                self.store.clear()
+            with self._data_lock:
+                self.database = {}
+                self.ann_index = IVFIndex(metric="euclidean")
+                self._vectors_loaded = True  # Database rỗng: vector trong bộ nhớ đã đầy đủ
+            self.manifest = {}
+            self._mark_changed()
         
         if not os.path.exists(DATABASE_DIR):
             os.makedirs(DATABASE_DIR)
             return
         
-        # Đếm tổng số người
-        total_persons = 0
-        for branch in os.listdir(DATABASE_DIR):
-            branch_path = os.path.join(DATABASE_DIR, branch)
-            if os.path.isdir(branch_path) and not branch.startswith('.'):
-                self.branches.append(branch)
-                for person in os.listdir(branch_path):
-                    person_path = os.path.join(branch_path, person)
-                    if os.path.isdir(person_path):
-                        total_persons += 1
-        
-        current = 0
-        for branch in self.branches:
-            branch_path = os.path.join(DATABASE_DIR, branch)
+        persons = self._list_persons()
+        total_persons = len(persons)
+        seen_ids = set()
+        seen_images = set()
+        by_person = {}  # {person_id: {ảnh trong manifest}}
+        for path, entry in self.manifest.items():
+            by_person.setdefault(entry['person_id'], set()).add(path)
+        dirty = []  # [(person_id, branch, tên, ảnh hiện có, ảnh cần encode)]
+        pending = []  # [(person_id, branch, tên, ảnh)] cần encode
+        kept = 0
+        done = 0
+        
+        for branch, person_name, image_files in persons:
+            person_id = self._get_person_id(branch, person_name)
+            if not image_files:
+                done += 1
+                continue
+            seen_ids.add(person_id)
+            seen_images.update(image_files)
             
-            for person_name in os.listdir(branch_path):
-                person_path = os.path.join(branch_path, person_name)
-                
-                if not os.path.isdir(person_path):
-                    continue
-                
-                current += 1
+            changed = []
+            for image_path in image_files:
+                entry = self._manifest_entry(image_path)
+                if entry is None or entry['person_id'] != person_id:
+                    changed.append(image_path)
+            removed_images = by_person.get(person_id, set()) - set(image_files)
+            has_face = any(self.manifest[path]['has_face'] for path in image_files if path not in changed)
+            if not changed and not removed_images and (person_id in self.database or not has_face):
+                kept += 1
+                done += 1
                 if progress_callback:
-                    progress_callback(current, total_persons, f"Đang xử lý: {branch}/{person_name}")
-                
-                # Tìm ảnh trong thư mục của người này
-                image_files = []
-                for file in os.listdir(person_path):
-                    ext = os.path.splitext(file)[1].lower()
-                    if ext in SUPPORTED_IMAGE_EXTENSIONS:
-                        image_files.append(os.path.join(person_path, file))
-                
-                if not image_files:
-                    continue
-                
-                # Lấy encoding từ ảnh đầu tiên
-                image_path = image_files[0]
-                encoding = get_face_encoding(image_path)
-                
-                if encoding is not None:
-                    person_id = self._get_person_id(branch, person_name)
-                    self.database[person_id] = {
-                        'encoding': encoding,
-                        'branch': branch,
-                        'name': person_name,
-                        'image_path': image_path
-                    }
+                    progress_callback(done, total_persons, f"Giữ nguyên: {branch}/{person_name}")
+                continue
+            dirty.append((person_id, branch, person_name, image_files, changed))
+            pending.extend((person_id, branch, person_name, path) for path in changed)
+        
+        templates = self._encode_pending(pending, done, total_persons, progress_callback)
+        results = {path: outcome for (*_, path), outcome in zip(pending, templates)}
+        encoded = failed = 0
+        for person_id, branch, person_name, image_files, changed in dirty:
+            with self._transaction() as conn:
+                for image_path in changed:
+                    ok, template = results[image_path]
+                    if not ok:
+                        # Lỗi encode: bỏ mục cũ, không ghi manifest - lần quét sau thử lại
+                        failed += 1
+                        self._drop_manifest([image_path], conn)
+                        continue
+                    encoded += 1
+                    self._put_manifest(image_path, person_id, template, conn)
+                self._drop_manifest(by_person.get(person_id, set()) - set(image_files), conn)
+                self._refresh_person(person_id, branch, person_name, conn)
+        
+        # Người/ảnh không còn trên đĩa
+        removed = [pid for pid in self.database if pid not in seen_ids]
+        stale = [path for path in self.manifest if path not in seen_images]
+        with self._transaction() as conn:
+            for person_id in removed:
+                self._remove_person(person_id, conn)
+            self._drop_manifest(stale, conn)
         
-        self._save_cache()
+        if dirty or removed or stale or full:
+            self._mark_changed()
+            self._save_index()
+        print(f"Quét database: encode {encoded} ảnh, giữ nguyên {kept}, xóa {len(removed)} người"
+              + (f", lỗi {failed} ảnh" if failed else ""))
         
         if progress_callback:
             progress_callback(total_persons, total_persons, f"Hoàn thành! {len(self.database)} người trong database")
     
+    def sync_person(self, branch, person_name):
+        """
+        Đồng bộ một người với thư mục của họ trên đĩa (dùng cho watcher):
+        encode ảnh mới/đã đổi, bỏ ảnh đã xóa, chọn lại mẫu; thư mục không còn thì xóa người
+        
+        Returns:
+            True nếu database/manifest có thay đổi
+        """
+        person_id = self._get_person_id(branch, person_name)
+        person_path = os.path.join(DATABASE_DIR, branch, person_name)
+        with self._sync_lock:
+            image_files = self._person_images(person_path) if os.path.isdir(person_path) else []
+            known = {path for path, entry in self.manifest.items() if entry['person_id'] == person_id}
+            changed = []
+            for image_path in image_files:
+                entry = self._manifest_entry(image_path)
+                if entry is None or entry['person_id'] != person_id:
+                    changed.append(image_path)
+            gone = known - set(image_files)
+            if not changed and not gone and (person_id in self.database) == bool(image_files and any(
+                    self.manifest[path]['has_face'] for path in image_files)):
+                return False
+            
+            templates = [(image_path, get_face_template(image_path)) for image_path in changed]
+            with self._transaction() as conn:
+                for image_path, template in templates:
+                    self._put_manifest(image_path, person_id, template, conn)
+                self._drop_manifest(gone, conn)
+                if image_files:
+                    self._refresh_person(person_id, branch, person_name, conn)
+                else:
+                    self._remove_person(person_id, conn)
+            self.branches = []  # get_branches() đọc lại thư mục
+            self._mark_changed()
+            self._save_index()
+        print(f"Đồng bộ {person_id}: encode {len(changed)} ảnh, bỏ {len(gone)} ảnh")
+        return True
+    
+    def apply_changes(self, paths):
+        """
+        Áp dụng các file/thư mục đã đổi trong DATABASE_DIR (sự kiện từ watcher):
+        chỉ đồng bộ những người bị ảnh hưởng thay vì quét lại toàn bộ
+        
+        Returns:
+            Số người có thay đổi
+        """
+        root = os.path.abspath(DATABASE_DIR)
+        persons = set()
+        for path in paths:
+            rel = os.path.relpath(os.path.abspath(path), root)
+            if rel == os.curdir:
+                self.scan_database()  # Watcher mất sự kiện: quét lại (vẫn theo manifest)
+                return -1
+            parts = rel.split(os.sep)
+            if rel.startswith(os.pardir) or parts[0].startswith('.'):
+                continue
+            if len(parts) >= 2:
+                persons.add((parts[0], parts[1]))
+                continue
+            # Cả thư mục chi nhánh đổi: người trên đĩa + người đang có trong database
+            branch = parts[0]
+            branch_path = os.path.join(root, branch)
+            if os.path.isdir(branch_path):
+                persons.update((branch, name) for name in os.listdir(branch_path)
+                               if os.path.isdir(os.path.join(branch_path, name)))
+            persons.update((d['branch'], d['name']) for d in list(self.database.values())
+                           if d.get('branch') == branch)
+        return sum(self.sync_person(branch, name) for branch, name in sorted(persons))
+    
+    def _encode_pending(self, pending, done, total, progress_callback=None):
+        """
+        Encode ảnh chân dung của các người cần quét lại
+        
+        Returns:
+            [(ok, (encoding, quality) | None)] cùng thứ tự với pending (ok=False: lỗi worker/timeout)
+        """
+        # Tiến độ tính theo người: một người xong khi mọi ảnh của người đó có kết quả
+        remaining = {}
+        for person_id, *_ in pending:
+            remaining[person_id] = remaining.get(person_id, 0) + 1
+        finished = [done]
+        
+        def on_result(i, ok, _):
+            person_id, branch, person_name, _ = pending[i]
+            remaining[person_id] -= 1
+            if remaining[person_id] == 0:
+                finished[0] += 1
+                if progress_callback:
+                    status = "Đã xử lý" if ok else "Lỗi"
+                    progress_callback(finished[0], total, f"{status}: {branch}/{person_name}")
+        
+        pool = get_inference_pool() if len(pending) >= SCAN_POOL_MIN_IMAGES else None
+        if pool is None:
+            results = []
+            for i, (_, branch, person_name, image_path) in enumerate(pending):
+                if progress_callback:
+                    progress_callback(finished[0] + 1, total, f"Đang xử lý: {branch}/{person_name}")
+                results.append((True, get_face_template(image_path)))
+                on_result(i, True, None)
+            return results
+        
+        if progress_callback:
+            progress_callback(done, total, f"Đang encode {len(pending)} ảnh trên {pool.workers} process...")
+        # Worker trả kết quả về thread đang quét - gộp thành một bộ đếm tiến độ
+        return pool.face_template_batch([image_path for *_, image_path in pending], on_result)
+    
+    def _transaction(self):
+        """Transaction SQLite (không có store thì chỉ cập nhật bộ nhớ)"""
+        if self.store is None:
+            return contextlib.nullcontext()
+        return self.store.transaction()
+    
     def get_all_faces(self):
         """Lấy tất cả khuôn mặt trong database"""
+        self._ensure_vectors()
         return self.database
     
+    def find_best_match(self, unknown_encoding, tolerance=None):
+        """
+        Tìm người phù hợp nhất: database nhỏ so một lần với cả ma trận encoding,
+        database lớn (index ANN đã chia cụm) tìm qua index
+        
+        Args:
+            unknown_encoding: Một encoding hoặc một lô encoding (n, 128)
+        
+        Returns:
+            dict hoặc None (lô: list theo thứ tự đầu vào) - cùng định dạng với
+            face_detector.find_best_match
+        """
+        if unknown_encoding is None:
+            return None
+        if tolerance is None:
+            tolerance = FACE_RECOGNITION_TOLERANCE
+        
+        self._ensure_vectors()
+        with self._data_lock:
+            trained = self.ann_index.is_trained
+        if not trained:
+            return find_best_match(unknown_encoding, self.known_faces(), tolerance)
+        if np.ndim(unknown_encoding) == 2:
+            return [self._search_index(encoding, tolerance) for encoding in unknown_encoding]
+        return self._search_index(unknown_encoding, tolerance)
+    
+    def _search_index(self, unknown_encoding, tolerance):
+        with self._data_lock:  # Watcher có thể đang thêm/xóa người (index chia cụm lại)
+            hits = self.ann_index.search(unknown_encoding, k=1)
+            if not hits:
+                return None
+            (person_id, _), distance = hits[0]
+            person_data = self.database.get(person_id)
+        if person_data is None or distance > tolerance:
+            return None
+        return make_match_result(person_id, person_data, distance)
+    
     def get_branches(self):
         """Lấy danh sách chi nhánh"""
         if not self.branches:
@@ -156,7 +560,8 @@ class DatabaseManager:
     
     def add_person(self, branch, person_name, image_path):
         """
-        Thêm người mới vào database
+        Thêm ảnh chân dung cho người (người mới hoặc thêm mẫu cho người đã có);
+        K mẫu tốt nhất được chọn lại từ mọi ảnh của người
         
         Args:
             branch: Tên chi nhánh
@@ -172,21 +577,17 @@ class DatabaseManager:
         dest_path = os.path.join(person_dir, filename)
         shutil.copy2(image_path, dest_path)
         
-        # Tạo encoding
-        encoding = get_face_encoding(dest_path)
-        
-        if encoding is not None:
-            person_id = self._get_person_id(branch, person_name)
-            self.database[person_id] = {
-                'encoding': encoding,
-                'branch': branch,
-                'name': person_name,
-                'image_path': dest_path
-            }
-            self._save_cache()
-            return True
+        # Tạo encoding + điểm chất lượng
+        template = get_face_template(dest_path)
+        person_id = self._get_person_id(branch, person_name)
+        with self._sync_lock:
+            with self._transaction() as conn:
+                self._put_manifest(dest_path, person_id, template, conn)
+                self._refresh_person(person_id, branch, person_name, conn)
+            self._mark_changed()
+            self._save_index()
         
-        return False
+        return template is not None
     
     def get_database_stats(self):
         """Lấy thống kê database"""
@@ -196,7 +597,9 @@ class DatabaseManager:
             'branches': {}
         }
         
-        for person_id, data in self.database.items():
+        with self._data_lock:
+            persons = list(self.database.values())
+        for data in persons:
             branch = data.get('branch', 'Unknown')
             if branch not in stats['branches']:
                 stats['branches'][branch] = 0
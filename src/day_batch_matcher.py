@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Module match theo lô từng ngày
+Gom các truy vấn (người, ngày) theo thư mục ngày, embed ảnh camera của ngày đó
+đúng một lần rồi giải bài toán match cho tất cả mọi người bằng một ma trận khoảng cách.
+Ảnh được embed theo thứ tự gần giờ vào/ra dự kiến (CandidatePlanner); mỗi người
+chỉ được so với ảnh trong khung giờ của mình.
+"""
+
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+from src.candidate_planner import get_candidate_planner
+from src.quantization import stack_embeddings
+
+
+class DayBatchMatcher:
+    """Match nhiều người cùng lúc trên ảnh camera của từng ngày"""
+
+    def __init__(
+        self,
+        matcher,
+        distance_threshold: Optional[float] = None,
+        exclusive: bool = False,
+        log_callback=None,
+        early_stop_ratio: Optional[float] = None,
+        planner=None
+    ):
+        """
+        Args:
+            matcher: FaceMatcher đã khởi tạo
+            distance_threshold: Ngưỡng khoảng cách (None = ngưỡng mặc định theo model)
+            exclusive: True = mỗi khuôn mặt trên ảnh camera chỉ gán cho tối đa một người
+            log_callback: Hàm callback(message, log_type) để gửi log
+            early_stop_ratio: Dừng quét ngày khi mọi người đã có match <= ngưỡng x ratio
+                              (None = quét hết; bỏ qua khi exclusive)
+            planner: CandidatePlanner lọc/sắp ảnh theo giờ (None = dùng bản dùng chung)
+        """
+        self.matcher = matcher
+        self.distance_threshold = distance_threshold
+        self.exclusive = exclusive
+        self.log_callback = log_callback
+        self.early_stop_ratio = early_stop_ratio
+        self.planner = planner or get_candidate_planner()
+        # {day_key: {'images': [...], 'persons': [...], 'expected': {person: [giờ]}}}
+        self._days: Dict[str, Dict] = {}
+
+    def _log(self, message: str, log_type: str = "default"):
+        if self.log_callback:
+            self.log_callback(message, log_type)
+        else:
+            print(message)
+
+    def add_query(
+        self,
+        day_key: str,
+        camera_images: List[str],
+        person_name: str,
+        expected_times: Optional[Iterable[str]] = None
+    ):
+        """
+        Thêm một truy vấn: tìm person_name trong ảnh camera của ngày day_key
+
+        Args:
+            expected_times: Giờ vào/ra dự kiến ('HH:MM') - None = xét mọi ảnh của ngày
+        """
+        day = self._days.setdefault(day_key, {'images': camera_images, 'persons': [], 'expected': {}})
+        if person_name not in day['persons']:
+            day['persons'].append(person_name)
+            day['expected'][person_name] = list(expected_times) if expected_times else None
+        elif day['expected'].get(person_name) is not None:
+            if expected_times:
+                merged = day['expected'][person_name]
+                merged.extend(t for t in expected_times if t not in merged)
+            else:
+                day['expected'][person_name] = None
+
+    def run(self) -> Dict[Tuple[str, str], Optional[Tuple[str, float]]]:
+        """
+        Chạy match cho tất cả các ngày đã gom
+
+        Returns:
+            {(day_key, person_name): (image_path, distance) hoặc None}
+        """
+        threshold = self.distance_threshold
+        if threshold is None:
+            threshold = self.matcher._get_default_threshold()
+
+        results = {}
+        for day_key, day in self._days.items():
+            results.update(self._run_day(
+                day_key, day['images'], day['persons'], threshold, day['expected']
+            ))
+        return results
+
+    def _run_day(
+        self,
+        day_key: str,
+        camera_images: List[str],
+        person_names: List[str],
+        threshold: float,
+        expected: Optional[Dict[str, Optional[List[str]]]] = None
+    ) -> Dict[Tuple[str, str], Optional[Tuple[str, float]]]:
+        results = {(day_key, name): None for name in person_names}
+
+        # Tên người -> key trong portrait_cache (bỏ người không có chân dung)
+        cached_names = {}
+        for name in person_names:
+            cached = self.matcher._resolve_portrait_name(name)
+            if cached is None:
+                self._log(f"  [ERROR] Không tìm thấy ảnh chân dung cho: {name}", "error")
+            elif not self.matcher._ensure_templates(cached):
+                self._log(f"  [ERROR] Không tạo được embedding chân dung cho: {name}", "error")
+            else:
+                cached_names[name] = cached
+        if not cached_names:
+            return results
+
+        # Khung giờ: mỗi người chỉ xét ảnh gần giờ vào/ra dự kiến của mình.
+        # Ảnh được embed theo thứ hạng tốt nhất trong kế hoạch của bất kỳ ai.
+        names = list(cached_names.keys())
+        expected = expected or {}
+        allowed = {}
+        rank = {}
+        for name in names:
+            planned = self.planner.plan(camera_images, expected.get(name))
+            allowed[name] = set(planned)
+            for pos, path in enumerate(planned):
+                if pos < rank.get(path, len(camera_images)):
+                    rank[path] = pos
+        frames = sorted(rank, key=rank.get)
+
+        # Embed mọi khuôn mặt trong mỗi ảnh camera của ngày đúng một lần
+        day_label = os.path.basename(os.path.normpath(day_key)) or day_key
+        self._log(
+            f"  [DAY {day_label}] Embed {len(frames)}/{len(camera_images)} ảnh (trong khung giờ) "
+            f"cho {len(cached_names)} người",
+            "info"
+        )
+        early_stop = None
+        if self.early_stop_ratio and not self.exclusive:
+            early_stop = threshold * self.early_stop_ratio
+
+        person_keys = [cached_names[n] for n in names]
+        frame_paths = []
+        face_frames = []      # Dòng (khuôn mặt) -> vị trí ảnh trong frame_paths
+        dist_blocks = []
+        best = np.full(len(names), np.inf, dtype=np.float32)
+        batch_size = self.matcher.batch_size
+        for start in range(0, len(frames), batch_size):
+            chunk = frames[start:start + batch_size]
+            self._log(
+                f"    [SCAN] Embed ảnh {start+1}-{start+len(chunk)}/{len(frames)}...",
+                "default"
+            )
+            chunk_frames = []
+            chunk_embeddings = []
+            for camera_img, faces in zip(chunk, self.matcher.get_faces_batch(chunk, batch_size)):
+                if faces is not None:
+                    chunk_frames.extend([len(frame_paths)] * len(faces))
+                    chunk_embeddings.append(faces.embeddings)
+                    frame_paths.append(camera_img)
+            if not chunk_embeddings:
+                continue
+
+            dists = self.matcher.gallery.persons_min_distances(
+                person_keys, stack_embeddings(chunk_embeddings), threshold=threshold
+            )
+            for j, name in enumerate(names):
+                outside = np.array([frame_paths[f] not in allowed[name] for f in chunk_frames])
+                if outside.any():
+                    dists[outside, j] = np.inf
+            face_frames.extend(chunk_frames)
+            dist_blocks.append(dists)
+
+            best = np.minimum(best, dists.min(axis=0))
+            if early_stop is not None and np.all(best <= early_stop):
+                self._log(
+                    f"    [EARLY] Đủ match tốt cho {len(names)} người sau "
+                    f"{start+len(chunk)}/{len(frames)} ảnh",
+                    "success"
+                )
+                break
+        if not dist_blocks:
+            self._log(f"  [DAY {day_label}] Không có ảnh nào detect được khuôn mặt", "warning")
+            return results
+
+        dists = np.vstack(dist_blocks)
+
+        if self.exclusive:
+            assignment = self._assign_exclusive(dists, threshold)
+        else:
+            assignment = {}
+            for j in range(len(names)):
+                i = int(np.argmin(dists[:, j]))
+                if dists[i, j] <= threshold:
+                    assignment[j] = i
+
+        for j, name in enumerate(names):
+            if j in assignment:
+                i = assignment[j]
+                results[(day_key, name)] = (frame_paths[face_frames[i]], float(dists[i, j]))
+        return results
+
+    @staticmethod
+    def _assign_exclusive(dists: np.ndarray, threshold: float) -> Dict[int, int]:
+        """
+        Gán tham lam theo khoảng cách tăng dần: mỗi khuôn mặt một người, mỗi người
+        một khuôn mặt (nhiều người đứng chung một ảnh vẫn được gán cùng ảnh đó)
+
+        Returns:
+            {person_col: face_row}
+        """
+        assignment = {}
+        masked = np.where(dists <= threshold, dists, np.inf)
+        while True:
+            flat = int(np.argmin(masked))
+            i, j = divmod(flat, masked.shape[1])
+            if not np.isfinite(masked[i, j]):
+                break
+            assignment[j] = i
+            masked[i, :] = np.inf
+            masked[:, j] = np.inf
+        return assignment
+
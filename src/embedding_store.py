@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+Module lưu embedding khuôn mặt xuống đĩa
+Key = hash nội dung ảnh, tách namespace theo model_name/detector_backend.
+Mỗi ảnh lưu mọi khuôn mặt detect được (embedding + bbox + điểm detect).
+Vector nằm trong các shard .npy (đọc bằng memory-map), index là file nhị phân
+nhỏ ghi nối tiếp - chạy lại một tháng đã quét chỉ tốn I/O, không tốn inference.
+Vector có thể lưu nén float16/int8 (shard tự mô tả kiểu dữ liệu).
+"""
+
+import os
+import re
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+import numpy as np
+
+from src.quantization import Embeddings, QuantizedMatrix, quantize, stack_embeddings
+
+# Bản ghi index: key 16 byte + shard + dòng đầu + số mặt
+# (shard = -1: detector không thấy mặt, shard = -2: bị bộ lọc nhanh loại)
+INDEX_DTYPE = np.dtype([
+    ('key', 'u1', (16,)), ('shard', '<i4'), ('row', '<i4'), ('count', '<i4')
+])
+INDEX_FILE = 'index_v2.bin'  # v1 chỉ lưu 1 mặt/ảnh - không đọc lại
+NO_FACE = -1
+PRUNED_SHARD = -2
+
+
+class _Pruned:
+    """Sentinel: ảnh bị bộ lọc nhanh (Haar cascade) loại, chưa qua detector"""
+
+    def __repr__(self) -> str:
+        return 'PRUNED'
+
+
+PRUNED = _Pruned()
+
+
+class DetectedFaces(NamedTuple):
+    """Tất cả khuôn mặt trong một ảnh"""
+    embeddings: Embeddings  # (n, dim) float32 hoặc QuantizedMatrix
+    boxes: np.ndarray       # (n, 4) float32 - x, y, w, h
+    scores: np.ndarray      # (n,) float32 - độ tin cậy của detector
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    def largest(self) -> int:
+        """Vị trí khuôn mặt có diện tích bbox lớn nhất"""
+        return int(np.argmax(self.boxes[:, 2] * self.boxes[:, 3]))
+
+
+def make_faces(embeddings, boxes, scores) -> Optional[DetectedFaces]:
+    """Gom danh sách embedding/bbox/score thành DetectedFaces (None nếu rỗng)"""
+    if not len(embeddings):
+        return None
+    return DetectedFaces(
+        np.ascontiguousarray(np.vstack(embeddings), dtype=np.float32),
+        np.asarray(boxes, dtype=np.float32).reshape(-1, 4),
+        np.asarray(scores, dtype=np.float32).reshape(-1),
+    )
+
+
+def content_hash(path: str, chunk_size: int = 1 << 20) -> bytes:
+    """Hash nội dung file (blake2b 16 byte) - không phụ thuộc đường dẫn hay mtime"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.digest()
+
+
+def _safe_name(text: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(text))
+
+
+class FaceArena:
+    """
+    Cache RAM các khuôn mặt theo đường dẫn ảnh, lưu trong vài mảng liên tục
+    (mã embedding nén + scale + bbox + score) thay vì mỗi ảnh một bộ ndarray riêng.
+    Kết quả trả về là view vào các mảng chung, không copy.
+    Giới hạn theo byte: vượt ngân sách thì loại ảnh lâu không dùng (LRU) hoặc cũ nhất (FIFO);
+    dòng của ảnh bị loại được thu hồi khi dồn mảng.
+    """
+
+    ENTRY_OVERHEAD = 160  # Ước lượng byte cho key + tuple + slot OrderedDict mỗi ảnh
+
+    def __init__(self, dtype: str = 'float32', max_bytes: int = 0, policy: str = 'lru'):
+        """
+        Args:
+            dtype: Kiểu lưu embedding (float32/float16/int8)
+            max_bytes: Ngân sách byte cho dữ liệu còn dùng (0 = không giới hạn)
+            policy: 'lru' hoặc 'fifo'
+        """
+        self.dtype = dtype
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._codes: Optional[np.ndarray] = None
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._boxes = np.zeros((0, 4), dtype=np.float32)
+        self._scores = np.zeros(0, dtype=np.float32)
+        self._row_bytes = 0
+        self._size = 0
+        self._dead = 0  # Số dòng của các entry đã bị ghi đè/loại bỏ
+        # {path: (mtime, dòng đầu, số mặt)} theo thứ tự dùng gần nhất
+        self._entries: "OrderedDict[str, Tuple[float, int, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        """Dung lượng thực của các mảng (gồm cả chỗ trống dự phòng)"""
+        codes = self._codes.nbytes if self._codes is not None else 0
+        return codes + self._scales.nbytes + self._boxes.nbytes + self._scores.nbytes
+
+    def _entry_bytes(self, count: int) -> int:
+        return self.ENTRY_OVERHEAD + max(count, 0) * self._row_bytes
+
+    def get(self, path: str, mtime: float) -> Tuple[bool, Optional[DetectedFaces]]:
+        """(found, faces) - faces là None (không có mặt) hoặc PRUNED như EmbeddingStore"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != mtime:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            if self.policy == 'lru':
+                self._entries.move_to_end(path)
+            _, start, count = entry
+            if count == NO_FACE:
+                return True, None
+            if count == PRUNED_SHARD:
+                return True, PRUNED
+            end = start + count
+            codes = self._codes[start:end]
+            if self.dtype == 'float32':
+                embeddings = codes
+            else:
+                embeddings = QuantizedMatrix(codes, self._scales[start:end] if self.dtype == 'int8' else None)
+            return True, DetectedFaces(embeddings, self._boxes[start:end], self._scores[start:end])
+
+    def put(self, path: str, mtime: float, faces):
+        """Ghi kết quả của một ảnh (faces: DetectedFaces, None hoặc PRUNED)"""
+        if faces is None or faces is PRUNED or not len(faces):
+            with self._lock:
+                self._drop(path)
+                self._entries[path] = (mtime, 0, PRUNED_SHARD if faces is PRUNED else NO_FACE)
+                self._bytes += self._entry_bytes(0)
+                self._evict()
+            return
+
+        packed = quantize(faces.embeddings, self.dtype)
+        codes = packed.codes if isinstance(packed, QuantizedMatrix) else packed
+        count = len(codes)
+        with self._lock:
+            self._drop(path)
+            self._reserve(count, codes.shape[1], codes.dtype)
+            start = self._size
+            end = start + count
+            self._codes[start:end] = codes
+            if isinstance(packed, QuantizedMatrix) and packed.scales is not None:
+                self._scales[start:end] = packed.scales
+            self._boxes[start:end] = faces.boxes
+            self._scores[start:end] = faces.scores
+            self._size = end
+            self._entries[path] = (mtime, start, count)
+            self._bytes += self._entry_bytes(count)
+            self._evict()
+
+    def pop(self, path: str) -> bool:
+        """Bỏ kết quả của một ảnh (file đã đổi/xóa); True nếu có trong cache"""
+        with self._lock:
+            found = path in self._entries
+            self._drop(path)
+            return found
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._codes = None
+            self._size = self._dead = self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'bytes': self._bytes, 'entries': len(self._entries), 'max_bytes': self.max_bytes,
+            }
+
+    def _drop(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= self._entry_bytes(entry[2])
+            if entry[2] > 0:
+                self._dead += entry[2]
+
+    def _evict(self):
+        # Luôn giữ ảnh vừa thêm (ở cuối thứ tự)
+        while self.max_bytes and self._bytes > self.max_bytes and len(self._entries) > 1:
+            path = next(iter(self._entries))
+            self._drop(path)
+            self.evictions += 1
+
+    def _reserve(self, count: int, dim: int, dtype):
+        """Đảm bảo còn chỗ cho count dòng (dồn bỏ dòng chết, tăng kích thước nếu cần)"""
+        if self._codes is None:
+            self._codes = np.zeros((0, dim), dtype=dtype)
+            self._row_bytes = self._codes.itemsize * dim + (4 if self.dtype == 'int8' else 0) + 20
+        if self._codes.shape[1] != dim:
+            raise ValueError(f"Sai số chiều embedding: {dim} != {self._codes.shape[1]}")
+        if self._size + count <= len(self._codes):
+            return
+        needed = self._size - self._dead + count
+        capacity = max(64, needed + needed // 2)
+        codes = np.zeros((capacity, dim), dtype=self._codes.dtype)
+        scales = np.zeros(capacity, dtype=np.float32)
+        boxes = np.zeros((capacity, 4), dtype=np.float32)
+        scores = np.zeros(capacity, dtype=np.float32)
+        # Mảng mới: các view cũ đã trả ra vẫn trỏ vào mảng cũ nên vẫn hợp lệ
+        row = 0
+        for path, (mtime, start, n) in self._entries.items():
+            if n <= 0:
+                continue
+            codes[row:row + n] = self._codes[start:start + n]
+            scales[row:row + n] = self._scales[start:start + n]
+            boxes[row:row + n] = self._boxes[start:start + n]
+            scores[row:row + n] = self._scores[start:start + n]
+            self._entries[path] = (mtime, row, n)
+            row += n
+        self._codes, self._scales, self._boxes, self._scores = codes, scales, boxes, scores
+        self._size = row
+        self._dead = 0
+
+
+class EmbeddingStore:
+    """Kho embedding bền vững trên đĩa (một thư mục cho mỗi model/detector)"""
+
+    def __init__(
+        self,
+        root_dir: str,
+        model_name: str,
+        detector_backend: str,
+        variant: str = '',
+        flush_every: int = 256,
+        dtype: str = 'float32'
+    ):
+        """
+        Args:
+            root_dir: Thư mục gốc của kho embedding
+            model_name: Model nhận diện (namespace)
+            detector_backend: Backend detect mặt (namespace)
+            variant: Hậu tố namespace cho các tùy chọn làm đổi kết quả
+            flush_every: Số kết quả mới tối đa giữ trong RAM trước khi ghi shard
+            dtype: Kiểu lưu vector của shard mới (float32/float16/int8)
+        """
+        namespace = f"{_safe_name(model_name)}__{_safe_name(detector_backend)}"
+        if variant:
+            namespace += f"__{_safe_name(variant)}"
+        self.store_dir = os.path.join(root_dir, namespace)
+        self.index_path = os.path.join(self.store_dir, INDEX_FILE)
+        self.flush_every = flush_every
+        self.dtype = dtype
+        self._index: Dict[bytes, Tuple[int, int, int]] = {}
+        self._shards: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self._next_shard = 0
+        self._pending: Dict[bytes, Optional[DetectedFaces]] = {}  # Chưa ghi xuống đĩa
+        self._lock = threading.Lock()
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._load_index()
+        atexit.register(self.flush)
+
+    def __len__(self) -> int:
+        return len(self._index) + len(self._pending)
+
+    def _shard_path(self, shard_id: int) -> str:
+        return os.path.join(self.store_dir, f'shard_{shard_id:05d}.npy')
+
+    def _meta_path(self, shard_id: int) -> str:
+        return os.path.join(self.store_dir, f'meta_{shard_id:05d}.npy')
+
+    def _load_index(self):
+        """Đọc index; bỏ bản ghi cuối bị ghi dở (nếu lần trước crash)"""
+        for name in os.listdir(self.store_dir):
+            m = re.match(r'shard_(\d+)\.npy$', name)
+            if m:
+                self._next_shard = max(self._next_shard, int(m.group(1)) + 1)
+
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            raw = open(self.index_path, 'rb').read()
+            usable = len(raw) - len(raw) % INDEX_DTYPE.itemsize
+            records = np.frombuffer(raw[:usable], dtype=INDEX_DTYPE)
+            for rec in records:
+                self._index[rec['key'].tobytes()] = (
+                    int(rec['shard']), int(rec['row']), int(rec['count'])
+                )
+            print(f"Đã load embedding store: {len(self._index)} ảnh ({self.store_dir})")
+        except Exception as e:
+            print(f"Lỗi load embedding store: {e}")
+            self._index = {}
+
+    def _get_shard(self, shard_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        shard = self._shards.get(shard_id)
+        if shard is None:
+            shard = (
+                np.load(self._shard_path(shard_id), mmap_mode='r'),
+                np.load(self._meta_path(shard_id), mmap_mode='r'),
+            )
+            self._shards[shard_id] = shard
+        return shard
+
+    def lookup(self, key: bytes) -> Tuple[bool, Optional[DetectedFaces]]:
+        """
+        Tra cứu các khuôn mặt của một ảnh theo key
+
+        Returns:
+            (found, faces) - found=True và faces=None nghĩa là ảnh không có mặt,
+            faces=PRUNED nghĩa là ảnh đã bị bộ lọc nhanh loại
+        """
+        with self._lock:
+            if key in self._pending:
+                return True, self._pending[key]
+            entry = self._index.get(key)
+            if entry is None:
+                return False, None
+            shard_id, row, count = entry
+            if shard_id == NO_FACE:
+                return True, None
+            if shard_id == PRUNED_SHARD:
+                return True, PRUNED
+            try:
+                vectors, meta = self._get_shard(shard_id)
+                meta = np.array(meta[row:row + count], dtype=np.float32)
+                codes = np.array(vectors[row:row + count])
+                if codes.dtype == np.float32:
+                    embeddings = codes
+                else:
+                    # Shard nén: cột meta thứ 6 là scale (chỉ int8)
+                    embeddings = QuantizedMatrix(codes, meta[:, 5].copy() if meta.shape[1] > 5 else None)
+                return True, DetectedFaces(embeddings, meta[:, :4], meta[:, 4])
+            except Exception:
+                return False, None
+
+    def put(self, key: bytes, faces: Optional[DetectedFaces]):
+        """Ghi nhận kết quả cho một ảnh (faces=None: không tìm thấy mặt, PRUNED: bị lọc nhanh)"""
+        with self._lock:
+            # Ảnh bị lọc nhanh có thể được ghi đè bằng kết quả detector thật
+            # (kể cả khi kết quả lọc nhanh còn đang chờ flush)
+            if key in self._pending:
+                if self._pending[key] is not PRUNED or faces is PRUNED:
+                    return
+            else:
+                entry = self._index.get(key)
+                if entry is not None and (entry[0] != PRUNED_SHARD or faces is PRUNED):
+                    return
+            if faces is not PRUNED and (faces is None or not len(faces)):
+                faces = None
+            self._pending[key] = faces
+            should_flush = len(self._pending) >= self.flush_every
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """Ghi các kết quả đang chờ ra một shard mới rồi nối bản ghi vào index"""
+        with self._lock:
+            if not self._pending:
+                return
+            keys = list(self._pending.keys())
+            entries = list(self._pending.values())
+
+            records = np.zeros(len(keys), dtype=INDEX_DTYPE)
+            face_sets = [f for f in entries if isinstance(f, DetectedFaces)]
+            shard_id = NO_FACE
+            try:
+                if face_sets:
+                    shard_id = self._next_shard
+                    vectors = quantize(stack_embeddings([f.embeddings for f in face_sets]), self.dtype)
+                    columns = [
+                        np.vstack([f.boxes for f in face_sets]),
+                        np.concatenate([f.scores for f in face_sets])[:, None],
+                    ]
+                    if isinstance(vectors, QuantizedMatrix):
+                        if vectors.scales is not None:
+                            columns.append(vectors.scales[:, None])
+                        vectors = vectors.codes
+                    meta = np.hstack(columns).astype(np.float32)
+                    # Meta ghi trước, shard vector ghi sau cùng (đánh dấu shard hoàn chỉnh)
+                    for path, data in ((self._meta_path(shard_id), meta),
+                                       (self._shard_path(shard_id), vectors)):
+                        tmp_path = path + '.tmp'
+                        with open(tmp_path, 'wb') as f:
+                            np.save(f, np.ascontiguousarray(data))
+                        os.replace(tmp_path, path)
+                    self._next_shard += 1
+
+                row = 0
+                for i, (key, faces) in enumerate(zip(keys, entries)):
+                    records[i]['key'] = np.frombuffer(key, dtype=np.uint8)
+                    if faces is None or faces is PRUNED:
+                        records[i]['shard'] = NO_FACE if faces is None else PRUNED_SHARD
+                        records[i]['row'] = NO_FACE
+                        records[i]['count'] = 0
+                    else:
+                        records[i]['shard'] = shard_id
+                        records[i]['row'] = row
+                        records[i]['count'] = len(faces)
+                        row += len(faces)
+
+                # Shard đã nằm trên đĩa trước khi index trỏ tới nó
+                with open(self.index_path, 'ab') as f:
+                    f.write(records.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception as e:
+                print(f"Lỗi ghi embedding store: {e}")
+                return
+
+            for key, rec in zip(keys, records):
+                self._index[key] = (int(rec['shard']), int(rec['row']), int(rec['count']))
+            self._pending = {}
@@ -17,6 +17,9 @@ from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
 from typing import List, Dict, Optional, Tuple
 
+from src.name_index import NameIndex
+from src.candidate_planner import expected_times_for
+
 
 def set_cell_border(cell, border_color="000000"):
     """Set cell border for Word table cell"""
@@ -459,7 +462,8 @@ class ExcelToWordExporter:
         face_matcher=None,
         accuracy_mode: bool = False,
         match_distance_threshold: Optional[float] = None,
-        log_detail: bool = False
+        log_detail: bool = False,
+        prematched: Optional[Dict] = None
     ):
         self.portrait_dir = portrait_dir
         self.output_dir = output_dir
@@ -468,9 +472,16 @@ class ExcelToWordExporter:
         self.accuracy_mode = accuracy_mode
         self.match_distance_threshold = match_distance_threshold
         self.log_detail = log_detail
+        # Kết quả match theo lô {(day_folder, name): (image_path, distance) | None}
+        self.prematched = prematched or {}
         os.makedirs(output_dir, exist_ok=True)
         self._portrait_cache = {}
         self._scan_portraits()
+        self._name_index = NameIndex(
+            self._portrait_cache.keys(),
+            normalizer=self._normalize,
+            tokenizer=lambda name: self._normalize(name).split()
+        )
 
     def _scan_portraits(self):
         if not os.path.exists(self.portrait_dir):
@@ -499,18 +510,12 @@ class ExcelToWordExporter:
         key = self._normalize(name)
         if key in self._portrait_cache:
             return self._portrait_cache[key][0]
-        for cached_key, paths in self._portrait_cache.items():
-            if key in cached_key or cached_key in key:
-                return paths[0]
+        hits = self._name_index.substring_matches(key)
+        if hits:
+            return self._portrait_cache[self._name_index.names[hits[0]]][0]
         # Word-by-word match
-        words = set(key.split())
-        best, best_score = None, 0
-        for cached_key, paths in self._portrait_cache.items():
-            score = len(words & set(cached_key.split()))
-            if score > best_score:
-                best_score = score
-                best = paths[0]
-        return best if best_score >= 2 else None
+        best, best_score = self._name_index.best_token_overlap(key)
+        return self._portrait_cache[best][0] if best_score >= 2 else None
 
     def export_person(self, person: Dict, log_callback=None) -> str:
         """Xuáº¥t file Word cho má»™t ngÆ°á»i, tráº£ vá» Ä‘Æ°á»ng dáº«n file"""
@@ -622,13 +627,19 @@ class ExcelToWordExporter:
                         if log_callback:
                             log_callback(f"    ðŸ” {name} (ngÃ y {day_str}): So sÃ¡nh {len(camera_images)} áº£nh...", "default")
                         try:
-                            matched_img = self.face_matcher.match_face_in_images(
-                                name,
-                                camera_images,
-                                distance_threshold=self.match_distance_threshold,
-                                fast_mode=not self.accuracy_mode,
-                                log_detail=self.log_detail
-                            )
+                            match = self.prematched.get((day_folder, name))
+                            if match:
+                                matched_img = match[0]
+                            else:
+                                # Chưa match theo lô, hoặc lô không tìm thấy: so từng ảnh như cũ
+                                matched_img = self.face_matcher.match_face_in_images(
+                                    name,
+                                    camera_images,
+                                    distance_threshold=self.match_distance_threshold,
+                                    fast_mode=not self.accuracy_mode,
+                                    log_detail=self.log_detail,
+                                    expected_times=expected_times_for(rec)
+                                )
                         except Exception as e:
                             if log_callback:
                                 log_callback(f"    âŒ Lá»—i OpenCV/DeepFace khi so sÃ¡nh {name}: {e}", "warning")
@@ -644,8 +655,13 @@ class ExcelToWordExporter:
                 p.alignment = WD_ALIGN_PARAGRAPH.CENTER
                 if matched_img and os.path.exists(matched_img):
                     try:
+                        # Thumbnail + ảnh cắt mặt ghi vào cache artifact lúc match, báo cáo chèn thumbnail
+                        from src.artifact_cache import get_artifact_cache
+                        artifacts = get_artifact_cache().materialize(
+                            matched_img, self.face_matcher.matched_face_box(name, matched_img)
+                        )
                         run = p.add_run()
-                        run.add_picture(matched_img, width=Cm(3))
+                        run.add_picture(artifacts['thumbnail'] or matched_img, width=Cm(3))
                         if log_callback:
                             log_callback(f"    âœ… {name}: ÄÃ£ chÃ¨n áº£nh {os.path.basename(matched_img)}", "success")
                     except Exception as e:
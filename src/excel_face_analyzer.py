@@ -15,6 +15,10 @@ import xlrd
 from openpyxl import load_workbook
 
 from src.excel_extractor import ExcelToWordExporter
+from src.day_batch_matcher import DayBatchMatcher
+from src.candidate_planner import expected_times_for
+
+CAMERA_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
 
 
 def _normalize_text(text: str) -> str:
@@ -228,6 +232,15 @@ class ExcelPersonFileParser:
         }
 
 
+def _list_day_images(day_folder: str) -> List[str]:
+    images = []
+    for root, _, files in os.walk(day_folder):
+        for f in files:
+            if os.path.splitext(f)[1].lower() in CAMERA_IMAGE_EXTENSIONS:
+                images.append(os.path.join(root, f))
+    return images
+
+
 class ExcelFaceAnalyzer:
     def __init__(
         self,
@@ -245,6 +258,48 @@ class ExcelFaceAnalyzer:
         self.match_distance_threshold = match_distance_threshold
         self.log_detail = log_detail
 
+    def _prematch(self, persons: List[Dict], log_callback=None) -> Dict:
+        """
+        Match theo lô cho mọi ngày vắng/thiếu của mọi người:
+        ảnh camera của mỗi ngày chỉ embed một lần. Chế độ chính xác quét hết ảnh
+        (không dừng sớm); người không tìm thấy được so lại từng ảnh khi xuất báo cáo
+
+        Returns:
+            {(day_folder, name): (image_path, distance) | None}
+        """
+        if not self.matcher or not self.input_images_dir:
+            return {}
+
+        engine = DayBatchMatcher(
+            self.matcher,
+            distance_threshold=self.match_distance_threshold,
+            log_callback=log_callback,
+            # Như match_face_in_images: chỉ chế độ nhanh dừng khi đã có match <= ngưỡng x 0.7
+            early_stop_ratio=None if self.accuracy_mode else 0.7
+        )
+        day_images = {}
+        for person in persons:
+            for rec in person['records']:
+                if not (rec.get('is_absent') or rec.get('missing_checkout') or rec.get('missing_checkin')):
+                    continue
+                day_str = rec['date'].split('/')[0].zfill(2)
+                day_folder = os.path.join(self.input_images_dir, day_str)
+                if day_folder not in day_images:
+                    day_images[day_folder] = (
+                        _list_day_images(day_folder) if os.path.exists(day_folder) else []
+                    )
+                if day_images[day_folder]:
+                    engine.add_query(
+                        day_folder, day_images[day_folder], person['name'], expected_times_for(rec)
+                    )
+
+        try:
+            return engine.run()
+        except Exception as e:
+            if log_callback:
+                log_callback(f"⚠️ Lỗi match theo lô, chuyển sang match từng người: {e}", "warning")
+            return {}
+
     def analyze_folder(self, input_dir: str, output_dir: str, log_callback=None) -> List[str]:
         os.makedirs(output_dir, exist_ok=True)
 
@@ -274,6 +329,8 @@ class ExcelFaceAnalyzer:
         if log_callback:
             log_callback(f"📌 Tổng số người sẽ xử lý: {len(final_persons)}", "info")
 
+        prematched = self._prematch(final_persons, log_callback)
+
         exporter = ExcelToWordExporter(
             self.portrait_dir,
             output_dir,
@@ -281,7 +338,8 @@ class ExcelFaceAnalyzer:
             face_matcher=self.matcher,
             accuracy_mode=self.accuracy_mode,
             match_distance_threshold=self.match_distance_threshold,
-            log_detail=self.log_detail
+            log_detail=self.log_detail,
+            prematched=prematched
         )
 
         results = []
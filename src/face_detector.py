@@ -5,6 +5,7 @@ Sử dụng thư viện face_recognition (tùy chọn)
 """
 
 import os
+import math
 import numpy as np
 
 try:
@@ -26,10 +27,80 @@ except ImportError:
     FACE_RECOGNITION_TOLERANCE = 0.6
     FACE_DETECTION_MODEL = "hog"
 
+try:
+    from src.config import ENROLL_TEMPLATES_K, FACE_QUALITY_MIN_SIDE, FACE_QUALITY_SHARPNESS
+except ImportError:
+    ENROLL_TEMPLATES_K = 3
+    FACE_QUALITY_MIN_SIDE = 120
+    FACE_QUALITY_SHARPNESS = 100.0
+
+from src.image_io import FaceImage
+from src.tiled_detection import detection_mode_for, detect_tiled, should_tile
+
+
+def _face_area(face_location):
+    """Diện tích khuôn mặt từ (top, right, bottom, left)"""
+    top, right, bottom, left = face_location
+    return max(0, bottom - top) * max(0, right - left)
+
+
+def _load_for_detection(image):
+    """
+    Ảnh RGB để detect (ảnh 4K được decode thu nhỏ) và hệ số quy đổi về ảnh gốc
+
+    Args:
+        image: Đường dẫn ảnh hoặc FaceImage (dùng lại ảnh đã decode)
+
+    Returns:
+        (image, factor) - image là None nếu không đọc được
+    """
+    if not CV2_AVAILABLE:
+        path = image.path if isinstance(image, FaceImage) else image
+        return face_recognition.load_image_file(path), 1
+    return FaceImage.of(image).detection_rgb()
+
+
+def _scale_location(face_location, factor):
+    """(top, right, bottom, left) trên ảnh thu nhỏ -> tọa độ ảnh gốc"""
+    if factor == 1:
+        return face_location
+    return tuple(int(v * factor) for v in face_location)
+
 
-def detect_faces(image_path):
+def _detect_tile(tile):
+    """Detect một ô cho detect_tiled: điểm = diện tích (HOG/CNN của dlib không trả điểm)"""
+    found = []
+    for top, right, bottom, left in face_recognition.face_locations(tile, model=FACE_DETECTION_MODEL):
+        found.append(((left, top, right - left, bottom - top), _face_area((top, right, bottom, left)), None))
+    return found
+
+
+def _locate_faces(image, detection_mode=None):
+    """
+    Ảnh RGB dùng để encode + vị trí khuôn mặt trên ảnh đó + hệ số quy đổi về ảnh gốc
+
+    Args:
+        image: Đường dẫn ảnh hoặc FaceImage
+        detection_mode: 'reduced' | 'tiled' (None = theo nguồn camera trong config)
     """
-    Phát hiện khuôn mặt trong ảnh
+    mode = detection_mode or detection_mode_for(image)
+    if mode == 'tiled' and CV2_AVAILABLE:
+        rgb = FaceImage.of(image).rgb
+        if rgb is not None and should_tile(rgb.shape[1], rgb.shape[0]):
+            found = detect_tiled(rgb, _detect_tile)
+            return rgb, [(y, x + w, y + h, x) for (x, y, w, h), _, _ in found], 1
+    rgb, factor = _load_for_detection(image)
+    if rgb is None:
+        return None, [], 1
+    return rgb, face_recognition.face_locations(rgb, model=FACE_DETECTION_MODEL), factor
+
+
+def detect_faces(image_path, detection_mode=None):
+    """
+    Phát hiện khuôn mặt trong ảnh (đường dẫn hoặc FaceImage)
+    
+    Args:
+        detection_mode: 'reduced' | 'tiled' (None = theo nguồn camera trong config)
     
     Returns:
         list: Danh sách vị trí khuôn mặt [(top, right, bottom, left), ...]
@@ -38,17 +109,16 @@ def detect_faces(image_path):
         return []
     
     try:
-        image = face_recognition.load_image_file(image_path)
-        face_locations = face_recognition.face_locations(image, model=FACE_DETECTION_MODEL)
-        return face_locations
+        _, face_locations, factor = _locate_faces(image_path, detection_mode)
+        return [_scale_location(loc, factor) for loc in face_locations]
     except Exception as e:
         print(f"Lỗi phát hiện khuôn mặt: {e}")
         return []
 
 
-def get_face_encoding(image_path):
+def get_face_encoding(image_path, detection_mode=None):
     """
-    Tạo encoding cho khuôn mặt trong ảnh
+    Tạo encoding cho khuôn mặt trong ảnh (đường dẫn hoặc FaceImage)
     
     Returns:
         numpy.ndarray or None: Face encoding hoặc None nếu không tìm thấy
@@ -57,14 +127,14 @@ def get_face_encoding(image_path):
         return None
     
     try:
-        image = face_recognition.load_image_file(image_path)
-        face_locations = face_recognition.face_locations(image, model=FACE_DETECTION_MODEL)
+        image, face_locations, _ = _locate_faces(image_path, detection_mode)
         
         if not face_locations:
             return None
         
-        # Lấy encoding của khuôn mặt đầu tiên (lớn nhất)
-        face_encodings = face_recognition.face_encodings(image, face_locations)
+        # Lấy encoding của khuôn mặt lớn nhất (thứ tự detect không theo kích thước)
+        largest = max(face_locations, key=_face_area)
+        face_encodings = face_recognition.face_encodings(image, [largest])
         
         if face_encodings:
             return face_encodings[0]
@@ -75,9 +145,109 @@ def get_face_encoding(image_path):
         return None
 
 
-def get_all_face_encodings(image_path):
+def _scored_face_locations(image):
+    """
+    Vị trí khuôn mặt + điểm detect của dlib (HOG: điểm SVM, CNN: confidence);
+    điểm là None nếu bản face_recognition không lộ detector của dlib
+    """
+    api = getattr(face_recognition, 'api', None)
+    try:
+        if FACE_DETECTION_MODEL == 'cnn':
+            found = [(d.rect, d.confidence) for d in api.cnn_face_detector(image, 1)]
+        else:
+            rects, scores, _ = api.face_detector.run(image, 1, 0)
+            found = list(zip(rects, scores))
+        return [
+            (api._trim_css_to_bounds(api._rect_to_css(rect), image.shape), float(score))
+            for rect, score in found
+        ]
+    except AttributeError:
+        return [(loc, None) for loc in face_recognition.face_locations(image, model=FACE_DETECTION_MODEL)]
+
+
+def face_quality(image, face_location, factor=1, detection_score=None):
+    """
+    Điểm chất lượng (0..1) của một khuôn mặt làm mẫu đăng ký:
+    tích của điểm kích thước, độ nét (phương sai Laplacian) và độ tin cậy detect
+    
+    Args:
+        image: Ảnh RGB đã dùng để detect
+        face_location: (top, right, bottom, left) trên image
+        factor: Hệ số quy đổi image về ảnh gốc
+        detection_score: Điểm detect của dlib (None = không tính)
+    """
+    top, right, bottom, left = face_location
+    side = min(bottom - top, right - left) * factor
+    size_score = min(1.0, max(0.0, side / FACE_QUALITY_MIN_SIDE))
+    
+    sharp_score = 1.0
+    if CV2_AVAILABLE:
+        face = image[max(0, top):bottom, max(0, left):right]
+        if face.size:
+            gray = cv2.cvtColor(face, cv2.COLOR_RGB2GRAY)
+            sharp_score = min(1.0, cv2.Laplacian(gray, cv2.CV_64F).var() / FACE_QUALITY_SHARPNESS)
+    
+    conf_score = 1.0
+    if detection_score is not None:
+        conf_score = 1.0 / (1.0 + math.exp(-2.0 * detection_score))
+    return float(size_score * sharp_score * conf_score)
+
+
+def get_face_template(image_path):
+    """
+    Encoding + điểm chất lượng của khuôn mặt lớn nhất trong ảnh chân dung
+    
+    Returns:
+        (encoding, quality) hoặc None nếu không tìm thấy khuôn mặt
+    """
+    if not FACE_RECOGNITION_AVAILABLE:
+        return None
+    
+    try:
+        image, factor = _load_for_detection(image_path)
+        if image is None:
+            return None
+        found = _scored_face_locations(image)
+        if not found:
+            return None
+        location, score = max(found, key=lambda item: _face_area(item[0]))
+        encodings = face_recognition.face_encodings(image, [location])
+        if not encodings:
+            return None
+        return encodings[0], face_quality(image, location, factor, score)
+    except Exception as e:
+        print(f"Lỗi tạo mẫu khuôn mặt: {e}")
+        return None
+
+
+def select_templates(candidates, k=None):
     """
-    Lấy encoding của tất cả khuôn mặt trong ảnh
+    K mẫu tốt nhất của một người
+    
+    Args:
+        candidates: [(image_path, encoding, quality)]
+        k: Số mẫu giữ lại (None = ENROLL_TEMPLATES_K)
+    
+    Returns:
+        (image_paths, ma trận encoding (k, 128)) theo chất lượng giảm dần;
+        ([], None) nếu không có mẫu nào
+    """
+    k = ENROLL_TEMPLATES_K if k is None else k
+    ranked = sorted(
+        (c for c in candidates if c[1] is not None),
+        key=lambda c: (-c[2], c[0])  # Cùng điểm: theo tên ảnh cho ổn định
+    )[:max(1, k)]
+    if not ranked:
+        return [], None
+    return [path for path, _, _ in ranked], np.vstack([np.asarray(e, dtype=np.float64) for _, e, _ in ranked])
+
+
+def get_all_face_encodings(image_path, detection_mode=None):
+    """
+    Lấy encoding của tất cả khuôn mặt trong ảnh (đường dẫn hoặc FaceImage)
+    
+    Args:
+        detection_mode: 'reduced' | 'tiled' (None = theo nguồn camera trong config)
     
     Returns:
         list: Danh sách (face_location, face_encoding)
@@ -86,15 +256,16 @@ def get_all_face_encodings(image_path):
         return []
     
     try:
-        image = face_recognition.load_image_file(image_path)
-        face_locations = face_recognition.face_locations(image, model=FACE_DETECTION_MODEL)
+        image, face_locations, factor = _locate_faces(image_path, detection_mode)
         
         if not face_locations:
             return []
         
         face_encodings = face_recognition.face_encodings(image, face_locations)
         
-        return list(zip(face_locations, face_encodings))
+        # Vị trí trả về theo tọa độ ảnh gốc (dùng để cắt mặt ở độ phân giải đầy đủ)
+        locations = [_scale_location(loc, factor) for loc in face_locations]
+        return list(zip(locations, face_encodings))
     except Exception as e:
         print(f"Lỗi lấy face encodings: {e}")
         return []
@@ -127,50 +298,106 @@ def compare_faces(known_encoding, unknown_encoding, tolerance=None):
         return False, 1.0
 
 
-def find_best_match(unknown_encoding, known_faces_dict, tolerance=None):
+class KnownFaces:
+    """
+    Encoding của database xếp thành một ma trận (n, 128) + mảng person_id và
+    metadata song song, kèm version của database lúc dựng.
+    Người có nhiều mẫu ('templates') chiếm một khối dòng liền nhau cùng person_id -
+    argmin trên cả ma trận chọn luôn mẫu gần nhất của mỗi người.
+    """
+
+    def __init__(self, person_ids, matrix, metadata, version=0):
+        self.person_ids = person_ids
+        self.matrix = matrix
+        self.metadata = metadata
+        self.version = version
+        self.sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+
+    @classmethod
+    def from_dict(cls, known_faces_dict, version=0):
+        """Dựng từ dict {person_id: {'encoding' hoặc 'templates': ..., 'branch': ..., 'name': ...}}"""
+        person_ids, blocks, metadata = [], [], []
+        for person_id, person_data in known_faces_dict.items():
+            block = person_data.get('templates')
+            if block is None:
+                block = person_data.get('encoding')
+            if block is None:
+                continue
+            block = np.atleast_2d(np.asarray(block, dtype=np.float64))
+            person_ids.extend([person_id] * len(block))
+            blocks.append(block)
+            metadata.extend([person_data] * len(block))
+        matrix = np.vstack(blocks) if blocks else np.zeros((0, 128))
+        return cls(person_ids, matrix, metadata, version)
+
+    def __len__(self):
+        return len(self.person_ids)
+
+    def distances(self, unknown_encodings):
+        """Khoảng cách euclid (n_unknown, n_known) - cùng giá trị với face_recognition.face_distance"""
+        queries = np.atleast_2d(np.asarray(unknown_encodings, dtype=np.float64))
+        q_sq = np.einsum('ij,ij->i', queries, queries)[:, None]
+        d_sq = q_sq + self.sq_norms[None, :] - 2.0 * (queries @ self.matrix.T)
+        return np.sqrt(np.maximum(d_sq, 0.0))
+
+
+def find_best_match(unknown_encoding, known_faces, tolerance=None):
     """
     Tìm khuôn mặt phù hợp nhất trong database
     
     Args:
-        unknown_encoding: Encoding của khuôn mặt cần tìm
-        known_faces_dict: Dict {person_id: {'encoding': ..., 'branch': ..., 'name': ...}}
+        unknown_encoding: Encoding của khuôn mặt cần tìm, hoặc một lô encoding (n, 128)
+        known_faces: KnownFaces hoặc dict {person_id: {'encoding': ..., 'branch': ..., 'name': ...}}
         tolerance: Ngưỡng so sánh
     
     Returns:
         dict or None: Thông tin người phù hợp nhất hoặc None
+        (với một lô encoding: list kết quả theo thứ tự đầu vào)
     """
-    if not FACE_RECOGNITION_AVAILABLE or unknown_encoding is None:
+    if unknown_encoding is None:
         return None
+    batch = np.ndim(unknown_encoding) == 2
+    if not FACE_RECOGNITION_AVAILABLE:
+        return [None] * len(unknown_encoding) if batch else None
     
     if tolerance is None:
         tolerance = FACE_RECOGNITION_TOLERANCE
+    if not isinstance(known_faces, KnownFaces):
+        known_faces = KnownFaces.from_dict(known_faces)
     
-    best_match = None
-    best_distance = float('inf')
+    count = len(unknown_encoding) if batch else 1
+    if not len(known_faces) or not count:
+        return [None] * count if batch else None
     
-    for person_id, person_data in known_faces_dict.items():
-        known_encoding = person_data.get('encoding')
-        if known_encoding is None:
-            continue
-        
-        is_match, distance = compare_faces(known_encoding, unknown_encoding, tolerance)
-        
-        if is_match and distance < best_distance:
-            best_distance = distance
-            best_match = {
-                'person_id': person_id,
-                'branch': person_data.get('branch', 'Unknown'),
-                'name': person_data.get('name', 'Unknown'),
-                'distance': distance,
-                'confidence': round((1 - distance) * 100, 2)  # Chuyển sang %
-            }
-    
-    return best_match
+    # Một phép tính khoảng cách cho cả lô, argmin theo từng encoding
+    distances = known_faces.distances(unknown_encoding)
+    best = np.argmin(distances, axis=1)
+    results = []
+    for row, col in enumerate(best):
+        distance = float(distances[row, col])
+        if distance <= tolerance:
+            results.append(make_match_result(
+                known_faces.person_ids[col], known_faces.metadata[col], distance
+            ))
+        else:
+            results.append(None)
+    return results if batch else results[0]
+
+
+def make_match_result(person_id, person_data, distance):
+    """Kết quả nhận diện cho một người trong database"""
+    return {
+        'person_id': person_id,
+        'branch': person_data.get('branch', 'Unknown'),
+        'name': person_data.get('name', 'Unknown'),
+        'distance': distance,
+        'confidence': round((1 - distance) * 100, 2)  # Chuyển sang %
+    }
 
 
 def extract_face_image(image_path, face_location, padding=20):
     """
-    Cắt khuôn mặt từ ảnh
+    Cắt khuôn mặt từ ảnh (đường dẫn hoặc FaceImage)
     
     Returns:
         numpy.ndarray: Ảnh khuôn mặt đã cắt
@@ -179,21 +406,7 @@ def extract_face_image(image_path, face_location, padding=20):
         return None
         
     try:
-        image = cv2.imread(image_path)
-        if image is None:
-            return None
-        
-        top, right, bottom, left = face_location
-        height, width = image.shape[:2]
-        
-        # Thêm padding
-        top = max(0, top - padding)
-        left = max(0, left - padding)
-        bottom = min(height, bottom + padding)
-        right = min(width, right + padding)
-        
-        face_image = image[top:bottom, left:right]
-        return face_image
+        return FaceImage.of(image_path).crop(face_location, padding)
     except Exception as e:
         print(f"Lỗi cắt khuôn mặt: {e}")
         return None
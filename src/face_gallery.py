@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Module gallery embedding chân dung - giữ toàn bộ template trong một ma trận
+float32 liên tục để so sánh ảnh camera bằng một phép nhân ma trận.
+Embedding camera có thể ở dạng nén (QuantizedMatrix) - tính trực tiếp, không giải nén.
+Mỗi người có thêm tâm (centroid) + bán kính các template: khi biết ngưỡng, ảnh
+camera được sàng trước với tâm, chỉ ảnh lọt sàng mới so với đủ các template.
+"""
+
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from src.quantization import QuantizedMatrix
+
+try:
+    from src.config import CENTROID_SCREEN_MARGIN
+except ImportError:
+    CENTROID_SCREEN_MARGIN = 0.0
+
+
+def _as_matrix(vectors) -> np.ndarray:
+    """Chuyển 1 vector hoặc danh sách vector thành ma trận float32 2 chiều"""
+    mat = np.asarray(vectors, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat[None, :]
+    return np.ascontiguousarray(mat)
+
+
+def l2_normalize(vectors) -> np.ndarray:
+    """Chuẩn hóa L2 từng dòng (dòng toàn 0 giữ nguyên)"""
+    mat = _as_matrix(vectors)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    return mat / np.maximum(norms, 1e-12)
+
+
+class FaceGallery:
+    """
+    Ma trận template chân dung dùng chung cho mọi người.
+
+    Các template của cùng một người nằm liền nhau (span [start, end)),
+    nên khoảng cách tới một người chỉ là một view của ma trận, không copy.
+    Với metric cosine, template được chuẩn hóa sẵn khi thêm vào.
+    """
+
+    def __init__(self, distance_metric: str = "cosine", screen_margin: Optional[float] = CENTROID_SCREEN_MARGIN):
+        """
+        Args:
+            distance_metric: cosine hoặc euclidean
+            screen_margin: Nới ngưỡng khi sàng bằng tâm (0 = không bỏ sót match nào,
+                           âm = sàng chặt hơn, None = tắt sàng)
+        """
+        self.distance_metric = distance_metric
+        self.screen_margin = screen_margin
+        self.persons: List[str] = []
+        self.paths: List[str] = []
+        self._spans: Dict[str, Tuple[int, int]] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._pending: List[np.ndarray] = []
+        self._screen = None  # (tên -> cột, tâm, |tâm|^2, bán kính) dựng lại khi gallery đổi
+        self._lock = threading.Lock()  # Warm-up nền và request có thể nạp cùng lúc
+
+    def __contains__(self, person_name: str) -> bool:
+        return person_name in self._spans
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def _prepare(self, vectors):
+        if isinstance(vectors, QuantizedMatrix):
+            return vectors  # Chuẩn hóa khi tính khoảng cách (_distances)
+        if self.distance_metric == "cosine":
+            return l2_normalize(vectors)
+        return _as_matrix(vectors)
+
+    def add_person(self, person_name: str, paths: List[str], embeddings) -> int:
+        """
+        Thêm template của một người (gọi lại sẽ bỏ qua)
+
+        Returns:
+            Số template của người đó trong gallery
+        """
+        with self._lock:
+            if person_name in self._spans:
+                start, end = self._spans[person_name]
+                return end - start
+
+            start = len(self.paths)
+            if len(paths):
+                self._pending.append(self._prepare(embeddings))
+                self.paths.extend(paths)
+            self._spans[person_name] = (start, len(self.paths))
+            self.persons.append(person_name)
+            return len(paths)
+
+    def remove_person(self, person_name: str) -> bool:
+        """
+        Bỏ template của một người (ảnh chân dung đã đổi/xóa) - lần match sau nạp lại
+
+        Returns:
+            False nếu người chưa có trong gallery
+        """
+        matrix = self.matrix  # Gộp các dòng đang chờ trước khi xóa
+        with self._lock:
+            span = self._spans.pop(person_name, None)
+            if span is None:
+                return False
+            start, end = span
+            removed = end - start
+            self.persons.remove(person_name)
+            if removed:
+                self._matrix = np.ascontiguousarray(np.delete(matrix, np.s_[start:end], axis=0))
+                self._sq_norms = np.delete(self._sq_norms, np.s_[start:end])
+                del self.paths[start:end]
+                for name, (s, e) in self._spans.items():
+                    if s >= end:
+                        self._spans[name] = (s - removed, e - removed)
+            self._screen = None
+            return True
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Ma trận template (n_templates, dim) - gộp các dòng mới thêm nếu có"""
+        if self._pending:
+            with self._lock:
+                if self._pending:
+                    blocks = [self._matrix] if self._matrix.size else []
+                    matrix = np.ascontiguousarray(np.vstack(blocks + self._pending))
+                    self._sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+                    self._matrix = matrix
+                    self._pending = []
+        return self._matrix
+
+    def template_count(self, person_name: str) -> int:
+        start, end = self._spans.get(person_name, (0, 0))
+        return end - start
+
+    def _dots(self, queries, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tích vô hướng query với các điểm và |query|^2 (với cosine: query coi như đã chuẩn hóa)
+
+        Returns:
+            (sims (n_q, n_p), q_sq (n_q, 1))
+        """
+        if isinstance(queries, QuantizedMatrix):
+            sims = queries.dot(points)
+            q_sq = queries.sq_norms()[:, None]
+            if self.distance_metric == "cosine":
+                sims = sims / np.sqrt(np.maximum(q_sq, 1e-24))
+                q_sq = np.ones_like(q_sq)
+            return sims, q_sq
+        sims = queries @ points.T
+        if self.distance_metric == "cosine":
+            return sims, np.ones((len(queries), 1), dtype=np.float32)
+        return sims, np.einsum('ij,ij->i', queries, queries)[:, None]
+
+    def _distances(self, queries, start: int, end: int) -> np.ndarray:
+        sims, q_sq = self._dots(queries, self.matrix[start:end])
+        if self.distance_metric == "cosine":
+            return 1.0 - sims
+        d_sq = q_sq + self._sq_norms[start:end][None, :] - 2.0 * sims
+        return np.sqrt(np.maximum(d_sq, 0.0))
+
+    def _get_screen(self):
+        """Tâm và bán kính (khoảng cách euclid xa nhất từ tâm tới template) của từng người"""
+        matrix = self.matrix
+        with self._lock:
+            screen = self._screen
+            if screen is not None and screen[0] == len(matrix) == len(self.paths):
+                return screen[1:]
+            columns, centroids, radii = {}, [], []
+            for name in self.persons:
+                start, end = self._spans[name]
+                if end <= start or end > len(matrix):
+                    continue
+                templates = matrix[start:end]
+                centroid = templates.mean(axis=0)
+                columns[name] = len(centroids)
+                centroids.append(centroid)
+                radii.append(float(np.sqrt(((templates - centroid) ** 2).sum(axis=1).max())))
+            if not centroids:
+                return {}, None, None, None
+            centroids = np.ascontiguousarray(np.vstack(centroids), dtype=np.float32)
+            c_sq = np.einsum('ij,ij->i', centroids, centroids)
+            radii = np.asarray(radii, dtype=np.float32)
+            self._screen = (len(matrix), columns, centroids, c_sq, radii)
+            return columns, centroids, c_sq, radii
+
+    def _lower_bounds(self, queries, person_names: List[str]) -> Optional[np.ndarray]:
+        """
+        Cận dưới khoảng cách tới mọi template của từng người (bất đẳng thức tam giác
+        trong không gian euclid: |q - t| >= |q - tâm| - bán kính)
+
+        Returns:
+            Ma trận (n_queries, n_persons), None nếu gallery rỗng hoặc sàng không có lợi
+            (các người cần so có ít template - so thẳng rẻ hơn); người chưa có tâm
+            (vừa thêm trong lúc tính) nhận cận 0 - luôn so đủ template
+        """
+        if sum(self.template_count(name) for name in person_names) <= len(person_names):
+            return None
+        columns, centroids, c_sq, radii = self._get_screen()
+        if centroids is None:
+            return None
+        # Chỉ tính với tâm của các người được hỏi
+        wanted = [(j, columns[name]) for j, name in enumerate(person_names) if name in columns]
+        result = np.zeros((len(queries), len(person_names)), dtype=np.float32)
+        if not wanted:
+            return result
+        cols = np.array([col for _, col in wanted])
+        sims, q_sq = self._dots(queries, centroids[cols])
+        to_centroid = np.sqrt(np.maximum(q_sq + c_sq[cols][None, :] - 2.0 * sims, 0.0))
+        bound = np.maximum(to_centroid - radii[cols][None, :], 0.0)
+        if self.distance_metric == "cosine":
+            bound = bound * bound / 2.0  # |a - b|^2 = 2(1 - cos) với vector chuẩn hóa
+        result[:, [j for j, _ in wanted]] = bound
+        return result
+
+    def person_distances(self, person_name: str, queries) -> np.ndarray:
+        """Khoảng cách (n_queries, n_templates) giữa các embedding camera và template của 1 người"""
+        start, end = self._spans.get(person_name, (0, 0))
+        q = self._prepare(queries)
+        if end <= start:
+            return np.zeros((len(q), 0), dtype=np.float32)
+        return self._distances(q, start, end)
+
+    def min_distances(
+        self,
+        person_name: str,
+        queries,
+        threshold: Optional[float] = None
+    ) -> Optional[np.ndarray]:
+        """
+        Khoảng cách nhỏ nhất tới template của 1 người cho mỗi embedding camera
+        (có threshold: embedding chắc chắn xa hơn ngưỡng nhận +inf, không so đủ template)
+        """
+        if self.template_count(person_name) == 0:
+            return None
+        return self.persons_min_distances([person_name], queries, threshold)[:, 0]
+
+    def persons_min_distances(
+        self,
+        person_names: List[str],
+        queries,
+        threshold: Optional[float] = None
+    ) -> np.ndarray:
+        """
+        Khoảng cách nhỏ nhất tới từng người cho mỗi embedding camera
+
+        Args:
+            threshold: Ngưỡng match - nếu có, sàng bằng tâm trước; cặp (ảnh, người)
+                       bị loại nhận +inf (khoảng cách thật chắc chắn > ngưỡng + margin)
+
+        Returns:
+            Ma trận (n_queries, n_persons); người không có template nhận +inf
+        """
+        q = self._prepare(queries)
+        result = np.full((len(q), len(person_names)), np.inf, dtype=np.float32)
+        if not len(self.paths) or not len(q):
+            return result
+
+        bounds = None
+        if threshold is not None and self.screen_margin is not None:
+            bounds = self._lower_bounds(q, person_names)
+        if bounds is None:
+            spans = [(j, self._spans.get(name, (0, 0))) for j, name in enumerate(person_names)]
+            requested = sum(end - start for _, (start, end) in spans if end > start)
+            # Ít người (vd. match một người): chỉ so template của họ, không so cả gallery
+            dists = self._distances(q, 0, len(self.paths)) if requested >= len(self.paths) else None
+            for j, (start, end) in spans:
+                if end > start:
+                    block = dists[:, start:end] if dists is not None else self._distances(q, start, end)
+                    result[:, j] = block.min(axis=1)
+            return result
+
+        # Chỉ so đủ template với các ảnh lọt sàng
+        limit = threshold + self.screen_margin + 1e-6  # Chừa sai số làm tròn float32
+        for j, name in enumerate(person_names):
+            start, end = self._spans.get(name, (0, 0))
+            if end <= start:
+                continue
+            rows = np.flatnonzero(bounds[:, j] <= limit)
+            if not len(rows):
+                continue
+            if len(rows) == len(q):
+                subset = q
+            elif isinstance(q, QuantizedMatrix):
+                subset = q.take(rows)
+            else:
+                subset = q[rows]
+            result[rows, j] = self._distances(subset, start, end).min(axis=1)
+        return result
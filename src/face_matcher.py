@@ -5,54 +5,143 @@ Module nháº­n diá»‡n khuÃ´n máº·t - so sÃ¡nh áº£nh camera vá»
 
 import os
 import re
-import shutil
-import tempfile
+import threading
 import unicodedata
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Union
 import numpy as np
 
-# Lazy loading Ä‘á»ƒ trÃ¡nh import lá»—i
+from src.face_gallery import FaceGallery
+from src.name_index import NameIndex
+from src.image_io import load_image, FaceImage, DETECTION_MAX_SIDE
+from src.candidate_planner import get_candidate_planner
+from src.embedding_store import (
+    EmbeddingStore, FaceArena, DetectedFaces, PRUNED, content_hash, make_faces
+)
+from src.quantization import as_float, stack_embeddings
+from src.lru_cache import StripedCache
+from src.tiled_detection import detection_mode_for, detect_tiled, should_tile
+
+try:
+    from src.config import EMBEDDING_DTYPE, EMBEDDING_CACHE_MB, CACHE_STRIPES, CACHE_EVICTION
+except ImportError:
+    EMBEDDING_DTYPE = "float32"
+    EMBEDDING_CACHE_MB = 512
+    CACHE_STRIPES = 8
+    CACHE_EVICTION = "lru"
+
+# Lazy loading để tránh import lỗi
 _deepface = None
 
-# ThÆ° má»¥c temp Ä‘á»ƒ lÆ°u áº£nh táº¡m (trÃ¡nh lá»—i Ä‘Æ°á»ng dáº«n tiáº¿ng Viá»‡t)
-_temp_dir = None
+# Thống kê số ảnh camera dừng lại ở từng tầng của pipeline
+STAGE_STATS_LABELS = {
+    'frames': 'Ảnh camera',
+    'cache_hits': 'Lấy từ cache',
+    'pruned': 'Bị lọc nhanh (Haar)',
+    'no_face': 'Detector không thấy mặt',
+    'with_faces': 'Ảnh có mặt',
+    'faces': 'Khuôn mặt đã embedding',
+    'errors': 'Lỗi đọc/inference',
+}
+
+
+def _facial_area_box(area) -> Tuple[float, float, float, float]:
+    """facial_area của DeepFace -> (x, y, w, h)"""
+    area = area or {}
+    return (area.get("x", 0), area.get("y", 0), area.get("w", 0), area.get("h", 0))
 
-def get_temp_dir():
-    """Láº¥y hoáº·c táº¡o thÆ° má»¥c temp"""
-    global _temp_dir
-    if _temp_dir is None or not os.path.exists(_temp_dir):
-        _temp_dir = tempfile.mkdtemp(prefix="face_matcher_")
-    return _temp_dir
 
-def copy_to_ascii_path(src_path: str) -> str:
+def _is_no_face_error(error: Exception) -> bool:
     """
-    Copy file sang thÆ° má»¥c temp vá»›i tÃªn ASCII
-    Giáº£i quyáº¿t lá»—i DeepFace khÃ´ng Ä‘á»c Ä‘Æ°á»£c Ä‘Æ°á»ng dáº«n tiáº¿ng Viá»‡t
+    ValueError của DeepFace do không detect được khuôn mặt (kết quả hợp lệ, được cache);
+    ValueError khác (ảnh hỏng, sai tham số model/detector...) là lỗi - không cache
     """
-    if not os.path.exists(src_path):
-        print(f"  [copy_to_ascii] Source khÃ´ng tá»“n táº¡i: {src_path}")
-        return src_path
-    
-    # LuÃ´n copy Ä‘á»ƒ trÃ¡nh lá»—i encoding
+    return isinstance(error, ValueError) and "Face could not be detected" in str(error)
+
+
+def represent_faces(
+    image: np.ndarray,
+    model_name: str,
+    detector_backend: str,
+    enforce_detection: bool
+) -> Optional[DetectedFaces]:
+    """
+    DeepFace.represent trên ảnh đã decode -> mọi khuôn mặt (None nếu không có mặt)
+    Dùng chung cho FaceMatcher và worker của InferencePool
+    """
+    DeepFace = get_deepface()
+    if DeepFace is None:
+        raise RuntimeError("DeepFace chưa được cài đặt")
     try:
-        # Táº¡o tÃªn file ASCII dá»±a trÃªn hash
-        ext = os.path.splitext(src_path)[1]
-        # DÃ¹ng abs path Ä‘á»ƒ hash unique hÆ¡n
-        abs_path = os.path.abspath(src_path)
-        ascii_name = f"img_{hash(abs_path) & 0xFFFFFFFF}{ext}"
-        
-        temp_dir = get_temp_dir()
-        dst_path = os.path.join(temp_dir, ascii_name)
-        
-        # Copy náº¿u chÆ°a tá»“n táº¡i hoáº·c source má»›i hÆ¡n
-        if (not os.path.exists(dst_path) or
-                os.path.getmtime(src_path) > os.path.getmtime(dst_path)):
-            shutil.copy2(src_path, dst_path)
-        
-        return dst_path
-    except Exception as e:
-        print(f"  [copy_to_ascii] Error: {e}")
-        return src_path
+        reps = DeepFace.represent(
+            img_path=image,
+            model_name=model_name,
+            detector_backend=detector_backend,
+            enforce_detection=enforce_detection
+        )
+    except ValueError as e:
+        # DeepFace báo lỗi ValueError khi không detect được khuôn mặt
+        if not _is_no_face_error(e):
+            raise
+        reps = []
+
+    return make_faces(
+        [np.asarray(rep["embedding"], dtype=np.float32) for rep in reps],
+        [_facial_area_box(rep.get("facial_area")) for rep in reps],
+        [rep.get("face_confidence", 0.0) or 0.0 for rep in reps],
+    )
+
+
+def _full_resolution(image) -> Optional[np.ndarray]:
+    """Ảnh BGR đầy đủ nếu cần chia ô (ảnh lớn hơn hẳn một ô), ngược lại None"""
+    source = FaceImage.of(image).bgr if isinstance(image, (str, FaceImage)) else image
+    if source is None:
+        raise IOError(f"Không đọc được ảnh: {getattr(image, 'path', image)}")
+    return source if should_tile(source.shape[1], source.shape[0]) else None
+
+
+def represent_image(
+    image: Union[str, np.ndarray],
+    model_name: str,
+    detector_backend: str,
+    enforce_detection: bool,
+    detection_mode: Optional[str] = None
+) -> Optional[DetectedFaces]:
+    """
+    represent_faces cho đường dẫn, FaceImage hoặc ảnh đã decode. Ảnh từ file được
+    decode thu nhỏ (ảnh 4K) và bbox được quy đổi về tọa độ ảnh gốc; chế độ 'tiled'
+    chạy từng ô ở độ phân giải gốc rồi gộp bằng NMS.
+    Ném IOError nếu không đọc được ảnh (kết quả lỗi không được ghi cache)
+    """
+    if isinstance(image, str):
+        image = FaceImage(image)  # Decode một lần cho cả kiểm tra kích thước lẫn detect
+    if (detection_mode or detection_mode_for(image)) == 'tiled':
+        source = _full_resolution(image)
+        if source is not None:
+            def detect(tile):
+                faces = represent_faces(tile, model_name, detector_backend, enforce_detection)
+                if faces is None:
+                    return []
+                return [(tuple(box), float(score), embedding)
+                        for embedding, box, score in zip(faces.embeddings, faces.boxes, faces.scores)]
+
+            found = detect_tiled(source, detect)
+            return make_faces(
+                [embedding for _, _, embedding in found],
+                [box for box, _, _ in found],
+                [score for _, score, _ in found],
+            )
+
+    factor = 1
+    if isinstance(image, (str, FaceImage)):
+        path = getattr(image, 'path', image)
+        image, factor = FaceImage.of(image).detection_bgr()
+        if image is None:
+            raise IOError(f"Không đọc được ảnh: {path}")
+    faces = represent_faces(image, model_name, detector_backend, enforce_detection)
+    if faces is not None and factor != 1:
+        faces = faces._replace(boxes=faces.boxes * factor)
+    return faces
+
 
 def get_deepface():
     """Lazy load DeepFace Ä‘á»ƒ giáº£m thá»i gian khá»Ÿi Ä‘á»™ng"""
@@ -93,9 +182,11 @@ def calculate_name_similarity(name1: str, name2: str) -> float:
     TÃ­nh Ä‘á»™ tÆ°Æ¡ng Ä‘á»“ng giá»¯a 2 tÃªn (0.0 - 1.0)
     Sá»­ dá»¥ng thuáº­t toÃ¡n Ä‘Æ¡n giáº£n dá»±a trÃªn substring matching
     """
-    n1 = normalize_vietnamese(name1)
-    n2 = normalize_vietnamese(name2)
-    
+    return normalized_name_similarity(normalize_vietnamese(name1), normalize_vietnamese(name2))
+
+
+def normalized_name_similarity(n1: str, n2: str) -> float:
+    """Như calculate_name_similarity nhưng nhận tên đã qua normalize_vietnamese"""
     if not n1 or not n2:
         return 0.0
     
@@ -123,6 +214,8 @@ def calculate_name_similarity(name1: str, name2: str) -> float:
 class FaceMatcher:
     """So sÃ¡nh khuÃ´n máº·t giá»¯a áº£nh camera vÃ  áº£nh chÃ¢n dung"""
     
+    PORTRAIT_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+
     def __init__(
         self,
         portrait_dir: str,
@@ -130,7 +223,14 @@ class FaceMatcher:
         detector_backend: str = "retinaface",
         distance_metric: str = "cosine",
         enforce_detection: bool = True,
-        log_callback=None
+        log_callback=None,
+        store_dir: Optional[str] = None,
+        batch_size: int = 16,
+        inference_pool=None,
+        prefilter=None,
+        embedding_dtype: str = EMBEDDING_DTYPE,
+        cache_mb: int = EMBEDDING_CACHE_MB,
+        detection_mode: Optional[str] = None
     ):
         """
         Args:
@@ -140,16 +240,44 @@ class FaceMatcher:
             distance_metric: Metric so sánh (cosine/euclidean)
             enforce_detection: Bắt buộc detect mặt để tăng độ chính xác
             log_callback: Hàm callback để gửi log (optional)
+            store_dir: Thư mục lưu embedding xuống đĩa (None = chỉ cache trong RAM)
+            batch_size: Số ảnh/khuôn mặt mỗi lần chạy model nhận diện
+            inference_pool: InferencePool để chạy inference trên process riêng (None = trong process này)
+            prefilter: FacePrefilter loại nhanh ảnh camera không có mặt (None = tắt)
+            embedding_dtype: Kiểu lưu embedding ảnh camera trong RAM/trên đĩa (float32/float16/int8)
+            cache_mb: Ngân sách RAM (MB) cho cache embedding theo đường dẫn (0 = không giới hạn)
+            detection_mode: 'reduced' (decode thu nhỏ ảnh lớn) hoặc 'tiled' (chia ô, giữ mặt nhỏ);
+                            None = chọn theo nguồn camera (DETECTION_MODES trong config)
         """
         self.portrait_dir = portrait_dir
         self.model_name = model_name
         self.detector_backend = detector_backend
         self.distance_metric = distance_metric
         self.enforce_detection = enforce_detection
+        self.detection_mode = detection_mode
         self.portrait_cache = {}  # {person_name: [portrait_paths]}
-        self._embedding_cache = {}  # {path: (mtime, embedding)}
+        self.name_index = None  # NameIndex trên các key của portrait_cache
+        # Watcher thay portrait_cache/name_index/gallery bằng bản mới dựng xong (request đang
+        # chạy vẫn đọc bản cũ); lock chỉ để các lần cập nhật không ghi đè lẫn nhau
+        self._portraits_lock = threading.Lock()
+        self.embedding_dtype = embedding_dtype
+        # Cache RAM theo đường dẫn ảnh: LRU giới hạn byte, chia stripe để các thread không chặn nhau
+        stripe_bytes = cache_mb * 1024 * 1024 // max(1, CACHE_STRIPES)
+        self._embedding_cache = StripedCache(
+            lambda: FaceArena(embedding_dtype, stripe_bytes, CACHE_EVICTION), CACHE_STRIPES
+        )
+        self.gallery = FaceGallery(distance_metric)  # Template chân dung dạng ma trận
+        self.batch_size = batch_size
+        self.inference_pool = inference_pool
+        self.prefilter = prefilter
+        self.stage_stats = dict.fromkeys(STAGE_STATS_LABELS, 0)
+        self._batch_backend = None  # (model, preprocessing) cho batch inference
+        self.store_dir = store_dir
+        self._stores: Dict[str, EmbeddingStore] = {}  # {biến thể: kho} - mỗi chế độ detect một kho
+        self._stores_lock = threading.Lock()
         self.log_callback = log_callback
         self._scan_portraits()
+        self._build_name_index()
 
     def _log(self, message: str, log_type: str = "default"):
         """Gá»­i log qua callback hoáº·c print"""
@@ -163,29 +291,7 @@ class FaceMatcher:
             print(f"ThÆ° má»¥c áº£nh chÃ¢n dung khÃ´ng tá»“n táº¡i: {self.portrait_dir}")
             return
         
-        supported_ext = {'.jpg', '.jpeg', '.png', '.bmp'}
-        
-        for item in os.listdir(self.portrait_dir):
-            item_path = os.path.join(self.portrait_dir, item)
-            
-            if os.path.isdir(item_path):
-                # ThÆ° má»¥c con = tÃªn ngÆ°á»i
-                person_name = item
-                images = []
-                for file in os.listdir(item_path):
-                    ext = os.path.splitext(file)[1].lower()
-                    if ext in supported_ext:
-                        images.append(os.path.join(item_path, file))
-                
-                if images:
-                    self.portrait_cache[person_name] = images
-            else:
-                # File trá»±c tiáº¿p = tÃªn file lÃ  tÃªn ngÆ°á»i
-                ext = os.path.splitext(item)[1].lower()
-                if ext in supported_ext:
-                    person_name = os.path.splitext(item)[0]
-                    self.portrait_cache[person_name] = [item_path]
-        
+        self.portrait_cache = self._collect_portraits()
         print(f"ÄÃ£ load {len(self.portrait_cache)} ngÆ°á»i tá»« thÆ° má»¥c chÃ¢n dung")
     
     def find_portrait(self, person_name: str) -> Optional[str]:
@@ -198,78 +304,588 @@ class FaceMatcher:
         TÃ¬m Táº¤T Cáº¢ áº£nh chÃ¢n dung cho má»™t ngÆ°á»i
         Há»— trá»£ matching tÃªn tiáº¿ng Viá»‡t cÃ³/khÃ´ng dáº¥u
         """
+        cached_name = self._resolve_portrait_name(person_name)
+        if cached_name is None:
+            return []
+        return self.portrait_cache.get(cached_name, [])
+
+    def _resolve_portrait_name(self, person_name: str) -> Optional[str]:
+        """Tìm key trong portrait_cache tương ứng với tên người"""
         # 1. Exact match
         if person_name in self.portrait_cache:
-            return self.portrait_cache[person_name]
+            return person_name
         
-        # 2. Normalize vÃ  tÃ¬m exact match sau khi chuáº©n hÃ³a
+        if self.name_index is None:
+            self._build_name_index()
+
+        # 2. Exact match sau khi chuẩn hóa (bảng băm)
+        exact = self.name_index.exact(person_name)
+        if exact is not None:
+            return exact
+
         person_normalized = normalize_vietnamese(person_name)
-        
-        for cached_name, images in self.portrait_cache.items():
-            cached_normalized = normalize_vietnamese(cached_name)
-            
-            # Exact match sau khi normalize
-            if person_normalized == cached_normalized:
-                return images
-        
-        # 3. Fuzzy match vá»›i similarity score
-        best_images = None
+        substring_hits = self.name_index.substring_matches(person_name)
+
+        # 3. Fuzzy match với similarity score (yêu cầu ít nhất 70% tương đồng).
+        #    Điểm >= 0.7 chỉ đạt được khi là chuỗi con hoặc chung tiền tố dài
+        #    >= 70% tên cần tìm - chỉ chấm điểm các ứng viên đó, theo thứ tự cũ.
+        best_name = None
         best_score = 0.0
-        min_threshold = 0.7  # YÃªu cáº§u Ã­t nháº¥t 70% tÆ°Æ¡ng Ä‘á»“ng
-        
-        for cached_name, images in self.portrait_cache.items():
-            score = calculate_name_similarity(person_name, cached_name)
-            
-            if score > best_score and score >= min_threshold:
-                best_score = score
-                best_images = images
-        
-        if best_images:
-            return best_images
-        
-        # 4. Fallback: substring match
-        for cached_name, images in self.portrait_cache.items():
-            cached_normalized = normalize_vietnamese(cached_name)
-            
-            if person_normalized in cached_normalized or cached_normalized in person_normalized:
-                return images
-        
-        return []
+        min_threshold = 0.7
+        if person_normalized:
+            prefix = person_normalized[:int(len(person_normalized) * min_threshold)]
+            candidates = set(substring_hits) | set(self.name_index.with_prefix(prefix))
+            for ordinal in sorted(candidates):
+                score = normalized_name_similarity(
+                    person_normalized, self.name_index.normalized[ordinal]
+                )
+                if score > best_score and score >= min_threshold:
+                    best_score = score
+                    best_name = self.name_index.names[ordinal]
+
+        if best_name:
+            return best_name
+
+        # 4. Fallback: substring match (tên đầu tiên theo thứ tự quét)
+        if substring_hits:
+            return self.name_index.names[substring_hits[0]]
+
+        return None
+
+    def _build_name_index(self):
+        """Dựng chỉ mục tên chân dung (gọi sau khi quét thư mục)"""
+        self.name_index = NameIndex(self.portrait_cache.keys(), normalizer=normalize_vietnamese)
+
+    def _collect_portraits(self, only: Optional[str] = None) -> Dict[str, List[str]]:
+        """
+        Đọc thư mục chân dung thành {tên người: [ảnh]}
+
+        Args:
+            only: Chỉ lấy một người (cùng quy tắc với lần quét toàn bộ)
+        """
+        portraits = {}
+        if not os.path.isdir(self.portrait_dir):
+            return portraits
+
+        supported_ext = self.PORTRAIT_EXTENSIONS
+        for item in os.listdir(self.portrait_dir):
+            item_path = os.path.join(self.portrait_dir, item)
+
+            if os.path.isdir(item_path):
+                # Thư mục con = tên người
+                person_name = item
+                if only is not None and person_name != only:
+                    continue
+                images = []
+                for file in os.listdir(item_path):
+                    ext = os.path.splitext(file)[1].lower()
+                    if ext in supported_ext:
+                        images.append(os.path.join(item_path, file))
+
+                if images:
+                    portraits[person_name] = images
+            else:
+                # File trực tiếp = tên file là tên người
+                person_name, ext = os.path.splitext(item)
+                if ext.lower() in supported_ext and (only is None or person_name == only):
+                    portraits[person_name] = [item_path]
+        return portraits
+
+    def _portrait_entry(self, person_name: str) -> List[str]:
+        """Ảnh chân dung hiện có trên đĩa của một người (thư mục con hoặc file trực tiếp)"""
+        return self._collect_portraits(only=person_name).get(person_name, [])
+
+    def refresh_portraits(self, paths: List[str]) -> List[str]:
+        """
+        Cập nhật portrait_cache, template trong gallery và cache embedding theo các
+        file/thư mục đã đổi (gọi từ watcher thay vì dựng lại FaceMatcher)
+
+        Returns:
+            Tên người đã cập nhật
+        """
+        root = os.path.abspath(self.portrait_dir)
+        names = set()
+        for path in paths:
+            path = os.path.abspath(path)
+            self._embedding_cache.pop(self._cache_key(path))
+            rel = os.path.relpath(path, root)
+            if rel == os.curdir:
+                return self._rescan_portraits()  # Watcher mất sự kiện: quét lại toàn bộ
+            if rel.startswith(os.pardir):
+                continue
+            parts = rel.split(os.sep)
+            stem, ext = os.path.splitext(parts[0])
+            if len(parts) == 1 and ext.lower() in self.PORTRAIT_EXTENSIONS and not os.path.isdir(path):
+                names.add(stem)  # File trực tiếp = tên file là tên người
+            else:
+                names.add(parts[0])  # Thư mục con = tên người
+
+        with self._portraits_lock:
+            portrait_cache = dict(self.portrait_cache)
+            keys_changed = False
+            for name in sorted(names):
+                images = self._portrait_entry(name)
+                old = portrait_cache.get(name)
+                if images:
+                    portrait_cache[name] = images
+                else:
+                    portrait_cache.pop(name, None)
+                keys_changed |= (old is None) != (not images)
+            name_index = (
+                NameIndex(portrait_cache.keys(), normalizer=normalize_vietnamese)
+                if keys_changed else self.name_index
+            )
+            self.portrait_cache, self.name_index = portrait_cache, name_index
+            for name in names:
+                self.gallery.remove_person(name)  # Nạp lại template ở lần match sau
+        if names:
+            print(f"Cập nhật chân dung: {', '.join(sorted(names))}")
+        return sorted(names)
+
+    def _rescan_portraits(self) -> List[str]:
+        with self._portraits_lock:
+            portrait_cache = self._collect_portraits()
+            name_index = NameIndex(portrait_cache.keys(), normalizer=normalize_vietnamese)
+            gallery = FaceGallery(self.distance_metric)
+            self._embedding_cache.clear()
+            self.portrait_cache, self.name_index, self.gallery = portrait_cache, name_index, gallery
+        print(f"Quét lại thư mục chân dung: {len(portrait_cache)} người")
+        return sorted(portrait_cache)
+
+    def suggest_portrait_names(self, person_name: str, limit: int = 5) -> List[str]:
+        """Các tên chân dung gần giống nhất (dùng cho log khi không tìm thấy)"""
+        if self.name_index is None:
+            self._build_name_index()
+        return [name for name, _ in self.name_index.candidates(person_name, limit)]
     
-    def _cosine_distance(self, a: np.ndarray, b: np.ndarray) -> float:
-        denom = (np.linalg.norm(a) * np.linalg.norm(b)) + 1e-12
-        return float(1.0 - np.dot(a, b) / denom)
+    def _ensure_templates(self, cached_name: str) -> int:
+        """
+        Tạo embedding cho ảnh chân dung của một người và nạp vào gallery
 
-    def _get_embedding(self, image_path: str) -> Optional[np.ndarray]:
-        DeepFace = get_deepface()
-        if DeepFace is None:
+        Returns:
+            Số template hợp lệ của người đó
+        """
+        if cached_name in self.gallery:
+            return self.gallery.template_count(cached_name)
+
+        paths = []
+        embeddings = []
+        for p in self.portrait_cache.get(cached_name, []):
+            emb = self._get_embedding(p)
+            if emb is not None:
+                paths.append(p)
+                embeddings.append(emb)
+        if not paths:
+            return 0  # Không nạp để lần sau thử lại
+        return self.gallery.add_person(cached_name, paths, embeddings)
+
+    @staticmethod
+    def _cache_key(image_path: str) -> str:
+        """Key cache RAM: một ảnh dù được truyền theo đường dẫn tương đối hay tuyệt đối"""
+        return os.path.normcase(os.path.abspath(image_path))
+
+    def _cache_lookup(
+        self,
+        image_path: str,
+        accept_pruned: bool = False
+    ) -> Tuple[bool, Optional[DetectedFaces], Tuple]:
+        """
+        Tra các khuôn mặt của ảnh trong cache RAM rồi kho trên đĩa
+
+        Args:
+            accept_pruned: Chấp nhận kết quả "bị lọc nhanh" (False = coi như chưa có, chạy detector)
+
+        Returns:
+            (found, faces, cache_info) - cache_info dùng lại khi ghi kết quả mới
+        """
+        mtime = os.path.getmtime(image_path)
+        found, faces = self._embedding_cache.get(self._cache_key(image_path), mtime)
+        if found and (accept_pruned or faces is not PRUNED):
+            return True, faces, (mtime, None)
+
+        # Tra kho trên đĩa theo hash nội dung (kể cả kết quả "không có mặt")
+        key = None
+        store = self._store_for(image_path)
+        if store is not None:
+            key = content_hash(image_path)
+            found, faces = store.lookup(key)
+            if found and (accept_pruned or faces is not PRUNED):
+                self._embedding_cache.put(self._cache_key(image_path), mtime, faces)
+                return True, faces, (mtime, key)
+        return False, None, (mtime, key)
+
+    def _cache_put(self, image_path: str, cache_info: Tuple, faces: Optional[DetectedFaces]):
+        mtime, key = cache_info
+        self._embedding_cache.put(self._cache_key(image_path), mtime, faces)
+        if key is not None:
+            self._store_for(image_path).put(key, faces)
+
+    def _store_for(self, image) -> Optional[EmbeddingStore]:
+        """
+        Kho embedding trên đĩa cho một ảnh (None nếu không dùng kho). Namespace gồm chế độ
+        detect và DETECTION_MAX_SIDE: kết quả detect thu nhỏ, chia ô hay ở độ phân giải khác
+        (kể cả "không có mặt") không bị dùng lẫn sau khi đổi chế độ/cấu hình.
+        """
+        if not self.store_dir:
             return None
+        mode = self.detection_mode or detection_mode_for(image)
+        variant = f"{mode}{DETECTION_MAX_SIDE}" + ('' if self.enforce_detection else '__noenforce')
+        with self._stores_lock:
+            store = self._stores.get(variant)
+            if store is None:
+                store = self._stores[variant] = EmbeddingStore(
+                    self.store_dir, self.model_name, self.detector_backend,
+                    variant=variant, dtype=self.embedding_dtype
+                )
+            return store
 
+    def _get_faces(self, image_path: str) -> Optional[DetectedFaces]:
+        """Embedding + bbox + điểm detect của mọi khuôn mặt trong ảnh (None nếu không có mặt)"""
         if not os.path.exists(image_path):
             return None
 
         try:
-            mtime = os.path.getmtime(image_path)
-            cached = self._embedding_cache.get(image_path)
-            if cached and cached[0] == mtime:
-                return cached[1]
-
-            img_ascii = copy_to_ascii_path(image_path)
-            reps = DeepFace.represent(
-                img_path=img_ascii,
-                model_name=self.model_name,
-                detector_backend=self.detector_backend,
-                enforce_detection=self.enforce_detection
-            )
-            if not reps:
-                return None
+            found, faces, cache_info = self._cache_lookup(image_path)
+            if found:
+                return faces
 
-            embedding = np.array(reps[0]["embedding"], dtype=np.float32)
-            self._embedding_cache[image_path] = (mtime, embedding)
-            return embedding
+            if self.inference_pool is not None:
+                ok, faces = self.inference_pool.embed_faces(
+                    [image_path], self.model_name, self.detector_backend, self.enforce_detection,
+                    self.detection_mode
+                )[0]
+                if not ok:
+                    return None  # Lỗi worker - không ghi cache để lần sau thử lại
+            else:
+                # Lỗi đọc ảnh ném IOError - không ghi cache để lần sau thử lại
+                faces = represent_image(
+                    image_path, self.model_name, self.detector_backend, self.enforce_detection,
+                    self.detection_mode
+                )
+            self._cache_put(image_path, cache_info, faces)
+            return faces
         except Exception:
             return None
 
+    def cache_stats(self) -> Dict:
+        """Thống kê cache embedding RAM (hit/miss/eviction/byte) và kho trên đĩa"""
+        stats = {'embeddings': self._embedding_cache.stats()}
+        if self.store_dir:
+            with self._stores_lock:
+                stores = list(self._stores.values())
+            stats['store_entries'] = sum(len(store) for store in stores)
+        return stats
+
+    def reset_stage_stats(self):
+        """Đặt lại thống kê theo tầng (gọi khi bắt đầu một lượt phân tích)"""
+        self.stage_stats = dict.fromkeys(STAGE_STATS_LABELS, 0)
+
+    def format_stage_stats(self) -> str:
+        """Thống kê theo tầng dạng một dòng log"""
+        return " | ".join(
+            f"{label}: {self.stage_stats.get(key, 0)}" for key, label in STAGE_STATS_LABELS.items()
+        )
+
+    def _record_outcome(self, faces) -> Optional[DetectedFaces]:
+        """Cộng thống kê cho một ảnh camera; trả về faces (PRUNED -> None)"""
+        if faces is PRUNED:
+            self.stage_stats['pruned'] += 1
+            return None
+        if faces is None:
+            self.stage_stats['no_face'] += 1
+            return None
+        self.stage_stats['with_faces'] += 1
+        self.stage_stats['faces'] += len(faces)
+        return faces
+
+    def _get_embedding(self, image_path: str) -> Optional[np.ndarray]:
+        """Embedding của khuôn mặt lớn nhất trong ảnh (dùng cho ảnh chân dung)"""
+        faces = self._get_faces(image_path)
+        if faces is None:
+            return None
+        return as_float(faces.embeddings)[faces.largest()]
+
+    def matched_face_box(self, person_name: str, image_path: str) -> Optional[Tuple[float, float, float, float]]:
+        """Bbox (x, y, w, h) của khuôn mặt giống người nhất trong ảnh (dùng lại embedding đã cache)"""
+        cached_name = self._resolve_portrait_name(person_name)
+        if cached_name is None or not self._ensure_templates(cached_name):
+            return None
+        faces = self._get_faces(image_path)
+        if faces is None or not len(faces):
+            return None
+        distances = self.gallery.min_distances(cached_name, faces.embeddings)
+        if distances is None:
+            return None
+        return tuple(float(v) for v in faces.boxes[int(np.argmin(distances))])
+
+    def _get_batch_backend(self):
+        """
+        Lấy (model, preprocessing) cho đường batch; None nếu phiên bản DeepFace
+        hoặc model không hỗ trợ (khi đó dùng DeepFace.represent từng ảnh)
+        """
+        if self._batch_backend is None:
+            self._batch_backend = False
+            DeepFace = get_deepface()
+            if DeepFace is None:
+                return None
+            try:
+                from deepface.modules import preprocessing
+                model = DeepFace.build_model(self.model_name)
+                keras_model = getattr(model, 'model', None)
+                if hasattr(model, 'input_shape') and hasattr(keras_model, 'predict'):
+                    self._batch_backend = (model, preprocessing)
+            except Exception as e:
+                print(f"Không dùng được batch inference: {e}")
+        return self._batch_backend or None
+
+    def _detect_aligned_faces(self, image, preprocessing, target_size) -> List[Tuple]:
+        """
+        Detect + align mọi khuôn mặt trong ảnh, tiền xử lý giống DeepFace.represent
+
+        Returns:
+            Danh sách (face, box, score) - face là mảng (1, h, w, 3) sẵn sàng đưa vào model
+        """
+        DeepFace = get_deepface()
+
+        def extract(source):
+            try:
+                return DeepFace.extract_faces(
+                    img_path=source,
+                    detector_backend=self.detector_backend,
+                    enforce_detection=self.enforce_detection,
+                    align=True
+                ) or []
+            except ValueError as e:
+                if not _is_no_face_error(e):
+                    raise
+                return []
+
+        if isinstance(image, str):
+            image = FaceImage(image)
+        full = None
+        if (self.detection_mode or detection_mode_for(image)) == 'tiled':
+            full = _full_resolution(image)
+        if full is not None:
+            # Detect từng ô song song, gộp bbox trùng ở vùng chồng lấn bằng NMS
+            found = detect_tiled(full, lambda tile: [
+                (_facial_area_box(face.get("facial_area")), face.get("confidence", 0.0) or 0.0, face)
+                for face in extract(tile)
+            ])
+            faces = []
+            for (x, y, w, h), _, face in found:
+                faces.append(dict(face, facial_area={"x": x, "y": y, "w": w, "h": h}))
+            factor = 1
+        else:
+            if isinstance(image, (str, FaceImage)):
+                source, factor = FaceImage.of(image).detection_bgr()
+            else:
+                source, factor = image, 1
+            if source is None:
+                raise IOError(f"Không đọc được ảnh: {image}")
+            faces = extract(source)
+
+        results = []
+        for face in faces:
+            img = face["face"][:, :, ::-1]  # RGB -> BGR như DeepFace.represent
+            img = preprocessing.resize_image(img=img, target_size=(target_size[1], target_size[0]))
+            img = preprocessing.normalize_input(img=img, normalization="base")
+            x, y, w, h = _facial_area_box(face.get("facial_area"))
+            results.append((
+                img,
+                (x * factor, y * factor, w * factor, h * factor),
+                face.get("confidence", 0.0) or 0.0
+            ))
+        return results
+
+    def _prefiltered(self, image) -> bool:
+        """
+        Ảnh có qua tầng Haar không: ảnh detect chia ô ('tiled') giữ mặt nhỏ mà Haar trên
+        ảnh thu nhỏ bỏ sót, nên luôn chạy detector (và không nhận PRUNED cũ trong cache)
+        """
+        if self.prefilter is None:
+            return False
+        return (self.detection_mode or detection_mode_for(image)) != 'tiled'
+
+    def get_faces_batch(
+        self,
+        images: List[Union[str, np.ndarray]],
+        batch_size: int = 16
+    ) -> List[Optional[DetectedFaces]]:
+        """
+        Tạo embedding cho mọi khuôn mặt trong nhiều ảnh: detect từng ảnh, gom các
+        mặt đã align rồi chạy model nhận diện theo từng lô batch_size
+
+        Args:
+            images: Đường dẫn ảnh hoặc ảnh đã decode (ndarray BGR)
+            batch_size: Số khuôn mặt mỗi lần gọi model
+
+        Returns:
+            Danh sách DetectedFaces (None nếu không có mặt/lỗi), cùng thứ tự với images.
+            Kết quả của ảnh dạng đường dẫn được ghi vào cache như _get_faces.
+            Nếu có prefilter, ảnh bị loại ở tầng lọc nhanh không qua detector
+            (trừ ảnh detect chia ô - xem _prefiltered).
+        """
+        stats = self.stage_stats
+        results: List[Optional[DetectedFaces]] = [None] * len(images)
+        pending = []  # [(index, cache_info)]
+        for idx, image in enumerate(images):
+            stats['frames'] += 1
+            if not isinstance(image, str):
+                pending.append((idx, None))
+                continue
+            if not os.path.exists(image):
+                stats['errors'] += 1
+                continue
+            try:
+                found, faces, cache_info = self._cache_lookup(image, self._prefiltered(image))
+            except Exception:
+                stats['errors'] += 1
+                continue
+            if found:
+                stats['cache_hits'] += 1
+                results[idx] = self._record_outcome(faces)
+            else:
+                pending.append((idx, cache_info))
+
+        # Tầng 1: Haar cascade trên ảnh thu nhỏ - loại ảnh chắc chắn không có mặt
+        if self.prefilter is not None and pending:
+            kept = []
+            for idx, cache_info in pending:
+                if not self._prefiltered(images[idx]) or self.prefilter.has_face(images[idx]):
+                    kept.append((idx, cache_info))
+                    continue
+                self._record_outcome(PRUNED)
+                if cache_info is not None:
+                    self._cache_put(images[idx], cache_info, PRUNED)
+            pending = kept
+
+        if not pending:
+            return results
+
+        # Pool process: mỗi worker giữ model riêng, các ảnh chạy song song
+        if self.inference_pool is not None:
+            outcomes = self.inference_pool.embed_faces(
+                [images[idx] for idx, _ in pending],
+                self.model_name, self.detector_backend, self.enforce_detection,
+                self.detection_mode
+            )
+            for (idx, cache_info), (ok, faces) in zip(pending, outcomes):
+                if not ok:
+                    stats['errors'] += 1
+                    continue
+                results[idx] = self._record_outcome(faces)
+                if cache_info is not None:
+                    self._cache_put(images[idx], cache_info, faces)
+            return results
+
+        backend = self._get_batch_backend()
+        if backend is None:
+            for idx, _ in pending:
+                if isinstance(images[idx], str):
+                    results[idx] = self._record_outcome(self._get_faces(images[idx]))
+            return results
+
+        model, preprocessing = backend
+        detected = []  # [(index, cache_info, [(face, box, score)])]
+        crops = []     # [(vị trí trong detected, face)]
+        for idx, cache_info in pending:
+            try:
+                faces = self._detect_aligned_faces(images[idx], preprocessing, model.input_shape)
+            except Exception:
+                stats['errors'] += 1
+                continue  # Lỗi đọc ảnh - không ghi cache để lần sau thử lại
+            if not faces:
+                self._record_outcome(None)
+                if cache_info is not None:
+                    self._cache_put(images[idx], cache_info, None)
+                continue
+            crops.extend((len(detected), face) for face, _, _ in faces)
+            detected.append((idx, cache_info, faces))
+
+        embeddings = [[] for _ in detected]
+        failed = set()
+        for start in range(0, len(crops), batch_size):
+            chunk = crops[start:start + batch_size]
+            batch = np.concatenate([face for _, face in chunk], axis=0)
+            try:
+                output = model.model(batch, training=False)
+                output = np.asarray(output.numpy() if hasattr(output, 'numpy') else output,
+                                    dtype=np.float32)
+            except Exception as e:
+                print(f"Lỗi batch inference: {e}")
+                failed.update(owner for owner, _ in chunk)
+                continue
+            for (owner, _), embedding in zip(chunk, output):
+                embeddings[owner].append(np.array(embedding, dtype=np.float32))
+
+        for owner, (idx, cache_info, faces) in enumerate(detected):
+            if owner in failed:
+                stats['errors'] += 1
+                continue  # Thiếu embedding của một số mặt - không ghi cache
+            face_set = make_faces(
+                embeddings[owner],
+                [box for _, box, _ in faces],
+                [score for _, _, score in faces],
+            )
+            results[idx] = self._record_outcome(face_set)
+            if cache_info is not None:
+                self._cache_put(images[idx], cache_info, face_set)
+        return results
+
+    def warm_up_models(self):
+        """
+        Nạp detector + model nhận diện và chạy thử một lần trên ảnh giả
+        để dựng sẵn graph (lần phân tích đầu tiên không phải chờ)
+        """
+        DeepFace = get_deepface()
+        if DeepFace is None:
+            raise RuntimeError("DeepFace chưa được cài đặt")
+
+        dummy = np.zeros((160, 160, 3), dtype=np.uint8)
+        if self.prefilter is not None:
+            self.prefilter.has_face(dummy)  # Nạp Haar cascade
+        if self.inference_pool is not None:
+            # Khởi động các worker và nạp model trong từng process
+            outcomes = self.inference_pool.embed_faces(
+                [dummy] * self.inference_pool.workers,
+                self.model_name, self.detector_backend, False
+            )
+            errors = [str(result) for ok, result in outcomes if not ok]
+            if errors:
+                raise RuntimeError(f"Worker inference lỗi: {errors[0]}")
+            return
+
+        try:
+            DeepFace.extract_faces(
+                img_path=dummy,
+                detector_backend=self.detector_backend,
+                enforce_detection=False
+            )
+        except ValueError:
+            pass  # Ảnh giả không có mặt
+
+        backend = self._get_batch_backend()
+        if backend is not None:
+            model, preprocessing = backend
+            target_size = model.input_shape
+            face = preprocessing.resize_image(img=dummy, target_size=(target_size[1], target_size[0]))
+            face = preprocessing.normalize_input(img=face, normalization="base")
+            model.model(face, training=False)
+        else:
+            DeepFace.represent(
+                img_path=dummy,
+                model_name=self.model_name,
+                detector_backend="skip",
+                enforce_detection=False
+            )
+
+    def flush_store(self):
+        """Ghi các embedding mới xuống đĩa (gọi khi kết thúc một lượt phân tích)"""
+        with self._stores_lock:
+            stores = list(self._stores.values())
+        for store in stores:
+            store.flush()
+
     def _get_default_threshold(self) -> float:
         if self.distance_metric == "cosine":
             model = self.model_name.lower()
@@ -287,7 +903,8 @@ class FaceMatcher:
         camera_images: List[str],
         distance_threshold: Optional[float] = None,
         fast_mode: bool = True,
-        log_detail: bool = False
+        log_detail: bool = False,
+        expected_times: Optional[List[str]] = None
     ) -> Optional[str]:
         """
         Tìm ảnh camera có khuôn mặt match với người được chỉ định
@@ -297,6 +914,8 @@ class FaceMatcher:
             camera_images: Danh sách đường dẫn ảnh camera
             distance_threshold: Ngưỡng khoảng cách (thấp hơn = giống hơn).
                                 Nếu None sẽ dùng ngưỡng mặc định theo model.
+            expected_times: Giờ vào/ra dự kiến ('HH:MM') - chỉ xét ảnh trong khung giờ,
+                            ảnh gần giờ dự kiến được so trước (early stop dừng sớm hơn)
 
         Returns:
             Đường dẫn ảnh camera match tốt nhất, hoặc None nếu không tìm thấy
@@ -305,11 +924,13 @@ class FaceMatcher:
             distance_threshold = self._get_default_threshold()
 
         # Tìm tất cả ảnh chân dung
-        portrait_paths = self.find_portraits(person_name)
+        cached_name = self._resolve_portrait_name(person_name)
+        portrait_paths = self.portrait_cache.get(cached_name, []) if cached_name else []
         if not portrait_paths:
             self._log(f"  [ERROR] Không tìm thấy ảnh chân dung cho: {person_name}", "error")
             self._log(
-                f"     Cache có {len(self.portrait_cache)} người: {list(self.portrait_cache.keys())[:5]}...",
+                f"     Cache có {len(self.portrait_cache)} người, gần giống: "
+                f"{self.suggest_portrait_names(person_name)}",
                 "warning"
             )
             return None
@@ -319,17 +940,19 @@ class FaceMatcher:
             exists = os.path.exists(p)
             self._log(f"     - {os.path.basename(p)} (exists={exists})", "default")
 
-        # Tạo embedding cho ảnh chân dung
-        portrait_embeddings = []
-        for p in portrait_paths:
-            emb = self._get_embedding(p)
-            if emb is not None:
-                portrait_embeddings.append((p, emb))
-
-        if not portrait_embeddings:
+        # Tạo embedding cho ảnh chân dung (nạp vào gallery)
+        if not self._ensure_templates(cached_name):
             self._log("  [ERROR] Không tạo được embedding cho ảnh chân dung", "error")
             return None
 
+        if expected_times:
+            planned = get_candidate_planner().plan(camera_images, expected_times)
+            self._log(
+                f"  -> Khung giờ {', '.join(expected_times)}: {len(planned)}/{len(camera_images)} ảnh",
+                "info"
+            )
+            camera_images = planned
+
         best_match = None
         best_distance = float('inf')
         errors_count = 0
@@ -337,33 +960,48 @@ class FaceMatcher:
         total_camera = len(camera_images)
         early_stop_threshold = distance_threshold * 0.7 if fast_mode else None
 
-        for i, camera_img in enumerate(camera_images):
-            if not os.path.exists(camera_img):
+        # Embed theo lô, so sánh cả lô với template; early stop kiểm tra sau mỗi ảnh
+        stop = False
+        for start in range(0, total_camera, self.batch_size):
+            chunk = [p for p in camera_images[start:start + self.batch_size] if os.path.exists(p)]
+            if not chunk:
                 continue
 
-            if i % 5 == 0 or i == total_camera - 1:
-                self._log(f"    [SCAN] So sánh ảnh {i+1}/{total_camera}...", "default")
+            self._log(
+                f"    [SCAN] So sánh ảnh {start+1}-{start+len(chunk)}/{total_camera}...",
+                "default"
+            )
 
             try:
-                cam_emb = self._get_embedding(camera_img)
-                if cam_emb is None:
+                face_sets = self.get_faces_batch(chunk, self.batch_size)
+                valid = [(p, f) for p, f in zip(chunk, face_sets) if f is not None]
+                if not valid:
                     continue
 
-                distances = []
-                for _, p_emb in portrait_embeddings:
-                    if self.distance_metric == "cosine":
-                        d = self._cosine_distance(cam_emb, p_emb)
-                    else:
-                        d = float(np.linalg.norm(cam_emb - p_emb))
-                    distances.append(d)
-
-                if not distances:
+                # Mọi khuôn mặt của cả lô trong một ma trận, lấy min theo từng ảnh
+                # (mặt chắc chắn xa hơn ngưỡng bị sàng bằng tâm template, nhận inf)
+                distances = self.gallery.min_distances(
+                    cached_name, stack_embeddings([f.embeddings for _, f in valid]),
+                    threshold=distance_threshold
+                )
+                if distances is None:
                     continue
+            except Exception as e:
+                errors_count += 1
+                if errors_count <= 3:
+                    self._log(f"    [WARN] Error #{errors_count}: {str(e)}", "warning")
+                continue
 
-                distance = min(distances)
+            offset = 0
+            for camera_img, faces in valid:
+                face_dists = distances[offset:offset + len(faces)]
+                offset += len(faces)
+                face_idx = int(np.argmin(face_dists))
+                distance = float(face_dists[face_idx])
+                face_label = f" [mặt {face_idx+1}/{len(faces)}]" if len(faces) > 1 else ""
                 if log_detail:
                     self._log(
-                        f"    [DIST] {os.path.basename(camera_img)} => {distance:.3f}",
+                        f"    [DIST] {os.path.basename(camera_img)}{face_label} => {distance:.3f}",
                         "default"
                     )
                 compared_count += 1
@@ -372,7 +1010,7 @@ class FaceMatcher:
                     best_distance = distance
                     best_match = camera_img
                     self._log(
-                        f"    [CAND] Ứng viên: {os.path.basename(camera_img)} (distance={distance:.3f})",
+                        f"    [CAND] Ứng viên: {os.path.basename(camera_img)}{face_label} (distance={distance:.3f})",
                         "info"
                     )
 
@@ -381,11 +1019,10 @@ class FaceMatcher:
                         f"    [EARLY] Match tốt tìm thấy sớm! (distance={best_distance:.3f})",
                         "success"
                     )
+                    stop = True
                     break
-            except Exception as e:
-                errors_count += 1
-                if errors_count <= 3:
-                    self._log(f"    [WARN] Error #{errors_count}: {str(e)}", "warning")
+            if stop:
+                break
 
         self._log(
             f"  [STATS] So sánh: {compared_count}/{total_camera} ảnh, lỗi: {errors_count}",
@@ -403,6 +1040,8 @@ class FaceMatcher:
                 f"  -> Best distance={best_distance:.3f} > threshold={distance_threshold}",
                 "warning"
             )
+        elif compared_count:
+            self._log("  -> Không có khuôn mặt nào gần ngưỡng (đã sàng bằng tâm template)", "warning")
         else:
             self._log("  -> Không tìm thấy ảnh nào match được", "error")
 
@@ -416,43 +1055,37 @@ class FaceMatcher:
         Returns:
             List of (image_path, confidence) tuples
         """
-        portrait_paths = self.find_portraits(person_name)
-        if not portrait_paths:
+        cached_name = self._resolve_portrait_name(person_name)
+        if cached_name is None or not self._ensure_templates(cached_name):
             return []
 
-        portrait_embeddings = []
-        for p in portrait_paths:
-            emb = self._get_embedding(p)
-            if emb is not None:
-                portrait_embeddings.append(emb)
+        # Gom mọi khuôn mặt camera thành 1 khối rồi tính khoảng cách một lần
+        block_paths = []
+        block_faces = []
+        for start in range(0, len(camera_images), self.batch_size):
+            chunk = camera_images[start:start + self.batch_size]
+            for camera_img, faces in zip(chunk, self.get_faces_batch(chunk, self.batch_size)):
+                if faces is None:
+                    continue
+                block_paths.append(camera_img)
+                block_faces.append(faces)
+                if len(block_paths) >= max_matches:
+                    break
+            if len(block_paths) >= max_matches:
+                break
 
-        if not portrait_embeddings:
+        if not block_faces:
             return []
 
-        matches = []
-        for camera_img in camera_images:
-            cam_emb = self._get_embedding(camera_img)
-            if cam_emb is None:
-                continue
-
-            distances = []
-            for p_emb in portrait_embeddings:
-                if self.distance_metric == "cosine":
-                    d = self._cosine_distance(cam_emb, p_emb)
-                else:
-                    d = float(np.linalg.norm(cam_emb - p_emb))
-                distances.append(d)
-
-            if not distances:
-                continue
-
-            distance = min(distances)
-            confidence = max(0, 100 * (1 - distance))
-            matches.append((camera_img, confidence))
-
-            if len(matches) >= max_matches:
-                break
-
+        distances = self.gallery.min_distances(
+            cached_name, stack_embeddings([f.embeddings for f in block_faces])
+        )
+        offsets = np.cumsum([0] + [len(f) for f in block_faces[:-1]])
+        per_image = np.minimum.reduceat(distances, offsets)
+        matches = [
+            (path, max(0, 100 * (1 - float(d))))
+            for path, d in zip(block_paths, per_image)
+        ]
         matches.sort(key=lambda x: x[1], reverse=True)
         return matches
 
@@ -465,13 +1098,18 @@ def simple_face_match(portrait_path: str, camera_images: List[str]) -> Optional[
     if DeepFace is None:
         return None
     
+    portrait = load_image(portrait_path)
+    if portrait is None:
+        return None
+
     for camera_img in camera_images:
         try:
-            portrait_ascii = copy_to_ascii_path(portrait_path)
-            camera_ascii = copy_to_ascii_path(camera_img)
+            camera = load_image(camera_img)
+            if camera is None:
+                continue
             result = DeepFace.verify(
-                img1_path=portrait_ascii,
-                img2_path=camera_ascii,
+                img1_path=portrait,
+                img2_path=camera,
                 model_name="ArcFace",
                 detector_backend="retinaface",
                 enforce_detection=True
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Module lọc nhanh ảnh không có mặt người (tầng đầu trước RetinaFace + ArcFace)
+Chạy Haar cascade của OpenCV trên ảnh xám thu nhỏ; ảnh hành lang trống bị loại
+trước khi tốn thời gian cho detector/model nhận diện.
+Nguyên tắc: khi không chắc (thiếu cascade, lỗi đọc ảnh) thì cho ảnh đi tiếp.
+"""
+
+import os
+import threading
+from typing import Optional
+
+try:
+    import cv2
+    import numpy as np
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+    cv2 = None
+    np = None
+
+from src.image_io import load_image
+
+try:
+    from src.config import PREFILTER_ENABLED, PREFILTER_MAX_WIDTH, PREFILTER_MIN_NEIGHBORS
+except ImportError:
+    PREFILTER_ENABLED = True
+    PREFILTER_MAX_WIDTH = 640
+    PREFILTER_MIN_NEIGHBORS = 2
+
+# Mặt thẳng + mặt nghiêng (camera cổng hay chụp chéo)
+CASCADE_FILES = ('haarcascade_frontalface_default.xml', 'haarcascade_profileface.xml')
+
+
+class FacePrefilter:
+    """Haar cascade trên ảnh thu nhỏ - chỉ trả lời 'có thể có mặt hay không'"""
+
+    def __init__(
+        self,
+        max_width: int = PREFILTER_MAX_WIDTH,
+        min_neighbors: int = PREFILTER_MIN_NEIGHBORS
+    ):
+        """
+        Args:
+            max_width: Chiều rộng tối đa của ảnh khi chạy cascade
+            min_neighbors: Tham số cascade (thấp hơn = ít bỏ sót hơn, nhiều báo nhầm hơn)
+        """
+        self.max_width = max_width
+        self.min_neighbors = min_neighbors
+        self._cascades = None
+
+    def _load_cascades(self):
+        if self._cascades is None:
+            self._cascades = []
+            if not CV2_AVAILABLE or not hasattr(cv2, 'CascadeClassifier'):
+                print("OpenCV không có CascadeClassifier - bỏ qua bước lọc nhanh")
+                return self._cascades
+            data_dir = getattr(getattr(cv2, 'data', None), 'haarcascades', '')
+            for name in CASCADE_FILES:
+                path = os.path.join(data_dir, name)
+                cascade = cv2.CascadeClassifier(path)
+                if not cascade.empty():
+                    self._cascades.append(cascade)
+            if not self._cascades:
+                print("Không tìm thấy Haar cascade - bỏ qua bước lọc nhanh")
+        return self._cascades
+
+    @property
+    def available(self) -> bool:
+        return bool(self._load_cascades())
+
+    def _prepare(self, image) -> Optional["np.ndarray"]:
+        """Ảnh xám đã thu nhỏ (đường dẫn: decode ở 1/2 độ phân giải)"""
+        if isinstance(image, str):
+            gray = load_image(image, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+        elif image is not None and image.ndim == 3:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = image
+        if gray is None:
+            return None
+
+        height, width = gray.shape[:2]
+        if width > self.max_width:
+            scale = self.max_width / width
+            gray = cv2.resize(gray, (self.max_width, int(height * scale)), interpolation=cv2.INTER_AREA)
+        return cv2.equalizeHist(gray)
+
+    def has_face(self, image) -> bool:
+        """
+        Args:
+            image: Đường dẫn ảnh hoặc ảnh đã decode (BGR/xám)
+
+        Returns:
+            False chỉ khi chắc chắn không thấy khuôn mặt nào
+        """
+        cascades = self._load_cascades()
+        if not cascades:
+            return True
+        try:
+            gray = self._prepare(image)
+            if gray is None:
+                return True
+            # Cascade nghiêng chỉ nhận một hướng - chạy thêm trên ảnh lật ngang
+            views = (gray, cv2.flip(gray, 1))
+            for i, cascade in enumerate(cascades):
+                for view in (views if i > 0 else views[:1]):
+                    faces = cascade.detectMultiScale(
+                        view, scaleFactor=1.1, minNeighbors=self.min_neighbors, minSize=(20, 20)
+                    )
+                    if len(faces):
+                        return True
+            return False
+        except Exception:
+            return True
+
+
+# Singleton instance
+_prefilter = None
+_prefilter_lock = threading.Lock()
+
+def get_face_prefilter() -> Optional[FacePrefilter]:
+    """Bộ lọc dùng chung; None nếu tắt (PREFILTER_ENABLED = False)"""
+    global _prefilter
+    if not PREFILTER_ENABLED:
+        return None
+    with _prefilter_lock:
+        if _prefilter is None:
+            _prefilter = FacePrefilter()
+        return _prefilter
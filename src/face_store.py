@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Module lưu database khuôn mặt bằng SQLite (WAL)
+Mỗi người một dòng, các mẫu encoding lưu thành một khối BLOB - thêm/sửa một người
+chỉ ghi một dòng trong transaction (không ghi lại cả file, không hỏng dữ liệu khi tắt ngang).
+Manifest giữ encoding + điểm chất lượng của từng ảnh chân dung để chọn lại mẫu
+mà không encode lại ảnh cũ. Metadata nạp lúc khởi động, vector chỉ nạp khi cần tìm kiếm. Index ANN đã chia cụm
+được lưu kèm (bỏ đi mỗi khi bảng persons đổi) để khởi động lại không phải chạy k-means.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+SCHEMA_VERSION = 3  # v2: manifest kèm encoding + chất lượng từng ảnh, persons giữ khối nhiều mẫu
+                    # v3: bảng ann_index
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS persons (
+    person_id  TEXT PRIMARY KEY,
+    branch     TEXT NOT NULL,
+    name       TEXT NOT NULL,
+    image_path TEXT,
+    encoding   BLOB,
+    dim        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_persons_branch ON persons(branch);
+CREATE INDEX IF NOT EXISTS idx_persons_name ON persons(name);
+CREATE TABLE IF NOT EXISTS manifest (
+    image_path TEXT PRIMARY KEY,
+    size       INTEGER NOT NULL,
+    mtime      REAL NOT NULL,
+    hash       TEXT NOT NULL,
+    person_id  TEXT NOT NULL,
+    has_face   INTEGER NOT NULL,
+    encoding   BLOB,
+    quality    REAL
+);
+CREATE INDEX IF NOT EXISTS idx_manifest_person ON manifest(person_id);
+CREATE TABLE IF NOT EXISTS ann_index (
+    id        INTEGER PRIMARY KEY CHECK (id = 1),
+    templates INTEGER NOT NULL,
+    dim       INTEGER NOT NULL,
+    state     BLOB NOT NULL
+);
+"""
+
+
+def _to_blob(encoding) -> Tuple[Optional[bytes], int]:
+    """Một encoding (dim,) hoặc khối mẫu (k, dim) -> (bytes float64, dim)"""
+    if encoding is None:
+        return None, 0
+    block = np.atleast_2d(np.ascontiguousarray(encoding, dtype=np.float64))
+    return block.tobytes(), block.shape[1]
+
+
+def _from_blob(blob: Optional[bytes], dim: int = 0) -> Optional[np.ndarray]:
+    """BLOB -> khối (k, dim); dim = 0 thì trả về vector phẳng"""
+    if blob is None:
+        return None
+    vec = np.frombuffer(blob, dtype=np.float64).copy()
+    return vec.reshape(-1, dim) if dim else vec
+
+
+class FaceStore:
+    """SQLite WAL: bảng persons (metadata + encoding) và manifest (ảnh chân dung đã quét)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._upgrade()
+
+    def _upgrade(self):
+        """Nâng schema của file cũ (v1: manifest chưa có encoding/quality)"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(manifest)")}
+        for column, kind in (('encoding', 'BLOB'), ('quality', 'REAL')):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE manifest ADD COLUMN {column} {kind}")
+        self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Gom nhiều lệnh ghi thành một transaction (lỗi giữa chừng thì rollback)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _write(self, sql: str, args, conn: Optional[sqlite3.Connection] = None, many: bool = False):
+        """Ghi trong transaction đang mở (conn) hoặc transaction riêng cho một lệnh"""
+        if conn is None:
+            with self.transaction() as own:
+                return self._write(sql, args, own, many)
+        if many:
+            conn.executemany(sql, args)
+        else:
+            conn.execute(sql, args)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ------------------------------------------------------------------
+    # Người
+    # ------------------------------------------------------------------
+
+    def upsert_person(self, person_id: str, branch: str, name: str, image_path: str, templates,
+                      conn: Optional[sqlite3.Connection] = None):
+        """Thêm hoặc cập nhật một người (một dòng, templates: khối mẫu (k, dim) hoặc một encoding)"""
+        if conn is None:
+            with self.transaction() as own:
+                return self.upsert_person(person_id, branch, name, image_path, templates, own)
+        blob, dim = _to_blob(templates)
+        self._write(
+            "INSERT INTO persons (person_id, branch, name, image_path, encoding, dim) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(person_id) DO UPDATE SET "
+            "branch=excluded.branch, name=excluded.name, image_path=excluded.image_path, "
+            "encoding=excluded.encoding, dim=excluded.dim",
+            (person_id, branch, name, image_path, blob, dim), conn
+        )
+        conn.execute("DELETE FROM ann_index")
+
+    def delete_person(self, person_id: str, conn: Optional[sqlite3.Connection] = None):
+        if conn is None:
+            with self.transaction() as own:
+                return self.delete_person(person_id, own)
+        conn.execute("DELETE FROM persons WHERE person_id = ?", (person_id,))
+        conn.execute("DELETE FROM ann_index")
+
+    def persons(self) -> Dict[str, Dict]:
+        """Metadata mọi người (không kèm encoding): {person_id: {'branch', 'name', 'image_path'}}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT person_id, branch, name, image_path FROM persons WHERE encoding IS NOT NULL"
+            ).fetchall()
+        return {pid: {'branch': b, 'name': n, 'image_path': p} for pid, b, n, p in rows}
+
+    def persons_in_branch(self, branch: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT person_id FROM persons WHERE branch = ? ORDER BY name", (branch,)
+            ).fetchall()
+        return [pid for pid, in rows]
+
+    def load_templates(self) -> Dict[str, np.ndarray]:
+        """{person_id: khối mẫu (k, dim)} của mọi người - nạp vector khi cần tìm kiếm"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT person_id, encoding, dim FROM persons WHERE encoding IS NOT NULL ORDER BY rowid"
+            ).fetchall()
+        return {pid: _from_blob(blob, dim) for pid, blob, dim in rows}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM persons WHERE encoding IS NOT NULL"
+            ).fetchone()[0]
+
+    # ------------------------------------------------------------------
+    # Index ANN
+    # ------------------------------------------------------------------
+
+    def load_ann_state(self, templates: int, dim: int) -> Optional[Dict]:
+        """State IVFIndex đã lưu nếu khớp số mẫu và số chiều hiện tại (None nếu không có)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM ann_index WHERE templates = ? AND dim = ?", (templates, dim)
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def save_ann_state(self, templates: int, dim: int, state: Dict):
+        blob = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write(
+            "INSERT OR REPLACE INTO ann_index (id, templates, dim, state) VALUES (1, ?, ?, ?)",
+            (templates, dim, blob)
+        )
+
+    # ------------------------------------------------------------------
+    # Manifest ảnh chân dung
+    # ------------------------------------------------------------------
+
+    def manifest(self) -> Dict[str, Dict]:
+        """Manifest không kèm encoding; 'quality' None = ảnh chưa có encoding lưu lại"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT image_path, size, mtime, hash, person_id, has_face, quality FROM manifest"
+            ).fetchall()
+        return {
+            path: {'size': size, 'mtime': mtime, 'hash': h, 'person_id': pid,
+                   'has_face': bool(face), 'quality': quality}
+            for path, size, mtime, h, pid, face, quality in rows
+        }
+
+    def image_templates(self, person_id: str) -> List[Tuple[str, np.ndarray, float]]:
+        """[(ảnh, encoding, chất lượng)] mọi ảnh có mặt của một người (dùng để chọn lại mẫu)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT image_path, encoding, quality FROM manifest "
+                "WHERE person_id = ? AND encoding IS NOT NULL", (person_id,)
+            ).fetchall()
+        return [(path, _from_blob(blob), quality) for path, blob, quality in rows]
+
+    def upsert_manifest(self, image_path: str, entry: Dict, conn: Optional[sqlite3.Connection] = None):
+        sql = (
+            "INSERT OR REPLACE INTO manifest "
+            "(image_path, size, mtime, hash, person_id, has_face, encoding, quality) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+        )
+        encoding = entry.get('encoding')
+        blob = None if encoding is None else np.ascontiguousarray(encoding, dtype=np.float64).tobytes()
+        args = (image_path, entry['size'], entry['mtime'], entry['hash'],
+                entry['person_id'], int(entry['has_face']), blob, entry.get('quality'))
+        self._write(sql, args, conn)
+
+    def touch_manifest(self, image_path: str, mtime: float, conn: Optional[sqlite3.Connection] = None):
+        """Cập nhật mtime (nội dung ảnh không đổi) - giữ nguyên encoding đã lưu"""
+        self._write("UPDATE manifest SET mtime = ? WHERE image_path = ?", (mtime, image_path), conn)
+
+    def delete_manifest(self, image_paths: List[str], conn: Optional[sqlite3.Connection] = None):
+        self._write("DELETE FROM manifest WHERE image_path = ?", [(p,) for p in image_paths], conn, many=True)
+
+    def clear(self):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM persons")
+            conn.execute("DELETE FROM manifest")
+            conn.execute("DELETE FROM ann_index")
+
+    # ------------------------------------------------------------------
+    # Chuyển từ cache pickle cũ
+    # ------------------------------------------------------------------
+
+    def migrate_pickle(self, pickle_path: str) -> int:
+        """
+        Nhập cache .face_cache.pkl (v1-v3) một lần rồi đổi tên file cũ thành .migrated
+
+        Returns:
+            Số người đã nhập (0 nếu không có file hoặc lỗi)
+        """
+        if not os.path.exists(pickle_path):
+            return 0
+        try:
+            with open(pickle_path, 'rb') as f:
+                data = pickle.load(f)
+        except Exception as e:
+            print(f"Lỗi đọc cache cũ: {e}")
+            return 0
+        if isinstance(data, dict) and 'database' in data and 'version' in data:
+            database, manifest = data['database'], data.get('manifest', {})
+        else:
+            database, manifest = data, {}  # v1: chỉ dict database
+
+        with self.transaction() as conn:
+            for person_id, person in database.items():
+                self.upsert_person(
+                    person_id, person.get('branch', ''), person.get('name', ''),
+                    person.get('image_path'), person.get('encoding'), conn
+                )
+            for image_path, entry in manifest.items():
+                self.upsert_manifest(image_path, entry, conn)
+        os.replace(pickle_path, pickle_path + '.migrated')
+        print(f"Đã chuyển cache pickle sang SQLite: {len(database)} người")
+        return len(database)
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Module theo dõi thay đổi file trong thư mục ảnh chân dung / database
+Dùng inotify (Linux, gọi qua ctypes) khi có; nơi khác (Windows, macOS) quét mtime định kỳ.
+Sự kiện được gom trong một khoảng ngắn (debounce - chép cả thư mục ảnh chỉ gửi một lần)
+rồi gửi danh sách đường dẫn đã đổi cho callback của thư mục gốc tương ứng.
+Gửi chính thư mục gốc nghĩa là có thể đã mất sự kiện - callback nên quét lại toàn bộ.
+"""
+
+import os
+import time
+import select
+import struct
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+try:
+    import ctypes
+    import ctypes.util
+    CTYPES_AVAILABLE = True
+except ImportError:
+    CTYPES_AVAILABLE = False
+
+try:
+    from src.config import WATCH_DEBOUNCE, WATCH_POLL_INTERVAL
+except ImportError:
+    WATCH_DEBOUNCE = 1.0
+    WATCH_POLL_INTERVAL = 5.0
+
+# Hằng số trong <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len (tên theo sau, đệm \0)
+
+
+def _hidden(name: str) -> bool:
+    """File/thư mục ẩn (cache SQLite, .embedding_store...) - bỏ qua, tránh tự kích hoạt"""
+    return name.startswith('.')
+
+
+def _walk_dirs(root: str):
+    for dirpath, dirnames, _ in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not _hidden(d)]
+        yield dirpath
+
+
+class InotifyBackend:
+    """inotify: một watch cho mỗi thư mục (kể cả thư mục con tạo sau)"""
+
+    name = 'inotify'
+
+    def __init__(self):
+        if not CTYPES_AVAILABLE or not hasattr(select, 'select'):
+            raise OSError("Không có ctypes")
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError("libc không hỗ trợ inotify")
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 lỗi")
+        self._dirs: Dict[int, str] = {}  # {watch descriptor: thư mục}
+        self._roots: List[str] = []
+
+    def add_tree(self, root: str):
+        if root not in self._roots:
+            self._roots.append(root)
+        for dirpath in _walk_dirs(root):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                # Hết giới hạn max_user_watches... - thư mục này sẽ không được theo dõi
+                print(f"Không theo dõi được {dirpath} (errno {ctypes.get_errno()})")
+                continue
+            self._dirs[wd] = dirpath
+
+    def read(self, timeout: float) -> Set[str]:
+        """Đường dẫn đã đổi trong tối đa timeout giây"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                changed.update(self._roots)  # Mất sự kiện: báo cả thư mục gốc
+                continue
+            dirpath = self._dirs.get(wd)
+            if dirpath is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._dirs[wd]  # Thư mục đã bị xóa
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                changed.add(dirpath)
+                continue
+            if not name or _hidden(name):
+                continue
+            path = os.path.join(dirpath, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path)  # Theo dõi thư mục mới (ảnh có thể đã chép vào trước)
+                changed.add(path)
+            elif not mask & IN_CREATE:
+                changed.add(path)  # File mới: chờ IN_CLOSE_WRITE khi chép xong
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingBackend:
+    """Quét (mtime, size) định kỳ rồi so với lần trước"""
+
+    name = 'polling'
+
+    def __init__(self, interval: float = WATCH_POLL_INTERVAL):
+        self.interval = interval
+        self._snapshots: Dict[str, Dict[str, tuple]] = {}
+        self._next = time.monotonic() + interval
+
+    @staticmethod
+    def _snapshot(root: str) -> Dict[str, tuple]:
+        files = {}
+        for dirpath in _walk_dirs(root):
+            try:
+                names = os.listdir(dirpath)
+            except OSError:
+                continue
+            for name in names:
+                if _hidden(name):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if not os.path.isdir(path):
+                    files[path] = (st.st_mtime_ns, st.st_size)
+        return files
+
+    def add_tree(self, root: str):
+        self._snapshots[root] = self._snapshot(root)
+
+    def read(self, timeout: float) -> Set[str]:
+        wait = self._next - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(0.0, wait))
+        self._next = time.monotonic() + self.interval
+
+        changed = set()
+        for root, old in self._snapshots.items():
+            new = self._snapshot(root)
+            changed.update(path for path in old.keys() | new.keys() if old.get(path) != new.get(path))
+            self._snapshots[root] = new
+        return changed
+
+    def close(self):
+        pass
+
+
+class DirectoryWatcher:
+    """Theo dõi nhiều thư mục gốc trong một thread nền, mỗi thư mục một callback(paths)"""
+
+    def __init__(
+        self,
+        debounce: float = WATCH_DEBOUNCE,
+        poll_interval: float = WATCH_POLL_INTERVAL,
+        use_inotify: bool = True
+    ):
+        """
+        Args:
+            debounce: Chờ N giây không có sự kiện mới rồi mới gửi (gom các file chép cùng lúc)
+            poll_interval: Chu kỳ quét khi không dùng được inotify
+            use_inotify: False = luôn quét mtime
+        """
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.backend_name = None
+        self._handlers: Dict[str, Callable[[List[str]], None]] = {}
+        self._new_roots: List[str] = []  # Chưa theo dõi (mới thêm hoặc chưa tồn tại)
+        self._missing_roots: Set[str] = set()  # Gốc không tồn tại lúc thêm
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, root: str, callback: Callable[[List[str]], None]):
+        """
+        Thêm thư mục gốc (gọi trước hoặc sau start; gọi lại cùng thư mục thì bỏ qua).
+        Thư mục chưa tồn tại được theo dõi ngay khi nó xuất hiện.
+        """
+        root = os.path.abspath(root)
+        with self._lock:
+            if root in self._handlers:
+                return
+            self._handlers[root] = callback
+            self._new_roots.append(root)
+
+    def _create_backend(self):
+        if self.use_inotify:
+            try:
+                return InotifyBackend()
+            except (OSError, AttributeError) as e:
+                print(f"Không dùng được inotify ({e}) - chuyển sang quét định kỳ")
+        return PollingBackend(self.poll_interval)
+
+    def start(self) -> threading.Thread:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='fs-watcher', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        backend = self._create_backend()
+        self.backend_name = backend.name
+        pending: Set[str] = set()
+        last_event = 0.0
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    roots, self._new_roots = self._new_roots, []
+                missing = []
+                for root in roots:
+                    if not os.path.isdir(root):
+                        missing.append(root)  # Kiểm tra lại ở vòng sau
+                        continue
+                    backend.add_tree(root)
+                    print(f"Theo dõi thay đổi ({backend.name}): {root}")
+                    if root in self._missing_roots:
+                        # Thư mục tạo sau khi khởi động: file có thể đã chép vào trước khi watch
+                        self._missing_roots.discard(root)
+                        pending.add(root)
+                        last_event = time.monotonic()
+                if missing:
+                    with self._lock:
+                        self._new_roots.extend(missing)
+                    self._missing_roots.update(missing)
+
+                changed = backend.read(min(0.5, self.debounce or 0.5))
+                if changed:
+                    pending |= changed
+                    last_event = time.monotonic()
+                if pending and time.monotonic() - last_event >= self.debounce:
+                    self._dispatch(pending)
+                    pending = set()
+        finally:
+            backend.close()
+
+    def _dispatch(self, paths: Set[str]):
+        with self._lock:
+            handlers = list(self._handlers.items())
+        for root, callback in handlers:
+            group = sorted(p for p in paths if p == root or p.startswith(root + os.sep))
+            if not group:
+                continue
+            try:
+                callback(group)
+            except Exception as e:
+                print(f"Lỗi xử lý thay đổi trong {root}: {e}")
+
+
+# Singleton instance
+_watcher = None
+_watcher_lock = threading.Lock()
+
+def get_directory_watcher() -> DirectoryWatcher:
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = DirectoryWatcher()
+        return _watcher
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Module đọc ảnh an toàn với đường dẫn tiếng Việt
+Đọc bytes bằng numpy rồi decode bằng cv2.imdecode - không cần copy file tạm.
+Ảnh camera lớn (4K) được decode thu nhỏ ngay trong libjpeg (IMREAD_REDUCED_*)
+để chạy detect; bbox được quy đổi về tọa độ ảnh gốc.
+FaceImage đọc file một lần và cấp dần các dạng ảnh (RGB/BGR/xám, vùng watermark,
+mặt đã cắt) cho mọi bước xử lý của cùng một ảnh.
+"""
+
+import os
+import struct
+from typing import Dict, Optional, Tuple, Union
+
+try:
+    import cv2
+    import numpy as np
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+    cv2 = None
+    np = None
+
+try:
+    from src.config import DETECTION_MAX_SIDE
+except ImportError:
+    DETECTION_MAX_SIDE = 1920
+
+WATERMARK_TOP = 0.75  # Watermark ngày giờ nằm trong 25% phía dưới ảnh
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def load_image(image_path: str, flags: Optional[int] = None):
+    """
+    Decode ảnh từ đĩa thành mảng BGR (cv2.imread không đọc được đường dẫn Unicode trên Windows)
+
+    Args:
+        image_path: Đường dẫn ảnh
+        flags: Cờ cv2.IMREAD_* (mặc định IMREAD_COLOR)
+
+    Returns:
+        numpy.ndarray hoặc None nếu không đọc/decode được
+    """
+    if not CV2_AVAILABLE or not os.path.exists(image_path):
+        return None
+
+    if flags is None:
+        flags = cv2.IMREAD_COLOR
+    try:
+        data = np.fromfile(image_path, dtype=np.uint8)
+        if not data.size:
+            return None
+        return cv2.imdecode(data, flags)
+    except Exception as e:
+        print(f"Lỗi đọc ảnh {os.path.basename(image_path)}: {e}")
+        return None
+
+
+def image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Đọc (width, height) từ header JPEG/PNG mà không decode ảnh
+
+    Returns:
+        (width, height) hoặc None nếu không nhận ra định dạng
+    """
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+    if data[:2] != b'\xff\xd8':
+        return None
+    pos = 2
+    while pos + 9 < len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:  # Byte đệm
+            pos += 1
+            continue
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if marker in _SOF_MARKERS:
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    return None
+
+
+def reduction_factor(size: Optional[Tuple[int, int]], max_side: int = DETECTION_MAX_SIDE) -> int:
+    """Hệ số thu nhỏ (1/2/4/8) lớn nhất mà cạnh dài vẫn >= max_side"""
+    if not size or max_side <= 0:
+        return 1
+    factor = 1
+    while factor < 8 and max(size) // (factor * 2) >= max_side:
+        factor *= 2
+    return factor
+
+
+def load_image_reduced(image_path: str, max_side: int = DETECTION_MAX_SIDE) -> Tuple[Optional["np.ndarray"], int]:
+    """
+    Decode ảnh BGR ở độ phân giải giảm để detect khuôn mặt
+
+    JPEG được thu nhỏ ngay khi decode (libjpeg scaled IDCT) - nhanh hơn và tốn ít
+    RAM hơn decode đầy đủ rồi resize. Ảnh không lớn hơn max_side được đọc nguyên.
+
+    Returns:
+        (ảnh hoặc None, hệ số) - tọa độ trên ảnh nhân hệ số = tọa độ ảnh gốc
+    """
+    if not CV2_AVAILABLE or not os.path.exists(image_path):
+        return None, 1
+    try:
+        data = np.fromfile(image_path, dtype=np.uint8)
+        if not data.size:
+            return None, 1
+        return _decode_reduced(data, max_side)
+    except Exception as e:
+        print(f"Lỗi đọc ảnh {os.path.basename(image_path)}: {e}")
+        return None, 1
+
+
+def _reduced_flags(factor: int) -> int:
+    return {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    }[factor]
+
+
+def _decode_reduced(data: "np.ndarray", max_side: int) -> Tuple[Optional["np.ndarray"], int]:
+    factor = reduction_factor(image_size(data[:65536].tobytes()), max_side)
+    return cv2.imdecode(data, _reduced_flags(factor)), factor
+
+
+class FaceImage:
+    """
+    Một ảnh đọc từ đĩa đúng một lần; các dạng ảnh được decode/chuyển đổi khi
+    cần lần đầu rồi giữ lại cho các bước sau (detect, encode, cắt mặt, OCR).
+
+    Dùng trong một thread cho một ảnh - không chia sẻ giữa các thread.
+    """
+
+    def __init__(self, path: str, max_side: int = DETECTION_MAX_SIDE):
+        """
+        Args:
+            path: Đường dẫn ảnh
+            max_side: Ngưỡng decode thu nhỏ cho detect (xem load_image_reduced)
+        """
+        self.path = path
+        self.max_side = max_side
+        self._data = None
+        self._views: Dict[str, "np.ndarray"] = {}
+        self._detection = None
+
+    @classmethod
+    def of(cls, image: Union[str, 'FaceImage']) -> 'FaceImage':
+        """Nhận đường dẫn hoặc FaceImage có sẵn (để hàm nhận được cả hai)"""
+        return image if isinstance(image, FaceImage) else cls(image)
+
+    @property
+    def data(self) -> Optional["np.ndarray"]:
+        """Bytes của file (đọc một lần)"""
+        if self._data is None:
+            if not CV2_AVAILABLE or not os.path.exists(self.path):
+                return None
+            try:
+                self._data = np.fromfile(self.path, dtype=np.uint8)
+            except Exception as e:
+                print(f"Lỗi đọc ảnh {os.path.basename(self.path)}: {e}")
+                return None
+        return self._data if self._data.size else None
+
+    @property
+    def size(self) -> Optional[Tuple[int, int]]:
+        """(width, height) - từ ảnh đã decode hoặc từ header"""
+        if 'bgr' in self._views:
+            height, width = self._views['bgr'].shape[:2]
+            return width, height
+        data = self.data
+        return image_size(data[:65536].tobytes()) if data is not None else None
+
+    def _view(self, name: str, build):
+        if name not in self._views:
+            try:
+                view = build()
+            except Exception as e:
+                print(f"Lỗi decode ảnh {os.path.basename(self.path)}: {e}")
+                view = None
+            if view is None:
+                return None
+            self._views[name] = view
+        return self._views[name]
+
+    @property
+    def bgr(self) -> Optional["np.ndarray"]:
+        """Ảnh BGR độ phân giải đầy đủ"""
+        def build():
+            data = self.data
+            return cv2.imdecode(data, cv2.IMREAD_COLOR) if data is not None else None
+        return self._view('bgr', build)
+
+    @property
+    def rgb(self) -> Optional["np.ndarray"]:
+        def build():
+            bgr = self.bgr
+            return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB) if bgr is not None else None
+        return self._view('rgb', build)
+
+    @property
+    def gray(self) -> Optional["np.ndarray"]:
+        def build():
+            bgr = self.bgr
+            return cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY) if bgr is not None else None
+        return self._view('gray', build)
+
+    def detection_bgr(self) -> Tuple[Optional["np.ndarray"], int]:
+        """
+        Ảnh BGR để detect (ảnh lớn được thu nhỏ) và hệ số quy đổi về ảnh gốc.
+        Nếu ảnh đầy đủ đã decode (vd cho OCR) thì resize từ đó thay vì decode lại.
+        """
+        if self._detection is None:
+            factor = reduction_factor(self.size, self.max_side)
+            full = self._views.get('bgr')
+            if factor == 1:
+                image = self.bgr
+            elif full is not None:
+                height, width = full.shape[:2]
+                image = cv2.resize(
+                    full, (width // factor, height // factor), interpolation=cv2.INTER_AREA
+                )
+            else:
+                data = self.data
+                image = cv2.imdecode(data, _reduced_flags(factor)) if data is not None else None
+            if image is None:
+                return None, 1
+            self._detection = (image, factor)
+        return self._detection
+
+    def detection_rgb(self) -> Tuple[Optional["np.ndarray"], int]:
+        """Như detection_bgr nhưng RGB (face_recognition/dlib)"""
+        image, factor = self.detection_bgr()
+        if image is None:
+            return None, 1
+        rgb = self._view('detection_rgb', lambda: cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        return rgb, factor
+
+    def watermark(self, top: float = WATERMARK_TOP) -> Optional["np.ndarray"]:
+        """Vùng phía dưới ảnh (BGR, độ phân giải đầy đủ) chứa watermark ngày giờ"""
+        bgr = self.bgr
+        if bgr is None:
+            return None
+        return bgr[int(bgr.shape[0] * top):, :]
+
+    def crop(self, face_location, padding: int = 20) -> Optional["np.ndarray"]:
+        """Cắt khuôn mặt (top, right, bottom, left) theo tọa độ ảnh gốc, kèm lề"""
+        bgr = self.bgr
+        if bgr is None:
+            return None
+        top, right, bottom, left = face_location
+        height, width = bgr.shape[:2]
+        return bgr[max(0, top - padding):min(height, bottom + padding),
+                   max(0, left - padding):min(width, right + padding)]
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Module pool process cho inference khuôn mặt
+Mỗi worker là một process riêng giữ model đã nạp (DeepFace / face_recognition),
+nhận việc qua hàng đợi của ProcessPoolExecutor. Worker được thay mới sau
+một số task để giới hạn RAM; worker chết (lỗi native) hoặc treo quá hạn thì pool
+được dựng lại thay vì kéo sập cả Flask server.
+"""
+
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Tuple
+
+try:
+    from src.config import (
+        INFERENCE_WORKERS, INFERENCE_MAX_TASKS_PER_CHILD, INFERENCE_TASK_TIMEOUT
+    )
+except ImportError:
+    INFERENCE_WORKERS = 2
+    INFERENCE_MAX_TASKS_PER_CHILD = 500
+    INFERENCE_TASK_TIMEOUT = 120
+
+_POLL_INTERVAL = 0.5  # Chu kỳ kiểm tra task đã bắt đầu chạy chưa (giây)
+
+
+# ==================== Phía worker (chạy trong process con) ====================
+
+def _init_worker(preload_models: Tuple[str, ...]):
+    """Khởi tạo worker: giới hạn thread của TF và nạp sẵn model"""
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    os.environ.setdefault('OMP_NUM_THREADS', '1')
+    if not preload_models:
+        return
+    try:
+        from src.face_matcher import get_deepface
+        DeepFace = get_deepface()
+        if DeepFace is not None:
+            for model_name in preload_models:
+                DeepFace.build_model(model_name)  # DeepFace giữ model trong process
+    except Exception as e:
+        print(f"[worker {os.getpid()}] Lỗi nạp model: {e}")
+
+
+def _embed_faces_task(
+    image, model_name: str, detector_backend: str, enforce_detection: bool,
+    detection_mode: Optional[str] = None
+):
+    """Task DeepFace: ảnh (đường dẫn hoặc ndarray) -> DetectedFaces hoặc None"""
+    from src.face_matcher import represent_image
+    return represent_image(image, model_name, detector_backend, enforce_detection, detection_mode)
+
+
+def _face_template_task(image_path: str):
+    """Task face_recognition: (encoding, chất lượng) khuôn mặt lớn nhất của ảnh chân dung hoặc None"""
+    from src.face_detector import get_face_template
+    return get_face_template(image_path)
+
+
+def _face_encodings_task(image_path: str):
+    """Task face_recognition: [(face_location, face_encoding)] của mọi khuôn mặt"""
+    from src.face_detector import get_all_face_encodings
+    return get_all_face_encodings(image_path)
+
+
+# ==================== Phía server ====================
+
+class InferencePool:
+    """Pool process inference có giám sát (tự dựng lại khi worker chết)"""
+
+    def __init__(
+        self,
+        workers: int = INFERENCE_WORKERS,
+        max_tasks_per_child: int = INFERENCE_MAX_TASKS_PER_CHILD,
+        preload_models: Tuple[str, ...] = ('ArcFace',)
+    ):
+        """
+        Args:
+            workers: Số process worker
+            max_tasks_per_child: Số task trung bình mỗi worker xử lý trước khi
+                                 pool được thay mới (0 = không thay)
+            preload_models: Model DeepFace nạp sẵn khi worker khởi động
+        """
+        self.workers = max(1, workers)
+        self.max_tasks_per_child = max_tasks_per_child
+        self.preload_models = tuple(preload_models)
+        self._executor = None
+        self._tasks_since_start = 0
+        self._lock = threading.Lock()
+        self.restarts = 0
+        self._last_progress = time.monotonic()  # Lần gần nhất một task bất kỳ của pool xong
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn: an toàn với TF/thread trong server và giống hành vi trên Windows.
+        # Không dùng max_tasks_per_child của stdlib (treo trên một số bản 3.11) -
+        # thay cả pool sau khi đủ số task, task đang chạy trên pool cũ vẫn hoàn tất.
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.preload_models,),
+        )
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            recycle_after = self.max_tasks_per_child * self.workers
+            if (self._executor is not None and recycle_after > 0
+                    and self._tasks_since_start >= recycle_after):
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            if self._executor is None:
+                self._executor = self._create_executor()
+                self._tasks_since_start = 0
+            return self._executor
+
+    def _restart(self, broken: ProcessPoolExecutor, reason: str = "Worker bị dừng đột ngột"):
+        """Dừng hẳn pool hỏng/treo và dựng lại ở lần gửi sau (chỉ một thread làm việc này)"""
+        with self._lock:
+            if self._executor is broken:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                # Worker treo không tự thoát khi shutdown - kết thúc process để giải phóng RAM/CPU
+                for process in list((getattr(broken, '_processes', None) or {}).values()):
+                    if process.is_alive():
+                        process.terminate()
+                self._executor = None
+                self.restarts += 1
+                print(f"[InferencePool] {reason} - dựng lại pool (lần {self.restarts})")
+
+    def map(self, fn: Callable, items: List, *args, timeout: float = INFERENCE_TASK_TIMEOUT,
+            on_result: Optional[Callable[[int, bool, object], None]] = None) -> List[Tuple[bool, object]]:
+        """
+        Chạy fn(item, *args) cho từng item trên các worker
+
+        Args:
+            timeout: Thời gian tối đa cho mỗi task (giây), tính từ lúc task bắt đầu chạy trên
+                     worker - không tính thời gian xếp hàng sau việc của thread khác
+                     (xem _wait: pool chỉ bị dựng lại khi không task nào tiến triển)
+            on_result: Gọi on_result(index, ok, result) ngay khi mỗi item có kết quả cuối
+                       (trên thread gọi map - dùng để báo tiến độ)
+
+        Returns:
+            [(ok, result)] cùng thứ tự với items - ok=False nếu task lỗi
+            (kết quả lỗi không nên ghi cache)
+        """
+        outcomes: List[Tuple[bool, object]] = [(False, None)] * len(items)
+        broken = self._run_batch(fn, items, list(range(len(items))), args, timeout, outcomes, on_result)
+        # Sau khi worker chết/treo: chạy lại từng ảnh một để cô lập ảnh gây lỗi
+        for i in broken:
+            if self._run_batch(fn, items, [i], args, timeout, outcomes, on_result) and on_result is not None:
+                on_result(i, *outcomes[i])  # Ảnh vẫn làm chết worker: báo lỗi
+        return outcomes
+
+    def _run_batch(self, fn, items, indexes, args, timeout, outcomes, on_result=None) -> List[int]:
+        """
+        Gửi các item lên pool, ghi kết quả vào outcomes; trả về item chưa có kết quả
+        do worker chết hoặc lô quá hạn (pool bị thay, các item này cần chạy lại)
+        """
+        executor = self._get_executor()
+        try:
+            futures = [(i, executor.submit(fn, items[i], *args)) for i in indexes]
+        except BrokenProcessPool:
+            self._restart(executor)
+            return indexes
+        with self._lock:
+            self._tasks_since_start += len(futures)
+        for _, future in futures:
+            future.add_done_callback(self._note_progress)
+
+        broken = []
+        timed_out = False
+        for i, future in futures:
+            if timed_out and not future.done():
+                broken.append(i)
+                continue
+            try:
+                outcomes[i] = (True, self._wait(future, timeout))
+            except FutureTimeout as e:
+                outcomes[i] = (False, e)
+                broken.append(i)
+                timed_out = True
+                continue
+            except BrokenProcessPool as e:
+                outcomes[i] = (False, e)
+                broken.append(i)
+                continue
+            except Exception as e:
+                outcomes[i] = (False, e)
+            if on_result is not None:
+                on_result(i, *outcomes[i])
+        if broken:
+            self._restart(executor, "Task inference bị treo" if timed_out else "Worker bị dừng đột ngột")
+        return broken
+
+    def _note_progress(self, _future):
+        self._last_progress = time.monotonic()
+
+    def _wait(self, future, timeout: float):
+        """
+        Kết quả của future; báo FutureTimeout (task treo, cần dựng lại pool) khi task đã được
+        chuyển cho worker quá timeout giây VÀ cả pool không có task nào xong trong timeout giây.
+        Pool dùng chung cho nhiều thread (request Flask, warm-up, watcher) - task xếp hàng
+        sau việc của thread khác không bị tính là treo, worker đang phục vụ thread khác
+        không bị dừng khi pool vẫn chạy.
+        """
+        started = None
+        while True:
+            try:
+                return future.result(timeout=min(_POLL_INTERVAL, timeout))
+            except FutureTimeout:
+                now = time.monotonic()
+                if started is None:
+                    if future.running():
+                        started = now
+                elif now - started >= timeout and now - self._last_progress >= timeout:
+                    raise
+
+    def embed_faces(
+        self,
+        images: List,
+        model_name: str,
+        detector_backend: str,
+        enforce_detection: bool,
+        detection_mode: Optional[str] = None
+    ) -> List[Tuple[bool, object]]:
+        """Embedding mọi khuôn mặt cho nhiều ảnh - [(ok, DetectedFaces | None)]"""
+        return self.map(
+            _embed_faces_task, images, model_name, detector_backend, enforce_detection, detection_mode
+        )
+
+    def face_template_batch(
+        self, image_paths: List[str],
+        on_result: Optional[Callable[[int, bool, object], None]] = None
+    ) -> List[Tuple[bool, object]]:
+        """get_face_template cho nhiều ảnh chân dung - [(ok, (encoding, quality) | None)] cùng thứ tự"""
+        return self.map(_face_template_task, image_paths, on_result=on_result)
+
+    def face_encodings(self, image_path: str) -> list:
+        """get_all_face_encodings chạy trên worker ([] nếu lỗi)"""
+        ok, result = self.map(_face_encodings_task, [image_path])[0]
+        return result if ok else []
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+# Singleton instance
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_inference_pool() -> Optional[InferencePool]:
+    """Pool dùng chung; None nếu tắt (INFERENCE_WORKERS = 0)"""
+    global _pool
+    if INFERENCE_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = InferencePool()
+        return _pool
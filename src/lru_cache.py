@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Module cache LRU giới hạn theo dung lượng (byte)
+Key được chia vào nhiều stripe, mỗi stripe có lock và ngân sách byte riêng -
+các thread đọc/ghi key khác stripe không chặn nhau. Mỗi cache đếm hit/miss/
+eviction/byte để log và API thống kê báo cáo.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List
+
+EVICTION_POLICIES = ('lru', 'fifo')
+
+
+def merge_stats(stats: List[Dict]) -> Dict:
+    """Cộng thống kê của nhiều stripe"""
+    total = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0, 'entries': 0, 'max_bytes': 0}
+    for item in stats:
+        for key in total:
+            total[key] += item.get(key, 0)
+    lookups = total['hits'] + total['misses']
+    total['hit_rate'] = round(total['hits'] / lookups, 3) if lookups else 0.0
+    return total
+
+
+def format_stats(stats: Dict) -> str:
+    """Thống kê cache dạng một dòng log"""
+    return (
+        f"hit {stats['hits']} / miss {stats['misses']} ({stats['hit_rate'] * 100:.0f}%), "
+        f"loại bỏ {stats['evictions']}, {stats['entries']} mục, "
+        f"{stats['bytes'] / 1e6:.1f}/{stats['max_bytes'] / 1e6:.0f} MB"
+    )
+
+
+class LRUCache:
+    """Cache một stripe: OrderedDict theo thứ tự dùng gần nhất + ngân sách byte"""
+
+    def __init__(
+        self,
+        max_bytes: int,
+        sizeof: Callable[[Any], int] = sys.getsizeof,
+        policy: str = 'lru'
+    ):
+        """
+        Args:
+            max_bytes: Tổng dung lượng tối đa (0 = không giới hạn)
+            sizeof: Hàm ước lượng số byte của một giá trị
+            policy: 'lru' (loại mục lâu không dùng) hoặc 'fifo' (loại mục thêm vào sớm nhất)
+        """
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Chính sách loại bỏ không hỗ trợ: {policy}")
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.policy = policy
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()  # {key: (value, bytes)}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            if self.policy == 'lru':
+                self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key: Hashable, value):
+        size = self.sizeof(value)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (value, size)
+            self._bytes += size
+            self._evict()
+
+    def pop(self, key: Hashable, default=None):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None:
+                return default
+            self._bytes -= item[1]
+            return item[0]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def _evict(self):
+        # Luôn giữ mục vừa thêm (kể cả khi một mình nó vượt ngân sách)
+        while self.max_bytes and self._bytes > self.max_bytes and len(self._items) > 1:
+            _, (_, size) = self._items.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'bytes': self._bytes, 'entries': len(self._items), 'max_bytes': self.max_bytes,
+            }
+
+
+class StripedCache:
+    """
+    Chia key vào nhiều stripe theo hash; mỗi stripe là một cache độc lập
+    (LRUCache hoặc cache có cùng giao diện get/put/stats như FaceArena)
+    """
+
+    def __init__(self, factory: Callable[[], Any], stripes: int = 8):
+        """
+        Args:
+            factory: Hàm tạo một stripe (ngân sách byte mỗi stripe = tổng / stripes)
+            stripes: Số stripe
+        """
+        self._stripes = [factory() for _ in range(max(1, stripes))]
+
+    def stripe(self, key: Hashable):
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def __len__(self) -> int:
+        return sum(len(s) for s in self._stripes)
+
+    def get(self, key: Hashable, *args, **kwargs):
+        return self.stripe(key).get(key, *args, **kwargs)
+
+    def put(self, key: Hashable, *args, **kwargs):
+        return self.stripe(key).put(key, *args, **kwargs)
+
+    def pop(self, key: Hashable, *args, **kwargs):
+        return self.stripe(key).pop(key, *args, **kwargs)
+
+    def clear(self):
+        for s in self._stripes:
+            s.clear()
+
+    def stats(self) -> Dict:
+        return merge_stats([s.stats() for s in self._stripes])
+
+
+def striped_lru(
+    max_bytes: int,
+    stripes: int = 8,
+    sizeof: Callable[[Any], int] = sys.getsizeof,
+    policy: str = 'lru'
+) -> StripedCache:
+    """StripedCache gồm các LRUCache chia đều ngân sách max_bytes"""
+    per_stripe = max_bytes // max(1, stripes) if max_bytes else 0
+    return StripedCache(lambda: LRUCache(per_stripe, sizeof, policy), stripes)
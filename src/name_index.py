@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Module chỉ mục tên người (ảnh chân dung)
+Dựng một lần khi quét thư mục: bảng băm theo tên đã chuẩn hóa, inverted index
+theo từ và index trigram ký tự - tra tên cho mỗi người/mỗi dòng thiếu công
+không phải duyệt lại toàn bộ danh sách.
+"""
+
+import re
+import bisect
+import unicodedata
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+GRAM_SIZE = 3
+
+
+def strip_accents(text: str) -> str:
+    """Bỏ dấu tiếng Việt, lowercase, gộp khoảng trắng (giữ nguyên đ)"""
+    text = unicodedata.normalize('NFD', str(text or ''))
+    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+    return re.sub(r'\s+', ' ', text.lower().strip())
+
+
+def name_tokens(text: str) -> List[str]:
+    """Các từ của tên sau khi bỏ dấu"""
+    return strip_accents(text).split()
+
+
+def _grams(text: str) -> set:
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class NameIndex:
+    """
+    Chỉ mục tên giữ thứ tự thêm vào (ordinal) để các chính sách tra cứu cũ
+    ("lấy tên đầu tiên khớp") cho kết quả y hệt phép duyệt tuyến tính.
+    """
+
+    def __init__(
+        self,
+        names: Iterable[str] = (),
+        normalizer: Callable[[str], str] = strip_accents,
+        tokenizer: Callable[[str], List[str]] = name_tokens
+    ):
+        """
+        Args:
+            names: Danh sách tên ban đầu
+            normalizer: Hàm chuẩn hóa tên cho so khớp chính xác/chuỗi con/trigram
+            tokenizer: Hàm tách từ cho so khớp theo từ
+        """
+        self.normalizer = normalizer
+        self.tokenizer = tokenizer
+        self.names: List[str] = []
+        self.normalized: List[str] = []
+        self._exact: Dict[str, List[int]] = {}
+        self._tokens: Dict[str, List[int]] = {}
+        self._grams: Dict[str, List[int]] = {}
+        self._sorted: List[Tuple[str, int]] = []  # (tên chuẩn hóa, ordinal) để tra theo tiền tố
+        self._gram_counts: List[int] = []
+        for name in names:
+            self.add(name)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, name: str) -> int:
+        """Thêm tên, trả về ordinal"""
+        ordinal = len(self.names)
+        key = self.normalizer(name)
+        self.names.append(name)
+        self.normalized.append(key)
+        self._exact.setdefault(key, []).append(ordinal)
+        for token in set(self.tokenizer(name)):
+            self._tokens.setdefault(token, []).append(ordinal)
+        grams = _grams(key)
+        for gram in grams:
+            self._grams.setdefault(gram, []).append(ordinal)
+        self._gram_counts.append(len(grams))
+        bisect.insort(self._sorted, (key, ordinal))
+        return ordinal
+
+    # ------------------------------------------------------------------
+    # Các phép tra cơ bản (trả về ordinal, đã sắp theo thứ tự thêm vào)
+    # ------------------------------------------------------------------
+
+    def exact(self, query: str) -> Optional[str]:
+        """Tên đầu tiên có dạng chuẩn hóa trùng với query"""
+        hits = self._exact.get(self.normalizer(query))
+        return self.names[hits[0]] if hits else None
+
+    def _contained_in(self, key: str) -> set:
+        """Ordinal các tên là chuỗi con của key (tra mọi chuỗi con của key trong bảng băm)"""
+        found = set(self._exact.get('', []))
+        for i in range(len(key)):
+            for j in range(i + 1, len(key) + 1):
+                hits = self._exact.get(key[i:j])
+                if hits:
+                    found.update(hits)
+        return found
+
+    def _containing(self, key: str) -> set:
+        """Ordinal các tên chứa key (lọc bằng trigram hiếm nhất rồi kiểm tra lại)"""
+        if not key:
+            return set(range(len(self.names)))
+        if len(key) < GRAM_SIZE:
+            return {i for i, n in enumerate(self.normalized) if key in n}
+        postings = [self._grams.get(g) for g in _grams(key)]
+        if not all(postings):
+            return set()
+        rarest = min(postings, key=len)
+        return {i for i in rarest if key in self.normalized[i]}
+
+    def substring_matches(self, query: str) -> List[int]:
+        """Ordinal các tên chứa query hoặc nằm trong query"""
+        key = self.normalizer(query)
+        return sorted(self._contained_in(key) | self._containing(key))
+
+    def with_prefix(self, prefix: str) -> List[int]:
+        """Ordinal các tên (đã chuẩn hóa) bắt đầu bằng prefix"""
+        start = bisect.bisect_left(self._sorted, (prefix, -1))
+        found = []
+        for key, ordinal in self._sorted[start:]:
+            if not key.startswith(prefix):
+                break
+            found.append(ordinal)
+        return sorted(found)
+
+    def best_token_overlap(self, query: str) -> Tuple[Optional[str], int]:
+        """
+        Tên có nhiều từ trùng với query nhất (bằng nhau thì lấy tên thêm vào trước)
+
+        Returns:
+            (tên, số từ trùng)
+        """
+        counts: Dict[int, int] = {}
+        for token in set(self.tokenizer(query)):
+            for ordinal in self._tokens.get(token, []):
+                counts[ordinal] = counts.get(ordinal, 0) + 1
+        if not counts:
+            return None, 0
+        ordinal = min(counts, key=lambda i: (-counts[i], i))
+        return self.names[ordinal], counts[ordinal]
+
+    def candidates(self, query: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """
+        Gợi ý tên gần giống nhất theo trigram (hệ số Dice)
+
+        Returns:
+            [(tên, điểm 0..1)] giảm dần theo điểm
+        """
+        key = self.normalizer(query)
+        query_grams = _grams(key)
+        if not query_grams:
+            ordinals = self._containing(key) | self._contained_in(key)
+            return [(self.names[i], 1.0 if self.normalized[i] == key else 0.5)
+                    for i in sorted(ordinals)][:limit]
+
+        shared: Dict[int, int] = {}
+        for gram in query_grams:
+            for ordinal in self._grams.get(gram, []):
+                shared[ordinal] = shared.get(ordinal, 0) + 1
+        scored = []
+        for ordinal, common in shared.items():
+            total = len(query_grams) + self._gram_counts[ordinal]
+            scored.append((2.0 * common / total, ordinal))
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [(self.names[i], round(score, 3)) for score, i in scored[:limit]]
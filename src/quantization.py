@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Module nén embedding khuôn mặt
+float16 (2x nhỏ hơn) hoặc int8 + một hệ số scale mỗi vector (4x nhỏ hơn).
+Khoảng cách được tính trực tiếp trên mã nén theo từng khối dòng - không cần
+giải nén cả ma trận về float32.
+"""
+
+from typing import Optional, Sequence, Union
+import numpy as np
+
+EMBEDDING_DTYPES = ('float32', 'float16', 'int8')
+INT8_MAX = 127.0
+BLOCK_ROWS = 4096  # Số dòng upcast về float32 mỗi lần khi tính tích vô hướng
+
+
+class QuantizedMatrix:
+    """Ma trận embedding đã nén: codes (n, dim) float16/int8 + scale mỗi dòng (chỉ int8)"""
+
+    __slots__ = ('codes', 'scales')
+
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def from_float(cls, vectors, dtype: str) -> 'QuantizedMatrix':
+        mat = np.asarray(vectors, dtype=np.float32)
+        if mat.ndim == 1:
+            mat = mat[None, :]
+        if dtype == 'float16':
+            return cls(np.ascontiguousarray(mat, dtype=np.float16))
+        if dtype == 'int8':
+            scales = np.abs(mat).max(axis=1) / INT8_MAX
+            scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+            codes = np.clip(np.rint(mat / scales[:, None]), -INT8_MAX, INT8_MAX).astype(np.int8)
+            return cls(codes, scales)
+        raise ValueError(f"Kiểu nén không hỗ trợ: {dtype}")
+
+    @property
+    def dtype(self) -> str:
+        return str(self.codes.dtype)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def take(self, rows: np.ndarray) -> 'QuantizedMatrix':
+        """Các dòng theo chỉ số (vẫn ở dạng nén)"""
+        return QuantizedMatrix(
+            self.codes[rows], self.scales[rows] if self.scales is not None else None
+        )
+
+    def _block(self, start: int, end: int) -> np.ndarray:
+        block = self.codes[start:end].astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:end, None]
+        return block
+
+    def to_float(self) -> np.ndarray:
+        """Giải nén về float32 (n, dim)"""
+        return self._block(0, len(self))
+
+    def dot(self, matrix: np.ndarray) -> np.ndarray:
+        """Tích vô hướng (n, m) với ma trận float32 (m, dim), tính theo khối dòng"""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        out = np.empty((len(self), len(matrix)), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, len(self))
+            codes = self.codes[start:end].astype(np.float32)
+            out[start:end] = codes @ matrix.T
+            if self.scales is not None:
+                out[start:end] *= self.scales[start:end, None]
+        return out
+
+    def sq_norms(self) -> np.ndarray:
+        """Bình phương chuẩn L2 của từng vector (n,)"""
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, len(self))
+            codes = self.codes[start:end].astype(np.float32)
+            out[start:end] = np.einsum('ij,ij->i', codes, codes)
+        if self.scales is not None:
+            out *= self.scales * self.scales
+        return out
+
+
+Embeddings = Union[np.ndarray, QuantizedMatrix]
+
+
+def quantize(vectors: Embeddings, dtype: str) -> Embeddings:
+    """Nén embedding về dtype (float32 = giữ nguyên dạng ndarray)"""
+    if isinstance(vectors, QuantizedMatrix):
+        if vectors.dtype == dtype:
+            return vectors
+        vectors = vectors.to_float()
+    if dtype == 'float32':
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    return QuantizedMatrix.from_float(vectors, dtype)
+
+
+def as_float(vectors: Embeddings) -> np.ndarray:
+    """Embedding dạng float32 (giải nén nếu cần)"""
+    if isinstance(vectors, QuantizedMatrix):
+        return vectors.to_float()
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def stack_embeddings(blocks: Sequence[Embeddings]) -> Embeddings:
+    """
+    Ghép embedding của nhiều ảnh thành một ma trận; giữ dạng nén nếu mọi khối
+    cùng kiểu nén, ngược lại giải nén về float32
+    """
+    if not blocks:
+        return np.zeros((0, 0), dtype=np.float32)
+    first = blocks[0]
+    if isinstance(first, QuantizedMatrix) and all(
+            isinstance(b, QuantizedMatrix) and b.dtype == first.dtype for b in blocks):
+        codes = np.concatenate([b.codes for b in blocks])
+        scales = np.concatenate([b.scales for b in blocks]) if first.scales is not None else None
+        return QuantizedMatrix(codes, scales)
+    return np.ascontiguousarray(np.vstack([as_float(b) for b in blocks]))
@@ -7,6 +7,8 @@ Sử dụng OCR để đọc watermark (tùy chọn)
 import re
 from datetime import datetime
 
+from src.image_io import FaceImage
+
 # Import cv2 với xử lý lỗi
 try:
     import cv2
@@ -144,7 +146,7 @@ def extract_location(text):
 
 def extract_datetime_and_location(image_path):
     """
-    Trích xuất ngày tháng và địa điểm từ ảnh
+    Trích xuất ngày tháng và địa điểm từ ảnh (đường dẫn hoặc FaceImage)
     
     Returns:
         dict: {
@@ -163,13 +165,10 @@ def extract_datetime_and_location(image_path):
         return result
     
     try:
-        # Đọc ảnh
-        image = cv2.imread(image_path)
-        if image is None:
-            return result
-        
         # Cắt vùng chứa watermark
-        cropped = extract_text_region(image, 'bottom')
+        cropped = FaceImage.of(image_path).watermark(0.7)
+        if cropped is None:
+            return result
         
         # Tiền xử lý
         processed = preprocess_image_for_ocr(cropped)
@@ -194,7 +193,7 @@ def extract_datetime_and_location(image_path):
 
 def extract_datetime_simple(image_path):
     """
-    Phương pháp đơn giản hơn - đọc trực tiếp từ ảnh gốc
+    Phương pháp đơn giản hơn - đọc trực tiếp từ ảnh gốc (đường dẫn hoặc FaceImage)
     """
     result = {
         'datetime': None,
@@ -206,15 +205,10 @@ def extract_datetime_simple(image_path):
         return result
         
     try:
-        image = cv2.imread(image_path)
-        if image is None:
+        # Lấy vùng phía dưới (thường có timestamp)
+        cropped = FaceImage.of(image_path).watermark()
+        if cropped is None:
             return result
-            
-        height, width = image.shape[:2]
-        
-        # Lấy vùng góc dưới phải (thường có timestamp)
-        y_start = int(height * 0.75)
-        cropped = image[y_start:height, :]
         
         # Chuyển sang RGB cho PIL
         rgb = cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Module detect khuôn mặt theo ô (tile) cho ảnh độ phân giải rất cao
+Ảnh được chia thành các ô chồng lấn, detect song song từng ô ở độ phân giải
+gốc (không mất mặt nhỏ ở xa cổng), rồi gộp bbox trùng nhau bằng NMS.
+Chế độ detect chọn theo nguồn camera (DETECTION_MODES trong config).
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from src.config import (
+        DETECTION_MODE_DEFAULT, DETECTION_MODES, TILE_SIZE, TILE_OVERLAP, TILE_WORKERS, TILE_NMS_IOU
+    )
+except ImportError:
+    DETECTION_MODE_DEFAULT = "reduced"
+    DETECTION_MODES = {}
+    TILE_SIZE = 1280
+    TILE_OVERLAP = 160
+    TILE_WORKERS = min(4, os.cpu_count() or 1)
+    TILE_NMS_IOU = 0.4
+
+# reduced: decode thu nhỏ ảnh lớn (nhanh); tiled: chia ô ở độ phân giải gốc (giữ mặt nhỏ)
+DETECTION_MODE_CHOICES = ('reduced', 'tiled')
+
+Box = Tuple[float, float, float, float]  # (x, y, w, h)
+
+
+def detection_mode_for(image, default: Optional[str] = None) -> str:
+    """
+    Chế độ detect cho một ảnh theo nguồn camera
+
+    DETECTION_MODES: {tên thư mục camera hoặc tiền tố đường dẫn: 'reduced'|'tiled'};
+    ảnh không phải đường dẫn (đã decode) dùng chế độ mặc định.
+    """
+    default = default or DETECTION_MODE_DEFAULT
+    path = getattr(image, 'path', image)
+    if not isinstance(path, str) or not DETECTION_MODES:
+        return default
+    norm = os.path.normcase(os.path.abspath(path))
+    parts = set(os.path.normcase(path).replace('\\', '/').split('/'))
+    for source, mode in DETECTION_MODES.items():
+        key = os.path.normcase(source)
+        if key in parts or norm.startswith(os.path.normcase(os.path.abspath(source)) + os.sep):
+            return mode
+    return default
+
+
+def tile_grid(width: int, height: int, tile: int = TILE_SIZE, overlap: int = TILE_OVERLAP) -> List[Box]:
+    """
+    Các ô (x, y, w, h) phủ kín ảnh, hai ô kề nhau chồng lấn overlap pixel
+    (mặt nằm trên đường cắt vẫn trọn trong ít nhất một ô nếu nhỏ hơn overlap)
+    """
+    def starts(length: int) -> List[int]:
+        if length <= tile:
+            return [0]
+        step = max(1, tile - overlap)
+        result = list(range(0, length - tile, step))
+        result.append(length - tile)  # Ô cuối sát mép ảnh
+        return result
+
+    return [
+        (x, y, min(tile, width - x), min(tile, height - y))
+        for y in starts(height) for x in starts(width)
+    ]
+
+
+def nms(boxes: Sequence[Box], scores: Sequence[float], iou_threshold: float = TILE_NMS_IOU) -> List[int]:
+    """
+    Non-maximum suppression: giữ bbox điểm cao nhất trong mỗi nhóm chồng nhau.
+    Ngoài IoU, bbox nằm gần trọn trong bbox đã giữ (mặt bị ô cắt ngang) cũng bị loại.
+
+    Returns:
+        Chỉ số các bbox được giữ, theo điểm giảm dần
+    """
+    if not len(boxes):
+        return []
+    b = np.asarray(boxes, dtype=np.float64)
+    x1, y1 = b[:, 0], b[:, 1]
+    x2, y2 = x1 + b[:, 2], y1 + b[:, 3]
+    areas = np.maximum(b[:, 2], 0) * np.maximum(b[:, 3], 0)
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='stable')
+
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(int(i))
+        rest = order[1:]
+        inter = (
+            np.maximum(0.0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+            * np.maximum(0.0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        )
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        contained = inter / np.maximum(areas[rest], 1e-9)
+        order = rest[(iou <= iou_threshold) & (contained <= 0.8)]
+    return keep
+
+
+def should_tile(width: int, height: int, tile: int = TILE_SIZE) -> bool:
+    """Chỉ chia ô khi ảnh lớn hơn hẳn một ô"""
+    return max(width, height) > tile * 1.5
+
+
+def detect_tiled(
+    image: np.ndarray,
+    detect: Callable[[np.ndarray], List[Tuple[Box, float, object]]],
+    tile: int = TILE_SIZE,
+    overlap: int = TILE_OVERLAP,
+    workers: int = TILE_WORKERS,
+    iou_threshold: float = TILE_NMS_IOU
+) -> List[Tuple[Box, float, object]]:
+    """
+    Detect trên từng ô song song rồi gộp bằng NMS
+
+    Args:
+        image: Ảnh đầy đủ (H, W, C)
+        detect: Hàm detect một ô -> [(bbox (x, y, w, h) trong ô, điểm, dữ liệu kèm)]
+                (chạy trên nhiều thread cùng lúc)
+        tile, overlap: Kích thước ô và độ chồng lấn (pixel)
+        workers: Số thread detect
+        iou_threshold: Ngưỡng IoU của NMS
+
+    Returns:
+        [(bbox theo tọa độ ảnh đầy đủ, điểm, dữ liệu kèm)]; ô lỗi được bỏ qua
+    """
+    height, width = image.shape[:2]
+    grid = tile_grid(width, height, tile, overlap)
+
+    def run(cell: Box):
+        x, y, w, h = cell
+        try:
+            found = detect(np.ascontiguousarray(image[y:y + h, x:x + w]))
+        except Exception as e:
+            print(f"Lỗi detect ô ({x}, {y}): {e}")
+            return []
+        return [((bx + x, by + y, bw, bh), score, extra) for (bx, by, bw, bh), score, extra in found]
+
+    if workers > 1 and len(grid) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(grid))) as executor:
+            per_tile = list(executor.map(run, grid))
+    else:
+        per_tile = [run(cell) for cell in grid]
+
+    found = [item for items in per_tile for item in items]
+    keep = nms([box for box, _, _ in found], [score for _, score, _ in found], iou_threshold)
+    return [found[i] for i in keep]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Module khởi động nóng (warm-up) khi server start
+Nạp DeepFace/model trong thread nền, chạy thử một lần và tạo sẵn embedding
+cho toàn bộ ảnh chân dung để request phân tích đầu tiên không bị treo.
+"""
+
+import time
+import threading
+from typing import Callable, Dict, Optional
+
+STAGES = {
+    'idle': 'Chưa khởi động',
+    'models': 'Đang nạp model nhận diện',
+    'inference': 'Đang chạy thử model',
+    'portraits': 'Đang tạo embedding ảnh chân dung',
+    'ready': 'Sẵn sàng',
+    'failed': 'Lỗi khởi động',
+}
+
+
+class WarmupManager:
+    """Chạy warm-up một lần trong thread nền và lưu tiến độ cho API"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._state = {
+            'stage': 'idle',
+            'done': 0,
+            'total': 0,
+            'message': '',
+            'error': None,
+            'start_time': None,
+            'end_time': None,
+        }
+
+    def _update(self, **kwargs):
+        with self._lock:
+            self._state.update(kwargs)
+
+    @property
+    def is_ready(self) -> bool:
+        return self._state['stage'] == 'ready'
+
+    def get_status(self) -> Dict:
+        """Trạng thái hiện tại (dùng cho /api/warmup/status)"""
+        with self._lock:
+            state = dict(self._state)
+        state['label'] = STAGES.get(state['stage'], state['stage'])
+        state['ready'] = state['stage'] == 'ready'
+        state['running'] = state['stage'] in ('models', 'inference', 'portraits')
+        state['percent'] = round(100 * state['done'] / state['total'], 1) if state['total'] else 0
+        if state['start_time']:
+            end = state['end_time'] or time.time()
+            state['elapsed_seconds'] = round(end - state['start_time'], 1)
+        return state
+
+    def start(self, matcher_factory: Callable, log_callback=None) -> bool:
+        """
+        Bắt đầu warm-up nền (gọi lại khi đang chạy/đã xong sẽ bỏ qua)
+
+        Args:
+            matcher_factory: Hàm trả về FaceMatcher dùng chung (vd get_face_matcher)
+            log_callback: Hàm callback(message, log_type) để gửi log
+
+        Returns:
+            True nếu vừa khởi động thread mới
+        """
+        with self._lock:
+            if self._thread is not None and self._state['stage'] != 'failed':
+                return False
+            self._state.update(stage='models', done=0, total=0, message='',
+                               error=None, start_time=time.time(), end_time=None)
+            self._thread = threading.Thread(
+                target=self._run, args=(matcher_factory, log_callback), daemon=True
+            )
+        self._thread.start()
+        return True
+
+    def _run(self, matcher_factory: Callable, log_callback=None):
+        log = log_callback or (lambda message, log_type='default': print(message))
+        try:
+            log("⏳ Warm-up: đang nạp model nhận diện...", "info")
+            matcher = matcher_factory()
+            if matcher is None:
+                raise RuntimeError("Không khởi tạo được FaceMatcher")
+
+            self._update(stage='inference')
+            matcher.warm_up_models()
+
+            names = list(matcher.portrait_cache.keys())
+            self._update(stage='portraits', total=len(names))
+            log(f"⏳ Warm-up: tạo embedding cho {len(names)} người...", "info")
+            ready_count = 0
+            for i, name in enumerate(names):
+                self._update(message=name)
+                try:
+                    if matcher._ensure_templates(name):
+                        ready_count += 1
+                except Exception as e:
+                    print(f"Warm-up lỗi chân dung {name}: {e}")
+                self._update(done=i + 1)
+            matcher.flush_store()
+
+            self._update(stage='ready', message=f"{ready_count}/{len(names)} người có embedding",
+                         end_time=time.time())
+            log(f"✅ Warm-up xong: {ready_count}/{len(names)} người sẵn sàng", "success")
+        except Exception as e:
+            self._update(stage='failed', error=str(e), end_time=time.time())
+            log(f"❌ Warm-up lỗi: {e}", "error")
+
+
+# Singleton instance
+_warmup_manager: Optional[WarmupManager] = None
+
+def get_warmup_manager() -> WarmupManager:
+    global _warmup_manager
+    if _warmup_manager is None:
+        _warmup_manager = WarmupManager()
+    return _warmup_manager
@@ -13,6 +13,9 @@ from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.table import WD_TABLE_ALIGNMENT
 from typing import List, Dict, Optional
 
+from src.name_index import NameIndex
+from src.artifact_cache import get_artifact_cache
+
 
 class WordExporter:
     """Xuất file Word giải trình theo mẫu có sẵn, với ảnh chân dung"""
@@ -21,6 +24,7 @@ class WordExporter:
         self.portrait_dir = portrait_dir  # Thư mục Ảnh BV (có subfolder theo tên)
         self.output_dir = output_dir
         self.portrait_cache = {}  # Cache mapping tên -> danh sách ảnh
+        self.name_index = NameIndex()  # Chỉ mục trên các key của portrait_cache
         self._scan_portraits()
     
     def _scan_portraits(self):
@@ -56,6 +60,11 @@ class WordExporter:
                         self.portrait_cache[normalized_name] = []
                     self.portrait_cache[normalized_name].append(item_path)
         
+        self.name_index = NameIndex(
+            self.portrait_cache.keys(),
+            normalizer=self._normalize_name,
+            tokenizer=lambda name: self._normalize_name(name).split()
+        )
         print(f"Đã tìm thấy ảnh của {len(self.portrait_cache)} người")
     
     def _normalize_name(self, name: str) -> str:
@@ -77,24 +86,15 @@ class WordExporter:
             return self.portrait_cache[normalized_search]
         
         # Fuzzy match - tìm tên chứa hoặc được chứa
-        for cached_name, images in self.portrait_cache.items():
-            if normalized_search in cached_name or cached_name in normalized_search:
-                return images
+        hits = self.name_index.substring_matches(normalized_search)
+        if hits:
+            return self.portrait_cache[self.name_index.names[hits[0]]]
         
         # So sánh từng từ
-        search_words = set(normalized_search.split())
-        best_match = None
-        best_score = 0
-        
-        for cached_name, images in self.portrait_cache.items():
-            cached_words = set(cached_name.split())
-            common = len(search_words & cached_words)
-            if common > best_score:
-                best_score = common
-                best_match = images
+        best_name, best_score = self.name_index.best_token_overlap(normalized_search)
         
         if best_score >= 2:  # Ít nhất 2 từ trùng
-            return best_match
+            return self.portrait_cache[best_name]
         
         return None
     
@@ -176,7 +176,7 @@ class WordExporter:
                     # Chèn ảnh đầu tiên
                     paragraph = cells[3].paragraphs[0]
                     run = paragraph.add_run()
-                    run.add_picture(portraits[0], width=Cm(4))
+                    run.add_picture(get_artifact_cache().display_image(portraits[0]), width=Cm(4))
                 except Exception as e:
                     cells[3].text = f"[Lỗi ảnh: {str(e)[:30]}]"
             else:
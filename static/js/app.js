@@ -160,7 +160,9 @@ function displayResults(records) {
             <td>${record.weekday}</td>
             <td>${record.issue_description}</td>
             <td>${record.matched_image
-            ? `<img src="/matched-image/${encodeURIComponent(record.matched_image)}" 
+            ? `<img src="${record.matched_face
+                ? `/artifact/${encodeURIComponent(record.matched_face)}`
+                : `/matched-image/${encodeURIComponent(record.matched_image)}`}" 
                        alt="Matched" style="width:60px;height:60px;object-fit:cover;border-radius:4px;" 
                        onerror="this.style.display='none';this.nextSibling.style.display='block'">
                    <span style="display:none;color:#999;">KhÃ´ng cÃ³</span>`
@@ -880,3 +882,41 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 });
 
+// ==================== Model Warm-up ====================
+
+async function checkWarmupStatus() {
+    const badge = document.getElementById('warmup-badge');
+    if (!badge) return;
+
+    try {
+        const status = await apiGet('/api/warmup/status');
+        badge.classList.remove('ready', 'failed');
+        badge.onclick = null;
+
+        if (status.ready) {
+            badge.classList.add('ready');
+            badge.textContent = `✅ Model sẵn sàng (${status.elapsed_seconds || 0}s)`;
+            return;
+        }
+        if (status.stage === 'failed') {
+            badge.classList.add('failed');
+            badge.textContent = '❌ Lỗi khởi động model - bấm để thử lại';
+            badge.title = status.error || '';
+            badge.onclick = async () => {
+                await apiPost('/api/warmup/start');
+                checkWarmupStatus();
+            };
+            return;
+        }
+        if (status.stage === 'portraits' && status.total) {
+            badge.textContent = `⏳ ${status.label}: ${status.done}/${status.total} (${status.percent}%)`;
+        } else {
+            badge.textContent = `⏳ ${status.label}...`;
+        }
+    } catch (error) {
+        console.error('Lỗi lấy trạng thái warm-up:', error);
+    }
+    setTimeout(checkWarmupStatus, 2000);
+}
+
+document.addEventListener('DOMContentLoaded', checkWarmupStatus);
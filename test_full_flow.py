@@ -107,22 +107,23 @@ if missing and matcher:
                 print("  Thử debug thêm với threshold cao hơn...")
                 
                 # Debug: try manual match
-                from src.face_matcher import get_deepface, copy_to_ascii_path
+                from src.face_matcher import get_deepface
+                from src.image_io import load_image
                 DeepFace = get_deepface()
                 if DeepFace:
                     portrait = portraits[0]
                     print(f"  Test thủ công với portrait: {os.path.basename(portrait)}")
-                    p_ascii = copy_to_ascii_path(portrait)
+                    p_img = load_image(portrait)
                     
                     best_dist = float('inf')
                     best_img = None
                     
                     for img in images[:10]:  # Test 10 ảnh đầu
                         try:
-                            c_ascii = copy_to_ascii_path(img)
+                            c_img = load_image(img)
                             result = DeepFace.verify(
-                                img1_path=p_ascii,
-                                img2_path=c_ascii,
+                                img1_path=p_img,
+                                img2_path=c_img,
                                 model_name="VGG-Face",
                                 enforce_detection=False
                             )